@@ -31,6 +31,7 @@ from . import (  # noqa
         loadbalancer,
         logging,
         rightscale,
+        scheduler,
         )
 
 #: The stack name.  Its value is used to tag servers and other cloud resources.
@@ -73,6 +74,10 @@ LOGGING = 'logging'
 #: A dict containing ansible tuning variables.
 ANSIBLE = 'ansible'
 
+#: A dict containing options that control how the deployers are run.  See
+#: :mod:`bang.attributes.scheduler`.
+SCHEDULER = 'scheduler'
+
 #: Like chicken fried chicken... this is a way to configure the name of the tag
 #: in which the combined stack-role (a.k.a. *name*) will be stored.  By
 #: default, unless this is specified directly in ~/.bangrc, the *name* value
@@ -0,0 +1,111 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+
+#: How to order the deployers.  Either ``graph`` (the default) to start each
+#: deployer as soon as the resources it refers to are deployed, or ``stages``
+#: to wait for every deployer in the previous stage as defined in
+#: :data:`bang.resources.STAGES`.
+MODE = 'mode'
+
+MODE_GRAPH = 'graph'
+MODE_STAGES = 'stages'
+
+#: How to run each deployer.  One of ``process`` (the default: a fresh
+#: process for every deployer), ``pool`` (a reusable pool of pre-forked
+#: processes), ``thread`` (a pool of threads) or ``inline`` (one at a time in
+#: the main process, for debugging).  See :mod:`bang.executors`.
+EXECUTOR = 'executor'
+
+#: The number of workers in the ``pool`` and ``thread`` executors.
+WORKERS = 'workers'
+
+#: The maximum number of deployers to run at once.  Also used within
+#: :attr:`PROVIDER_LIMITS` to limit deployers per provider and per region.
+MAX_PARALLEL = 'max_parallel'
+
+#: A dict of limits per provider.  Each key is a provider name (as used in the
+#: ``provider`` attribute of resource stanzas), and each value can contain
+#: :attr:`MAX_PARALLEL`, :attr:`REQUESTS_PER_S`, and :attr:`REGIONS`.  See
+#: :mod:`bang.throttle`.
+PROVIDER_LIMITS = 'provider_limits'
+
+#: The maximum number of API requests per second to send to a provider (or
+#: to a region).
+REQUESTS_PER_S = 'requests_per_s'
+
+#: A dict of per-region limits within a provider's :attr:`PROVIDER_LIMITS`.
+REGIONS = 'regions'
+
+#: If true, the first deployer failure immediately cancels all of the other
+#: running deployers instead of waiting for them to finish.
+FAIL_FAST = 'fail_fast'
+
+#: The directory in which to keep deploy journals.  Defaults to
+#: ``~/.bang/journal``.  Set to an empty string to disable journaling.  See
+#: :mod:`bang.journal`.
+JOURNAL_DIR = 'journal_dir'
+
+#: If false, any journal left by an earlier, failed deploy is discarded and
+#: every deployer runs from the start.  Defaults to true.
+RESUME = 'resume'
+
+#: The file in which to keep the durations of past deployers.  Defaults to
+#: ``~/.bang/durations.json``.  Set to an empty string to disable.  See
+#: :mod:`bang.history`.
+HISTORY_FILE = 'history_file'
+
+#: The directory in which to keep the state of the last successful deploy of
+#: each stack, for incremental deploys.  Defaults to ``~/.bang/state``.  Set
+#: to an empty string to disable.  See :mod:`bang.incremental`.
+STATE_DIR = 'state_dir'
+
+#: If true, ``bang`` configures the servers in each server class as soon as
+#: all of the deployers for that class have completed, while the rest of the
+#: stack is still being deployed.  See :mod:`bang.pipeline`.
+PIPELINE = 'pipeline'
+
+#: The wall-clock budget for each deployer, in seconds.  A deployer that runs
+#: longer is stopped (after logging the phase and stack it is stuck in) and
+#: counts as failed.  Can also be set in any resource config stanza to apply
+#: to just the deployers for that resource.  Not enforced with the ``inline``
+#: executor.
+DEPLOYER_TIMEOUT = 'deployer_timeout_s'
+
+#: The wall-clock budget for each stage, in seconds, from the start of the
+#: stage's first deployer.  See :data:`bang.resources.STAGES`.  When it runs
+#: out, the stage's running deployers are stopped and the rest of the stage
+#: is not started.
+STAGE_TIMEOUT = 'stage_timeout_s'
+
+#: The directory in which to keep the live status file of each stack's
+#: deploys.  Defaults to ``~/.bang/status``.  Set to an empty string to
+#: disable.  See :mod:`bang.status`.
+STATUS_DIR = 'status_dir'
+
+#: How to retry deployer phases that fail with a transient provider error.
+#: A dict with :attr:`ATTEMPTS` and :attr:`BACKOFF`, plus optional dicts of
+#: the same keys for individual phases, keyed by phase name (e.g.
+#: ``create``).  See :mod:`bang.retry`.
+RETRIES = 'retries'
+
+#: The number of times to attempt a phase.  Set it to ``1`` to turn retries
+#: off.  Defaults to 3.
+ATTEMPTS = 'attempts'
+
+#: The delay before the first retry of a phase, in seconds.  Each further
+#: retry waits twice as long.  Defaults to 2.
+BACKOFF = 'backoff_s'
@@ -25,3 +25,4 @@ SOURCE = 'source'
 SOURCE_SELF = 'source_self'
 SOURCE_STACK = 'source_stack'
 TARGET = 'target'
+LOAD_BALANCER = 'load_balancer'
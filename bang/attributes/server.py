@@ -22,6 +22,7 @@ EXTRA_SECGROUPS = 'extra_security_groups'
 TAGS = 'tags'
 NAME = 'name'
 ID = 'id'
+IMAGE_ID = 'disk_image_id'
 SCOPES = 'config_scopes'
 VARS = 'hostvars'
 GROUPS = 'groups'
@@ -32,6 +33,38 @@ POST_DELAY = 'post_launch_delay_s'
 SSH_KEY = 'ssh_key_name'
 PROVIDER = 'provider'
 
+#: A dict that turns on rolling replacement for a server class.  Running
+#: servers whose disk image differs from the ``disk_image_id`` in the config
+#: are replaced in batches.  See
+#: :class:`~bang.deployers.cloud.RollingServerDeployer`.  E.g.:
+#:
+#: .. code-block:: yaml
+#:
+#:     servers:
+#:       web:
+#:         disk_image_id: ami-8e3f2bb7
+#:         instance_count: 40
+#:         rolling:
+#:           batch_size: 5
+#:           max_in_flight: 10
+#:
+ROLLING = 'rolling'
+
+#: The number of replacements to launch with each request.  Defaults to 1.
+ROLLING_BATCH_SIZE = 'batch_size'
+
+#: The maximum number of servers being replaced at once.  Rounded down to a
+#: multiple of the batch size.  Defaults to the batch size.
+ROLLING_MAX_IN_FLIGHT = 'max_in_flight'
+
+#: Whether to run the playbooks on each batch of replacements before they
+#: take over from the old servers.  Defaults to ``true``.
+ROLLING_CONFIGURE = 'configure'
+
+#: The playbooks that configure the servers in this server class, instead of
+#: the stack-wide ``playbooks``.  They run only on the servers in this class.
+PLAYBOOKS = 'playbooks'
+
 # these are ansible magic vars
 INV_NAME = 'inventory_hostname'
 INV_NAME_SHORT = 'inventory_hostname_short'
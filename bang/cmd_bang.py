@@ -22,8 +22,10 @@ import sys
 from textwrap import dedent
 from bang import attributes as A
 from bang.annoy import annoy
-from bang.stack import Stack
+from bang.stack import Stack, deploy_stacks
 from bang.config import Config
+from bang.executors import EXECUTORS
+from bang.trace import start_tracing, stop_tracing
 from bang.util import get_argparser, initialize_logging
 
 
@@ -56,6 +58,28 @@ def set_ssh_creds(config, args):
     config[A.DEPLOYER_CREDS] = creds
 
 
+def set_scheduler_options(config, args):
+    """
+    Set scheduler options into config.
+
+    As with :func:`set_ssh_creds`, command-line arguments win over any values
+    from ~/.bangrc or the stack config.
+
+    """
+    sched = config.get(A.SCHEDULER, {})
+    if args.executor:
+        sched[A.scheduler.EXECUTOR] = args.executor
+    if args.workers:
+        sched[A.scheduler.WORKERS] = args.workers
+    if args.fail_fast:
+        sched[A.scheduler.FAIL_FAST] = True
+    if not args.resume:
+        sched[A.scheduler.RESUME] = False
+    if args.pipeline:
+        sched[A.scheduler.PIPELINE] = True
+    config[A.SCHEDULER] = sched
+
+
 # note: this is its own function to allow documentation via sphinx-argparse
 def get_parser():
     return get_argparser({
@@ -136,6 +160,16 @@ def get_parser():
                         """),
                 'dest': 'ansible_list',
                 }),
+            ('--status', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Show the state of each deployer in the running (or
+                        the last) deploy of the stack, then quit.  For a live
+                        view, use e.g. ``watch bang --status mystack``, or
+                        tail the status file in ``~/.bang/status/``.
+
+                        """),
+                }),
             ('--no-configure', {
                 'action': 'store_false',
                 'dest': 'configure',
@@ -191,6 +225,89 @@ def get_parser():
                                     -p restart_apache.yml \\
                                     -p stop_maintenance_window.yml
 
+                        """),
+                }),
+            ('--executor', {
+                'choices': sorted(EXECUTORS),
+                'help': dedent("""\
+                        How to run the deployers (default=process).
+
+                            process - a new process for each deployer
+                            pool    - a reusable pool of worker processes
+                            thread  - a pool of threads
+                            inline  - one at a time, handy for debugging
+
+                        Overrides ``scheduler.executor`` in the config.
+
+                        """),
+                }),
+            ('--workers', {
+                'type': int,
+                'help': dedent("""\
+                        Number of workers for the ``pool`` and ``thread``
+                        executors.
+
+                        """),
+                }),
+            ('--fail-fast', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Cancel all running deployers as soon as one of them
+                        fails, instead of waiting for them to finish.
+
+                        """),
+                }),
+            ('--incremental', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Only deploy the resources whose config changed since
+                        the last successful deploy of this stack (and the
+                        resources that depend on them).  The inventory for
+                        everything else comes from the last deploy.
+
+                        """),
+                }),
+            ('--multi-stack', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Treat each config spec as a separate stack instead of
+                        merging them, and deploy all of the stacks at once.
+                        The stacks share provider connections and the worker
+                        and concurrency limits of the first stack's
+                        ``scheduler`` config.  The stacks are configured one
+                        after another once they are all deployed.  Can't be
+                        combined with --dump-config, --list, --status or
+                        --pipeline.
+
+                        """),
+                }),
+            ('--pipeline', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Configure the servers in each server class as soon as
+                        they are deployed, while the rest of the stack is
+                        still being deployed.  Overrides
+                        ``scheduler.pipeline`` in the config.
+
+                        """),
+                }),
+            ('--no-resume', {
+                'action': 'store_false',
+                'dest': 'resume',
+                'help': dedent("""\
+                        Ignore the journal left behind by a failed deploy of
+                        the same stack config, and run every deployer from
+                        the start.
+
+                        """),
+                }),
+            ('--trace', {
+                'metavar': 'FILE',
+                'help': dedent("""\
+                        Write a timing trace of the deploy and configure
+                        steps to FILE in Chrome trace event format.  Open it
+                        in ``chrome://tracing`` to see where the time goes.
+
                         """),
                 }),
             # TODO: implement validate/dry-run
@@ -217,10 +334,26 @@ def run_bang(alt_args=None):
     parser = get_parser()
     args = parser.parse_args(alt_args)
 
+    if args.multi_stack:
+        # these only make sense for a single stack.  don't fall through to a
+        # deploy instead.
+        for flag, value in (
+                ('--dump-config', args.dump_config),
+                ('--list', args.ansible_list),
+                ('--status', args.status),
+                ('--pipeline', args.pipeline),
+                ):
+            if value:
+                parser.error('%s can\'t be used with --multi-stack' % flag)
+
     source = args.config_specs or get_env_configs()
     if not source:
         return
 
+    if args.multi_stack:
+        run_stacks(source, args)
+        return
+
     config = Config.from_config_specs(source)
 
     if args.playbooks:
@@ -239,6 +372,7 @@ def run_bang(alt_args=None):
         sys.exit()
 
     set_ssh_creds(config, args)
+    set_scheduler_options(config, args)
 
     annoy(config)
 
@@ -248,10 +382,52 @@ def run_bang(alt_args=None):
         stack.show_inventory()
         return
 
+    if args.status:
+        stack.show_status()
+        return
+
     initialize_logging(config)
     # TODO:  config.validate()
-    if args.deploy:
-        stack.deploy()
-    if args.configure:
-        stack.configure()
+    if args.trace:
+        start_tracing(args.trace)
+    try:
+        pipeline = config[A.SCHEDULER].get(A.scheduler.PIPELINE)
+        if args.deploy and args.configure and pipeline:
+            stack.deploy_and_configure(incremental=args.incremental)
+        else:
+            if args.deploy:
+                stack.deploy(incremental=args.incremental)
+            if args.configure:
+                stack.configure()
+    finally:
+        stop_tracing()
     config.autoinc()
+
+
+def run_stacks(source, args):
+    """Deploys and configures each config spec in :attr:`source` as a stack."""
+    configs = []
+    for spec in source:
+        config = Config.from_config_specs([spec])
+        if args.playbooks:
+            config[A.PLAYBOOKS] = args.playbooks
+        set_ssh_creds(config, args)
+        set_scheduler_options(config, args)
+        configs.append(config)
+
+    annoy(configs[0])
+    stacks = [Stack(config) for config in configs]
+
+    initialize_logging(configs[0])
+    if args.trace:
+        start_tracing(args.trace)
+    try:
+        if args.deploy:
+            deploy_stacks(stacks, incremental=args.incremental)
+        if args.configure:
+            for stack in stacks:
+                stack.configure()
+    finally:
+        stop_tracing()
+    for config in configs:
+        config.autoinc()
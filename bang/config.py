@@ -34,6 +34,7 @@ RC_KEYS = [
         A.NAME_TAG_NAME,
         A.LOGGING,
         A.ANSIBLE,
+        A.SCHEDULER,
         A.ANNOY_ME,
         ]
 
@@ -218,7 +219,7 @@ class Config(dict):
                 A.secgroup.REGION: for_server[A.server.REGION],
                 'description': "Secgroup for %s load balancer" % lb[A.loadbalancer.NAME],
                 A.secgroup.RULES: [],
-                'load_balancer': lb[A.loadbalancer.NAME],
+                A.secgroup.LOAD_BALANCER: lb[A.loadbalancer.NAME],
             }
 
             load_balancer_groups.append(sec_group)
@@ -249,7 +250,7 @@ class Config(dict):
 
             # For load balancer SGs, don't add rule sets now;
             # it'll get done later
-            if not sg.get('load_balancer', None):
+            if not sg.get(A.secgroup.LOAD_BALANCER):
                 sg_rule_sets.append(
                     {
                         A.secgroup.NAME: dressy_name,
@@ -17,40 +17,237 @@
 """
 Base classes and definitions for bang deployers (deployable components)
 """
+import threading
+
 from . import cloud, default
-from .. import attributes as A
+from .deployer import Deployer
+from .. import BangError, resources as R, attributes as A
 from ..util import log
 
 
-def get_stage_deployers(keys, stack):
+def _iter_deployers(keys, stack, only=None):
     """
-    Returns a list of deployer objects that *create* cloud resources.  Each
-    member of the list is responsible for provisioning a single stack resource
-    (e.g. a virtual server, a security group, a bucket, etc...).
-
-    :param keys:  A list of top-level configuration keys for which to create
-        deployers.
-    :type keys:  :class:`~collections.Iterable`
+    Generates ``(res_type, res_config, deployer)`` tuples for every deployer
+    that handles the resource types listed in :attr:`keys`.
 
-    :param config:  A stack object.
-    :type config:  :class:`~bang.stack.Stack`
+    If :attr:`only` is given, it is a :class:`set` of ``(res_type, name)``
+    tuples, and deployers are only created for the matching resources.
 
-    :rtype:  :class:`list` of :class:`~bang.deployers.deployer.Deployer`
+    Also tells each deployer its
+    :attr:`~bang.deployers.deployer.Deployer.res_type`, and assigns it a
+    :attr:`~bang.deployers.deployer.Deployer.deployer_id` that stays the same
+    from one bang run to the next.
 
     """
     config = stack.config
     creds = config[A.DEPLOYER_CREDS]
-    deployers = []
     for res_type in keys:
         res_configs = config.get(res_type)
         if not res_configs:
             continue
         log.debug("Found config for resource type, %s" % res_type)
         for res_config in res_configs:
+            if only is not None and \
+                    (res_type, res_config.get(A.NAME)) not in only:
+                continue
             if A.PROVIDER in res_config:
                 ds = cloud.get_deployers(res_config, res_type, stack, creds)
             else:
                 ds = [default.ServerDeployer(stack, res_config)]
-            if ds:
-                deployers.extend(ds)
-    return deployers
+            for n, d in enumerate(ds or []):
+                d.res_type = res_type
+                d.deployer_id = '%s/%s/%d' % (
+                        res_type,
+                        res_config.get(A.NAME),
+                        n,
+                        )
+                yield res_type, res_config, d
+
+
+def get_stage_deployers(keys, stack):
+    """
+    Returns a list of deployer objects that *create* cloud resources.  Each
+    member of the list is responsible for provisioning a single stack resource
+    (e.g. a virtual server, a security group, a bucket, etc...).
+
+    :param keys:  A list of top-level configuration keys for which to create
+        deployers.
+    :type keys:  :class:`~collections.Iterable`
+
+    :param config:  A stack object.
+    :type config:  :class:`~bang.stack.Stack`
+
+    :rtype:  :class:`list` of :class:`~bang.deployers.deployer.Deployer`
+
+    """
+    return [d for _, _, d in _iter_deployers(keys, stack)]
+
+
+def assign_existing(deployers):
+    """
+    Lets the deployers for each resource discover its existing instances
+    once, in the parent process, instead of in every deployer process.  See
+    :meth:`~bang.deployers.deployer.Deployer.assign_existing`.
+
+    The resources are handled concurrently since the discovery is mostly
+    waiting on provider APIs.
+
+    """
+    groups = {}
+    for d in deployers:
+        if d.assign_existing.im_func is Deployer.assign_existing.im_func:
+            # nothing to discover
+            continue
+        key = d.deployer_id.rsplit('/', 1)[0]
+        groups.setdefault(key, []).append(d)
+    if len(groups) < 2:
+        for group in groups.itervalues():
+            group[0].assign_existing(group)
+        return
+
+    errors = []
+
+    def assign(group):
+        try:
+            group[0].assign_existing(group)
+        except Exception as e:
+            log.exception('Could not discover existing %s' % group[0])
+            errors.append(e)
+
+    threads = [
+            threading.Thread(target=assign, args=(groups[k],))
+            for k in sorted(groups)
+            ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+
+def _check_for_cycles(deps):
+    """Raises :class:`~bang.BangError` if :attr:`deps` is not acyclic."""
+    remaining = dict((i, set(d)) for i, d in enumerate(deps))
+    while remaining:
+        free = [i for i, d in remaining.iteritems() if not d]
+        if not free:
+            raise BangError(
+                    'Circular dependency between deployers %s'
+                    % sorted(remaining)
+                    )
+        for i in free:
+            del remaining[i]
+        for d in remaining.itervalues():
+            d.difference_update(free)
+
+
+def resource_deps(res_type, res_config, config):
+    """
+    Returns the :class:`set` of ``(res_type, name)`` tuples for the resources
+    upon which the resource described by :attr:`res_config` depends, as
+    declared in :data:`bang.resources.DEPENDENCIES`.
+
+    """
+    needs = set()
+    for attr, dep_type in R.DEPENDENCIES.get(res_type, ()):
+        if attr is None:
+            needs.update(
+                    (dep_type, c.get(A.NAME))
+                    for c in config.get(dep_type) or []
+                    )
+            continue
+        refs = res_config.get(attr) or []
+        if isinstance(refs, basestring):
+            refs = [refs]
+        needs.update((dep_type, ref) for ref in refs)
+    return needs
+
+
+def add_dependents(config, resources):
+    """
+    Adds every resource that depends, directly or indirectly, on any of the
+    :attr:`resources` to the set.  Resources are ``(res_type, name)`` tuples.
+
+    Returns :attr:`resources`.
+
+    """
+    configs = [
+            (res_type, c)
+            for keys in R.STAGES
+            for res_type in keys
+            for c in config.get(res_type) or []
+            ]
+    grew = True
+    while grew:
+        grew = False
+        for res_type, c in configs:
+            key = (res_type, c.get(A.NAME))
+            if key in resources:
+                continue
+            if resource_deps(res_type, c, config) & resources:
+                resources.add(key)
+                grew = True
+    return resources
+
+
+def get_deployer_graph(stack, staged=False, only=None):
+    """
+    Returns a ``(deployers, deps)`` tuple describing the order in which the
+    deployers for :attr:`stack` may run.  ``deployers`` is a :class:`list` of
+    :class:`~bang.deployers.deployer.Deployer` objects, and ``deps[i]`` is the
+    :class:`set` of indices into ``deployers`` that must complete successfully
+    before ``deployers[i]`` can start.
+
+    By default, the dependencies are derived from the references between
+    resources in the stack config, as declared in
+    :data:`bang.resources.DEPENDENCIES`.  E.g. a server depends on its own
+    security groups, but not on any database.
+
+    :param stack:  A stack object.
+    :type stack:  :class:`~bang.stack.Stack`
+
+    :param bool staged:  If ``True``, every deployer instead depends on all of
+        the deployers in the previous stage as defined in
+        :data:`bang.resources.STAGES`.
+
+    :param set only:  If given, only the resources named in this set of
+        ``(res_type, name)`` tuples are deployed.  Dependencies on any other
+        resources are assumed to be satisfied already.
+
+    :rtype:  :class:`tuple`
+
+    """
+    deployers = []
+    deps = []
+    if staged:
+        prev = set()
+        for keys in R.STAGES:
+            stage = set()
+            for _, _, d in _iter_deployers(keys, stack, only):
+                stage.add(len(deployers))
+                deployers.append(d)
+                deps.append(prev)
+            if stage:
+                prev = stage
+        return deployers, deps
+
+    nodes = list(_iter_deployers(
+            [k for s in R.STAGES for k in s],
+            stack,
+            only,
+            ))
+    by_name = {}
+    for i, (res_type, res_config, _) in enumerate(nodes):
+        key = (res_type, res_config.get(A.NAME))
+        by_name.setdefault(key, set()).add(i)
+
+    for res_type, res_config, d in nodes:
+        needs = set()
+        for key in resource_deps(res_type, res_config, stack.config):
+            needs.update(by_name.get(key, ()))
+        deployers.append(d)
+        deps.append(needs)
+
+    _check_for_cycles(deps)
+    return deployers, deps
@@ -14,7 +14,10 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import threading
 import time
+import uuid
+from multiprocessing.pool import ThreadPool
 from .. import resources as R, attributes as A
 from ..providers import get_provider
 from ..util import log
@@ -46,6 +49,8 @@ class SSHKeyDeployer(RegionedDeployer):
     server-launch time.
 
     """
+    journal_attrs = ('found',)
+
     def __init__(self, *args, **kwargs):
         super(SSHKeyDeployer, self).__init__(*args, **kwargs)
         self.found = False
@@ -64,12 +69,40 @@ class SSHKeyDeployer(RegionedDeployer):
         self.consul.create_ssh_pub_key(self.name, self.key)
 
 
+def _hand_out(deployers, attr, found, key=lambda x: x):
+    """
+    Sets the ``assigned_<attr>`` attribute of each of :attr:`deployers` to a
+    different item from :attr:`found`, in order.  Deployers that already have
+    a value for :attr:`attr` (e.g. restored from the journal) keep it, and
+    nobody else gets the same item.
+
+    """
+    taken = set(key(getattr(d, attr)) for d in deployers if getattr(d, attr))
+    free = [f for f in found if key(f) not in taken]
+    for d in deployers:
+        if not free:
+            break
+        if getattr(d, attr) or d.resume_at:
+            continue
+        setattr(d, 'assigned_' + attr, free.pop(0))
+
+
 class ServerDeployer(RegionedDeployer):
+    journal_attrs = ('server_attrs', 'client_token')
+    expected_duration_s = 180
 
     def __init__(self, *args, **kwargs):
         super(ServerDeployer, self).__init__(*args, **kwargs)
-        self.namespace = self.stack.get_namespace(self.name)
         self.server_attrs = None
+
+        #: The existing server handed to this deployer by
+        #: :meth:`assign_existing`, if any.
+        self.assigned_server_attrs = None
+
+        #: The idempotency token for the launch request.  It is journaled, so
+        #: retrying or resuming the launch returns the servers launched by
+        #: the first attempt instead of launching more of them.
+        self.client_token = uuid.uuid4().hex
         self.provider_extras = getattr(self, self.provider, {})
         self.phases = [
                 (True, self.find_existing),
@@ -82,24 +115,38 @@ class ServerDeployer(RegionedDeployer):
                 self.add_to_inventory,
                 ]
 
+    @classmethod
+    def assign_existing(cls, deployers):
+        """
+        Searches once, in the parent process, for existing server instances
+        with matching tags, and hands each one to a different deployer of the
+        server class.  To match, the existing instances must also be
+        "running".
+
+        :param list deployers:  The deployers for all of the instances of a
+            single server class.
+
+        """
+        d = deployers[0]
+        _hand_out(
+                deployers,
+                'server_attrs',
+                d.consul.find_servers(d.tags),
+                key=lambda s: s[A.server.ID],
+                )
+
     def find_existing(self):
         """
-        Searches for existing server instances with matching tags.  To match,
-        the existing instances must also be "running".
+        Takes over the existing server handed to this deployer by
+        :meth:`assign_existing`, if any.
 
         """
-        instances = self.consul.find_servers(self.tags)
-        maxnames = len(instances)
-        while instances:
-            i = instances.pop(0)
-            server_id = i[A.server.ID]
-            if self.namespace.add_if_unique(server_id):
-                log.info('Found existing server, %s' % server_id)
-                self.server_attrs = i
-                break
-            if len(self.namespace.names) >= maxnames:
-                break
-            instances.append(i)
+        if self.assigned_server_attrs:
+            log.info(
+                    'Found existing server, %s'
+                    % self.assigned_server_attrs[A.server.ID]
+                    )
+            self.server_attrs = self.assigned_server_attrs
 
     def wait_for_running(self):
         """Waits for found servers to be operational"""
@@ -119,6 +166,7 @@ class ServerDeployer(RegionedDeployer):
                 availability_zone=self.availability_zone,
                 timeout_s=self.launch_timeout_s,
                 security_groups=self.security_groups,
+                client_token=self.client_token,
                 **self.provider_extras
                 )
         log.debug('Post launch delay: %d s' % self.post_launch_delay_s)
@@ -129,7 +177,265 @@ class ServerDeployer(RegionedDeployer):
         if not self.server_attrs:
             return
         for addy in self.server_attrs[A.server.PUBLIC_IPS]:
-            self.stack.add_host(addy, self.groups, self.hostvars)
+            self.add_host(addy, self.groups, self.hostvars)
+
+
+class FleetServerDeployer(ServerDeployer):
+    """
+    Deploys all of the ``instance_count`` servers of a server class at once.
+
+    Instead of one deployer per server, each with its own copy of the server
+    config, its own discovery and its own launch and polling, the lone fleet
+    deployer for a server class reconciles ``instance_count`` against the
+    servers it finds with a single search, then launches the whole shortfall
+    with a single request to the provider and polls the new servers together.
+    The number of provider calls does not grow with ``instance_count``.
+
+    Used for every server class if the consul provides ``create_servers()``.
+
+    """
+    journal_attrs = ('servers', 'client_token')
+
+    def __init__(self, *args, **kwargs):
+        super(FleetServerDeployer, self).__init__(*args, **kwargs)
+        self.instance_count = getattr(self, 'instance_count', 1)
+        self.servers = []
+        self.phases = [
+                (True, self.find_existing),
+                (lambda: self.servers, self.wait_for_running),
+                (lambda: len(self.servers) < self.instance_count,
+                    self.create),
+                (True, self.add_to_inventory),
+                ]
+        self.inventory_phases = [
+                self.find_existing,
+                self.add_to_inventory,
+                ]
+
+    @classmethod
+    def assign_existing(cls, deployers):
+        # the lone deployer for the server class finds all of the servers
+        pass
+
+    def find_existing(self):
+        """
+        Searches for existing server instances with matching tags.  To match,
+        the existing instances must also be "running", or still starting up
+        (see :meth:`wait_for_running`).
+
+        """
+        instances = self.consul.find_servers(self.tags, running=False)
+        self.servers = instances[:self.instance_count]
+        log.info(
+                'Found %d of %d existing %s servers'
+                % (len(self.servers), self.instance_count, self.name)
+                )
+        surplus = instances[self.instance_count:]
+        if surplus:
+            log.warn(
+                    'Leaving out %d surplus %s servers: %s'
+                    % (
+                        len(surplus),
+                        self.name,
+                        ', '.join(s[A.server.ID] for s in surplus),
+                        )
+                    )
+
+    def wait_for_running(self):
+        """Waits for all of the found servers to be running at once"""
+        self.servers = self.consul.find_all_running(
+                self.servers,
+                self.launch_timeout_s,
+                )
+
+    def create(self):
+        """Launches all of the missing server instances at once."""
+        self.servers = self.servers + self._launch(
+                self.instance_count - len(self.servers),
+                self.client_token,
+                )
+
+    def _launch(self, count, client_token=None):
+        servers = self.consul.create_servers(
+                count,
+                "%s-%s" % (self.stack.name, self.name),
+                self.disk_image_id,
+                self.instance_type,
+                self.ssh_key_name,
+                tags=self.tags,
+                availability_zone=self.availability_zone,
+                timeout_s=self.launch_timeout_s,
+                security_groups=self.security_groups,
+                client_token=client_token,
+                **self.provider_extras
+                )
+        log.debug('Post launch delay: %d s' % self.post_launch_delay_s)
+        time.sleep(self.post_launch_delay_s)
+        return servers
+
+    def add_to_inventory(self):
+        """Adds all of the hosts to stack inventory"""
+        for server_attrs in self.servers:
+            for addy in server_attrs[A.server.PUBLIC_IPS]:
+                self.add_host(addy, self.groups, self.hostvars)
+
+
+class RollingServerDeployer(FleetServerDeployer):
+    """
+    Replaces the running servers of a server class whose disk image differs
+    from the ``disk_image_id`` in the config, without losing capacity.
+
+    The outdated servers are replaced in batches of ``batch_size`` (see
+    :data:`bang.attributes.server.ROLLING`).  Each replacement batch is
+    launched with a single request, configured with the stack playbooks,
+    swapped into any load balancers in front of the server class, and only
+    then are the old servers it replaces terminated.  Up to
+    ``max_in_flight`` servers are replaced at once.
+
+    Used for server classes with a ``rolling`` stanza if the consul provides
+    ``create_servers()`` and ``delete_server()``.
+
+    """
+    # the progress of a rolling replacement is rediscovered from the running
+    # servers on every attempt
+    journal_attrs = None
+    reads_inventory = True
+
+    # a batch that failed part way may already have terminated some of the
+    # servers it replaces
+    no_retry_phases = ('replace_outdated',)
+
+    def __init__(self, *args, **kwargs):
+        super(RollingServerDeployer, self).__init__(*args, **kwargs)
+        rolling = self.rolling or {}
+        self.batch_size = max(1, rolling.get(A.server.ROLLING_BATCH_SIZE, 1))
+        self.max_in_flight = max(
+                self.batch_size,
+                rolling.get(A.server.ROLLING_MAX_IN_FLIGHT, self.batch_size),
+                )
+        self.configure_batches = rolling.get(A.server.ROLLING_CONFIGURE, True)
+        self.outdated = []
+        self.lock = threading.Lock()
+        self.phases = [
+                (True, self.find_existing),
+                (lambda: len(self.servers) + len(self.outdated) <
+                    self.instance_count, self.create),
+                (True, self.add_to_inventory),
+                (lambda: self.outdated, self.replace_outdated),
+                ]
+        self.inventory_phases = [
+                self.find_existing,
+                self.add_to_inventory,
+                self.add_outdated_to_inventory,
+                ]
+
+    def find_existing(self):
+        """
+        Searches for existing server instances with matching tags, and sorts
+        them into up-to-date and outdated servers.
+
+        """
+        current = []
+        outdated = []
+        for i in self.consul.find_servers(self.tags):
+            if i.get(A.server.IMAGE_ID) == self.disk_image_id:
+                current.append(i)
+            else:
+                outdated.append(i)
+        self.servers = current[:self.instance_count]
+        self.outdated = outdated[:self.instance_count - len(self.servers)]
+        log.info(
+                'Found %d up-to-date and %d outdated %s servers'
+                % (len(self.servers), len(self.outdated), self.name)
+                )
+
+    def create(self):
+        """Launches the servers needed to make up ``instance_count``."""
+        self.servers = self.servers + self._launch(
+                self.instance_count - len(self.servers) - len(self.outdated),
+                self.client_token,
+                )
+
+    def replace_outdated(self):
+        """Replaces the outdated servers, batch by batch."""
+        batches = [
+                self.outdated[n:n + self.batch_size]
+                for n in range(0, len(self.outdated), self.batch_size)
+                ]
+        log.info(
+                'Replacing %d outdated %s servers in %d batches'
+                % (len(self.outdated), self.name, len(batches))
+                )
+        pool = ThreadPool(self.max_in_flight // self.batch_size)
+        try:
+            pool.map(self._replace_batch, batches)
+        finally:
+            pool.close()
+            pool.join()
+        self.outdated = []
+
+    def _replace_batch(self, old):
+        new = self._launch(len(old))
+        new_hosts = [addy for s in new for addy in s[A.server.PUBLIC_IPS]]
+        old_hosts = [addy for s in old for addy in s[A.server.PUBLIC_IPS]]
+
+        # the playbooks and the load balancer updates are not thread-safe, so
+        # only the launching and the terminating overlap.
+        with self.lock:
+            for addy in new_hosts:
+                self.add_host(addy, self.groups, self.hostvars)
+            if self.configure_batches:
+                self.stack.run_playbooks(
+                        new_hosts,
+                        self.stack.get_class_playbooks(self.name),
+                        )
+            self._swap_lb_nodes(new_hosts, old_hosts)
+
+        for s in old:
+            self.consul.delete_server(s[A.server.ID])
+        log.info(
+                'Replaced %s servers %s with %s'
+                % (self.name, ', '.join(old_hosts), ', '.join(new_hosts))
+                )
+
+    def _swap_lb_nodes(self, add, remove):
+        """
+        Puts the :attr:`add` hosts in place of the :attr:`remove` hosts in
+        every existing load balancer for this server class.
+
+        """
+        config = self.stack.config
+        for lb in config.get(R.LOAD_BALANCERS) or []:
+            if lb.get(A.loadbalancer.SERVER_NAMES) != self.name:
+                continue
+            pname = lb[A.PROVIDER]
+            consul = get_provider(
+                    pname,
+                    config[A.DEPLOYER_CREDS][pname],
+                    ).get_consul(R.LOAD_BALANCERS)
+            consul.set_region(lb.get(A.loadbalancer.REGION))
+            lb_attrs = consul.find_lb_by_name(
+                    "%s-%s" % (self.stack.name, lb[A.NAME])
+                    )
+            if not lb_attrs:
+                # the load balancer deployer will create it with the new
+                # servers
+                continue
+            lb_id = lb_attrs[A.loadbalancer.ID]
+            nodes = consul.lb_details(lb_id)[A.loadbalancer.NODES_KEY]
+            hosts = set(n[A.loadbalancer.NODE_HOST] for n in nodes)
+            consul.match_lb_nodes(
+                    lb_id,
+                    nodes,
+                    (hosts - set(remove)) | set(add),
+                    lb[A.loadbalancer.SERVER_PORT],
+                    )
+
+    def add_outdated_to_inventory(self):
+        """Adds the servers that are yet to be replaced to stack inventory"""
+        for server_attrs in self.outdated:
+            for addy in server_attrs[A.server.PUBLIC_IPS]:
+                self.add_host(addy, self.groups, self.hostvars)
 
 
 class CloudManagerServerDeployer(ServerDeployer):
@@ -143,9 +449,20 @@ class CloudManagerServerDeployer(ServerDeployer):
     :class:`ServerDeployer` with a :meth:`create` method that is more suited to
     the high-level launching mechanism provided by cloud management services.
     """
+    journal_attrs = ('server_attrs', 'server_def')
+    expected_duration_s = 600
+
+    # server defs and launches through a cloud manager carry no idempotency
+    # token, so a retry could define or launch a second server
+    no_retry_phases = ('define', 'create')
+
     def __init__(self, *args, **kwargs):
         super(CloudManagerServerDeployer, self).__init__(*args, **kwargs)
         self.server_def = None
+
+        #: The unused server definition handed to this deployer by
+        #: :meth:`assign_existing`, if any.
+        self.assigned_server_def = None
         self.phases = [
                 (True, self.create_stack),
                 (True, self.find_existing),
@@ -157,21 +474,40 @@ class CloudManagerServerDeployer(ServerDeployer):
                 (True, self.add_to_inventory),
                 ]
 
+    @classmethod
+    def assign_existing(cls, deployers):
+        """
+        Hands out the existing servers as in
+        :meth:`ServerDeployer.assign_existing`, then hands out the unused
+        server definitions to the deployers that didn't get a server.
+
+        """
+        super(CloudManagerServerDeployer, cls).assign_existing(deployers)
+        d = deployers[0]
+        _hand_out(
+                [x for x in deployers if not x.assigned_server_attrs],
+                'server_def',
+                d.consul.find_server_defs(d.name),
+                )
+
+    def restore(self, entry):
+        super(CloudManagerServerDeployer, self).restore(entry)
+        # the consul only learns the stack's deployment in create_stack, which
+        # a resumed deploy doesn't run again
+        self.create_stack()
+
     def create_stack(self):
         self.consul.create_stack(self.stack.name)
 
     def find_def(self):
-        server_defs = self.consul.find_server_defs(self.name)
-        maxnames = len(server_defs)
-        while server_defs:
-            href = server_defs.pop(0)
-            if self.namespace.add_if_unique(href):
-                log.info('Found existing server def, %s' % href)
-                self.server_def = href
-                break
-            if len(self.namespace.names) >= maxnames:
-                break
-            server_defs.append(href)
+        """
+        Takes over the server definition handed to this deployer by
+        :meth:`assign_existing`, if any.
+
+        """
+        if self.assigned_server_def:
+            log.info('Found existing server def, %s' % self.assigned_server_def)
+            self.server_def = self.assigned_server_def
 
     def define(self):
         """Defines a new server."""
@@ -199,6 +535,9 @@ class CloudManagerServerDeployer(ServerDeployer):
 
 
 class SecurityGroupDeployer(RegionedDeployer):
+    # nova happily creates a second group with the same name
+    no_retry_phases = ('create',)
+
     def __init__(self, *args, **kwargs):
         super(SecurityGroupDeployer, self).__init__(*args, **kwargs)
         self.group = None
@@ -218,6 +557,9 @@ class SecurityGroupDeployer(RegionedDeployer):
 
 
 class SecurityGroupRulesetDeployer(RegionedDeployer):
+    # the rules changed before the failure would be changed again
+    no_retry_phases = ('apply_rule_changes',)
+
     def __init__(self, *args, **kwargs):
         super(SecurityGroupRulesetDeployer, self).__init__(*args, **kwargs)
         self.create_these_rules = []
@@ -236,6 +578,8 @@ class SecurityGroupRulesetDeployer(RegionedDeployer):
 
         """
         sg = self.consul.find_secgroup(self.name)
+        self.create_these_rules = []
+        self.delete_these_rules = []
 
         current = sg.rules
         log.debug('Current rules: %s' % current)
@@ -276,6 +620,8 @@ class SecurityGroupRulesetDeployer(RegionedDeployer):
 
 
 class BucketDeployer(BaseDeployer):
+    journal_attrs = ()
+
     def __init__(self, *args, **kwargs):
         super(BucketDeployer, self).__init__(*args, **kwargs)
         self.phases = [
@@ -288,6 +634,12 @@ class BucketDeployer(BaseDeployer):
 
 
 class DatabaseDeployer(BaseDeployer):
+    journal_attrs = ('db_attrs',)
+    expected_duration_s = 600
+
+    # a create that timed out may still be building the instance
+    no_retry_phases = ('create',)
+
     def __init__(self, *args, **kwargs):
         super(DatabaseDeployer, self).__init__(*args, **kwargs)
         self.instance_name = "%s-%s" % (self.stack.name, self.name)
@@ -325,7 +677,7 @@ class DatabaseDeployer(BaseDeployer):
     def add_to_inventory(self):
         """Adds db host to stack inventory"""
         host = self.db_attrs.pop(A.database.HOST)
-        self.stack.add_host(
+        self.add_host(
                 host,
                 self.groups,
                 self.db_attrs
@@ -354,6 +706,13 @@ class LoadBalancerDeployer(RegionedDeployer):
             port: '443'
 
     """
+    journal_attrs = ('lb_attrs',)
+    expected_duration_s = 120
+    reads_inventory = True
+
+    # load balancer names aren't unique, so a retry could create a second one,
+    # and a retried node change would work from the nodes found before it
+    no_retry_phases = ('create', 'configure_nodes')
 
     def __init__(self, *args, **kwargs):
         super(LoadBalancerDeployer, self).__init__(*args, **kwargs)
@@ -429,8 +788,8 @@ class LoadBalancerDeployer(RegionedDeployer):
                     self.lb_attrs[A.loadbalancer.ID]
                     )
             host = self.lb_attrs['virtualIps'][0]['address']
-            self.stack.add_lb_secgroup(self.name, [host], self.backend_port)
-            self.stack.add_host(
+            self.add_lb_secgroup(self.name, [host], self.backend_port)
+            self.add_host(
                     host,
                     [self.name],
                     self.lb_attrs
@@ -438,12 +797,17 @@ class LoadBalancerDeployer(RegionedDeployer):
 
 
 class LoadBalancerSecurityGroupsDeployer(SecurityGroupRulesetDeployer):
+    reads_inventory = True
+
     def __init__(self, *args, **kwargs):
         super(LoadBalancerSecurityGroupsDeployer, self).__init__(
                 *args, **kwargs)
         self.group = None
         self.attrs = {}
 
+        # the rules from the config, before the LB rules are added to them
+        self.config_rules = list(self.rules)
+
     def find_existing(self):
         # Prepopulate rules from the LB stack variables
         lb_entry = self.stack.lb_sec_groups.dicts.get(self.load_balancer)
@@ -452,6 +816,8 @@ class LoadBalancerSecurityGroupsDeployer(SecurityGroupRulesetDeployer):
                 "No load balancer host found in stack for '%s'"
                 % self.load_balancer
                 )
+        # start over from the config rules, in case this is a retry
+        self.rules = list(self.config_rules)
         for host in lb_entry['hosts']:
             # Create a rule for this LB. Need a mask or nova interprets it
             # as a group rule rather than IP rule
@@ -500,4 +866,15 @@ def get_deployers(res_config, res_type, stack, creds):
         return
     deployer = get_deployer(pname, res_type)
     count = res_config.get('instance_count', 1)
+    if A.server.ROLLING in res_config:
+        if (deployer is ServerDeployer and hasattr(consul, 'create_servers')
+                and hasattr(consul, 'delete_server')):
+            return [RollingServerDeployer(stack, res_config, consul)]
+        log.warn(
+                "%s does not support rolling replacement of servers"
+                % pname
+                )
+    if (count > 0 and deployer is ServerDeployer
+            and hasattr(consul, 'create_servers')):
+        return [FleetServerDeployer(stack, res_config, consul)]
     return [deployer(stack, res_config, consul) for _ in range(count)]
@@ -37,6 +37,10 @@ class ServerDeployer(Deployer):
           - config_scope_n
 
     """
+    journal_attrs = ()
+    expected_duration_s = 0
+    runs_inline = True
+
     def __init__(self, *args, **kwargs):
         super(ServerDeployer, self).__init__(*args, **kwargs)
         self.phases = [(True, self.add_to_inventory)]
@@ -44,4 +48,4 @@ class ServerDeployer(Deployer):
 
     def add_to_inventory(self):
         """Adds this server and its hostvars to the ansible inventory."""
-        self.stack.add_host(self.hostname, self.groups, self.hostvars)
+        self.add_host(self.hostname, self.groups, self.hostvars)
@@ -14,17 +14,93 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import copy
+import time
 from collections import Callable
+from ..retry import RetryPolicy, is_transient
+from ..trace import span
 from ..util import log
-from .. import BangError
+from .. import BangError, status
 
 
 class Deployer(object):
     """Base class for all deployers"""
+
+    #: The names of the attributes that capture this deployer's progress
+    #: between phases.  They are recorded in the journal after every phase so
+    #: that a failed deploy can resume part way through this deployer.
+    #: ``None`` means the progress can't be recorded (e.g. it holds provider
+    #: objects), so this deployer is only journaled once it completes.
+    journal_attrs = None
+
+    #: A rough guess at how long this deployer takes, in seconds, for when
+    #: there is no history of past deploys to go by.  See :mod:`bang.history`.
+    expected_duration_s = 10
+
+    #: The type of resource deployed by this deployer (e.g. ``servers``).  Set
+    #: by :func:`bang.deployers.get_deployer_graph`.
+    res_type = None
+
+    #: Identifies this deployer across bang runs.  Set by
+    #: :func:`bang.deployers.get_deployer_graph`.
+    deployer_id = None
+
+    #: The :class:`~bang.journal.Journal` in which to record checkpoints, if
+    #: any.
+    journal = None
+
+    #: ``True`` if this deployer reads inventory added by other deployers, so
+    #: it needs an up-to-date copy of the stack inventory even when it runs
+    #: in a long-lived worker process.
+    reads_inventory = False
+
+    #: ``True`` if this deployer makes no provider calls (e.g. it only adds
+    #: to the stack inventory), so it is cheaper to run it in the parent
+    #: process than to hand it to an executor.
+    runs_inline = False
+
+    #: The wall-clock budget for this deployer, in seconds.  Set it in the
+    #: resource config stanza to override the ``deployer_timeout_s``
+    #: attribute of the ``scheduler`` config stanza.  See
+    #: :class:`~bang.scheduler.Scheduler`.
+    deployer_timeout_s = None
+
+    #: The name of the phase being run, for the watchdog to report if this
+    #: deployer runs out of time.
+    current_phase = None
+
+    #: The :class:`~bang.status.StatusFile` in which to publish state
+    #: changes, if any.
+    status = None
+
+    #: The :class:`~bang.retry.RetryPolicy` for phases that fail with a
+    #: transient error.  Set from the ``scheduler`` config stanza by the
+    #: stack.
+    retry_policy = RetryPolicy()
+
+    #: The names of the phases that must not be retried, because running
+    #: them again after a partial failure is not safe.  A phase that creates
+    #: a resource belongs here unless it carries an idempotency token, or
+    #: first looks for the resource that an earlier attempt created.
+    no_retry_phases = ()
+
+    #: Set by an executor that had to give up on this deployer without
+    #: stopping it (see :meth:`bang.executors.ThreadExecutor.expire`).  The
+    #: deployer stops at the next phase, and its changes to the stack
+    #: inventory are dropped.
+    expired = False
+
     def __init__(self, stack, config):
         self.stack = stack
         self.phases = []
         self.inventory_phases = []
+        self.resume_at = 0
+        self._effects = []
+
+        #: The ``[method_name, args]`` pairs for all of the stack inventory
+        #: calls made during this run.  Deployers that run in a child process
+        #: send these back to the parent process.
+        self.results = []
 
         # TODO: in retrospect, embedding config vals as attributes of Deployer
         # objects is not as flexible as i intended.  consider just storing it
@@ -39,13 +115,141 @@ class Deployer(object):
                         )
             self.__dict__[k] = v
 
+    def __str__(self):
+        return '%s(%s)' % (self.__class__.__name__, getattr(self, 'name', ''))
+
     def deploy(self):
-        for should_run, action in self.phases:
+        for n, (should_run, action) in enumerate(self.phases):
+            if n < self.resume_at:
+                continue
+            self._check_expired()
             if isinstance(should_run, Callable):
-                if should_run():
-                    action()
-            elif should_run:
-                action()
+                should_run = should_run()
+            if should_run:
+                self.current_phase = action.__name__
+                self.publish_status(status.RUNNING)
+                with span(action.__name__, 'phase', **self._trace_args()):
+                    self.run_phase(action)
+            self.checkpoint(n)
+
+    def run_phase(self, action):
+        """
+        Runs the phase :attr:`action`, and runs it again if it fails with a
+        transient error, as allowed by :attr:`retry_policy`.
+
+        """
+        name = action.__name__
+        attempts = 1
+        if name not in self.no_retry_phases:
+            attempts = self.retry_policy.attempts(name)
+        attempt = 1
+        while True:
+            try:
+                return action()
+            except Exception as e:
+                if attempt >= attempts or not is_transient(e):
+                    raise
+                self._check_expired()
+                delay = self.retry_policy.delay(name, attempt)
+                log.warn(
+                        '%s: %s failed (attempt %d of %d), retrying in %ds: '
+                        '%s' % (self, name, attempt, attempts, delay, e)
+                        )
+                time.sleep(delay)
+                attempt += 1
+
+    def _check_expired(self):
+        if self.expired:
+            raise BangError('%s ran out of time.' % self)
+
+    def checkpoint(self, phase):
+        """
+        Records the completion of :attr:`phase` in the journal, if there is
+        one.
+
+        """
+        if not self.journal:
+            return
+        done = phase == len(self.phases) - 1
+        if self.journal_attrs is None and not done:
+            return
+        state = dict(
+                (k, getattr(self, k)) for k in self.journal_attrs or ()
+                )
+        self.journal.record(
+                self.deployer_id,
+                phase,
+                state,
+                self._effects,
+                done,
+                )
+        self._effects = []
+
+    def restore(self, entry):
+        """
+        Restores the progress recorded in a journal :attr:`entry` (see
+        :meth:`bang.journal.Journal.load`) and replays its additions to the
+        stack inventory.
+
+        """
+        for k, v in entry['state'].iteritems():
+            setattr(self, k, v)
+        self.apply_results(entry['effects'])
+        self.resume_at = entry['phase'] + 1
+
+    @classmethod
+    def assign_existing(cls, deployers):
+        """
+        Discovers existing resources once, in the parent process, on behalf
+        of :attr:`deployers` (all of the deployers for a single resource), and
+        hands them out before any of the deployers run.  Does nothing by
+        default.
+
+        """
+        pass
+
+    def publish_status(self, state):
+        """
+        Publishes a change to :attr:`state` in the current phase to the
+        status file, if there is one.  See :mod:`bang.status`.
+
+        """
+        if self.status:
+            self.status.publish(self, state, self.current_phase)
+
+    def apply_results(self, results):
+        """
+        Replays stack inventory calls recorded by this deployer (e.g. in a
+        child process, see :attr:`results`) onto :attr:`stack`.
+
+        """
+        for method, args in results:
+            getattr(self.stack, method)(*args)
+
+    def _record_effect(self, method, *args):
+        if self.expired:
+            log.warn('%s ran out of time, dropped its %s' % (self, method))
+            return
+        effect = [method, copy.deepcopy(args)]
+        self._effects.append(effect)
+        self.results.append(effect)
+        getattr(self.stack, method)(*args)
+
+    def add_host(self, host, group_names=None, host_vars=None):
+        """
+        Adds a host to the stack inventory and remembers it for the journal.
+        See :meth:`bang.stack.Stack.add_host`.
+
+        """
+        self._record_effect('add_host', host, group_names, host_vars)
+
+    def add_lb_secgroup(self, lb_name, hosts, port):
+        """
+        Registers a load balancer's hosts with the stack and remembers them
+        for the journal.  See :meth:`bang.stack.Stack.add_lb_secgroup`.
+
+        """
+        self._record_effect('add_lb_secgroup', lb_name, hosts, port)
 
     def inventory(self):
         """
@@ -56,7 +260,16 @@ class Deployer(object):
         Does not attempt to *create* any resources.
         """
         for action in self.inventory_phases:
-            action()
+            self._check_expired()
+            self.current_phase = action.__name__
+            with span(action.__name__, 'phase', **self._trace_args()):
+                self.run_phase(action)
+
+    def _trace_args(self):
+        return {
+                'res_type': self.res_type,
+                'resource': getattr(self, 'name', None),
+                }
 
     def run(self, action):
         """
@@ -67,12 +280,17 @@ class Deployer(object):
         """
         deployer = self.__class__.__name__
         log.info('Running %s...' % deployer)
+        status.set_current(self)
         try:
-            if action == 'deploy':
-                self.deploy()
-            elif action == 'inventory':
-                self.inventory()
+            with span(str(self), 'deployer', action=action,
+                    **self._trace_args()):
+                if action == 'deploy':
+                    self.deploy()
+                elif action == 'inventory':
+                    self.inventory()
         except BangError as e:
             log.error(e)
             raise
+        finally:
+            status.set_current(None)
         log.info('%s complete.' % deployer)
@@ -0,0 +1,503 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Executor backends that run :meth:`bang.deployers.deployer.Deployer.run` on
+behalf of the :class:`~bang.scheduler.Scheduler`.
+
+Every executor accepts jobs by deployer index via :meth:`Executor.submit` and
+reports them back as ``(index, exitcode)`` tuples from :meth:`Executor.wait`,
+where an ``exitcode`` of ``0`` means success.
+
+Deployers that run past their time budget (see
+:class:`~bang.scheduler.Scheduler`) are stopped with :meth:`Executor.expire`,
+which first logs the phase and the Python stack the deployer is stuck in.
+
+Executors that run deployers in child processes collect each deployer's
+:attr:`~bang.deployers.deployer.Deployer.results` in a single message when it
+finishes, and apply them to the stack in the parent process before reporting
+the deployer as finished.
+"""
+import functools
+import multiprocessing
+import os
+import Queue
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from . import BangError
+from .util import log
+
+
+#: How often, in seconds, to check on running deployer processes.
+POLL_INTERVAL_S = 0.1
+
+#: How long, in seconds, a cancelled deployer process gets to exit after being
+#: sent SIGTERM.
+CANCEL_GRACE_S = 5
+
+#: The number of workers used by the ``pool`` and ``thread`` executors unless
+#: configured otherwise.
+DEFAULT_WORKERS = 32
+
+
+def log_stuck(deployer, frame):
+    """
+    Logs the phase that :attr:`deployer` is in and the stack of :attr:`frame`,
+    where it is stuck.
+
+    """
+    log.error(
+            '%s ran out of time in phase %s:\n%s' % (
+                deployer,
+                getattr(deployer, 'current_phase', None),
+                ''.join(traceback.format_stack(frame)) if frame else
+                '(stack not available)',
+                )
+            )
+
+
+def _get_results(results, timeout):
+    """
+    Returns the next item in the :attr:`results` queue, waiting up to
+    :attr:`timeout` seconds for it.  A :attr:`timeout` of ``0`` (e.g. a
+    deadline that has already passed) doesn't wait at all.
+
+    """
+    if timeout is None:
+        # Queue.get() without a timeout can't be interrupted by ^C in py2
+        return results.get(True, 1e9)
+    if timeout <= 0:
+        return results.get_nowait()
+    return results.get(True, timeout)
+
+
+def run_deployer(deployer, action):
+    """
+    Runs :attr:`action` on :attr:`deployer`, and returns an exit code.
+
+    Any exception raised by the deployer is logged and reported as a non-zero
+    exit code, so a single failure can't take down a shared worker.
+
+    """
+    try:
+        deployer.run(action)
+    except Exception:
+        log.exception('%s failed.' % deployer)
+        return 1
+    return 0
+
+
+class Executor(object):
+    """Base class for all executors"""
+    def __init__(self, deployers, action, workers=None):
+        """
+        :param list deployers:  All of the
+            :class:`~bang.deployers.deployer.Deployer` objects that may be
+            submitted to this executor.
+
+        :param str action:  Either ``deploy`` or ``inventory``.
+
+        :param int workers:  The maximum number of deployers to run at once.
+            Not all executors use it.
+
+        """
+        self.deployers = deployers
+        self.action = action
+        self.workers = workers or DEFAULT_WORKERS
+
+    def submit(self, i):
+        """Starts (or queues) the deployer at index :attr:`i`."""
+        raise NotImplementedError
+
+    def wait(self, timeout=None):
+        """
+        Blocks until at least one submitted deployer finishes, or until
+        :attr:`timeout` seconds have passed.
+
+        Returns a :class:`list` of ``(index, exitcode)`` tuples, which is
+        empty if the wait timed out.
+
+        """
+        raise NotImplementedError
+
+    def expire(self, indices):
+        """
+        Stops the running deployers in :attr:`indices` because they ran out
+        of time, after logging where each of them is stuck.  They are not
+        reported by :meth:`wait`.
+
+        """
+        raise NotImplementedError
+
+    def cancel(self):
+        """
+        Stops all of the submitted deployers that have not finished yet.
+        Call :meth:`wait` with a zero timeout first to collect the deployers
+        that already finished.
+
+        Returns a :class:`list` of the indices of the deployers that were cut
+        off.
+
+        """
+        raise NotImplementedError
+
+    def shutdown(self):
+        """Releases any workers held by this executor."""
+        pass
+
+
+def _dump_and_exit(deployer, signum, frame):
+    log_stuck(deployer, frame)
+    os._exit(1)
+
+
+def _process_run(deployer, action, conn):
+    signal.signal(signal.SIGUSR1, functools.partial(_dump_and_exit, deployer))
+    exitcode = run_deployer(deployer, action)
+    conn.send(deployer.results)
+    conn.close()
+    sys.exit(exitcode)
+
+
+class ProcessExecutor(Executor):
+    """
+    Runs every deployer in its own, freshly forked process.  This is the
+    default.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(ProcessExecutor, self).__init__(*args, **kwargs)
+        self.running = {}
+        self.conns = {}
+
+    def submit(self, i):
+        d = self.deployers[i]
+        conn, child_conn = multiprocessing.Pipe(False)
+        p = multiprocessing.Process(
+                name=d.__class__.__name__,
+                target=_process_run,
+                args=(d, self.action, child_conn),
+                )
+        p.start()
+        child_conn.close()
+        self.running[i] = p
+        self.conns[i] = conn
+
+    def _receive(self, i):
+        # read the results before joining:  a child blocks in send() until a
+        # big message has been read.
+        conn = self.conns[i]
+        if not conn.poll():
+            return
+        try:
+            self.deployers[i].apply_results(conn.recv())
+        except EOFError:
+            # the child died before it could send anything
+            pass
+        conn.close()
+        del self.conns[i]
+
+    def wait(self, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            finished = []
+            for i, p in self.running.items():
+                if i in self.conns:
+                    self._receive(i)
+                if not p.is_alive():
+                    if i in self.conns:
+                        self._receive(i)
+                    p.join()
+                    del self.running[i]
+                    finished.append((i, p.exitcode))
+            if finished or (deadline and time.time() >= deadline):
+                return finished
+            time.sleep(POLL_INTERVAL_S)
+
+    def expire(self, indices):
+        for i in indices:
+            p = self.running.pop(i)
+            if p.is_alive():
+                # the child logs its stack on SIGUSR1, then exits
+                os.kill(p.pid, signal.SIGUSR1)
+                p.join(CANCEL_GRACE_S)
+            if p.is_alive():
+                p.terminate()
+            p.join()
+            conn = self.conns.pop(i, None)
+            if conn:
+                conn.close()
+
+    def cancel(self):
+        # the scheduler reaps the children that already finished first (see
+        # wait()).  any that finished since are cut off too, so that none is
+        # left unaccounted for.
+        cut = sorted(self.running)
+        for i, p in self.running.items():
+            if p.is_alive():
+                log.warn('Terminating %s' % self.deployers[i])
+                p.terminate()
+        for p in self.running.itervalues():
+            p.join(CANCEL_GRACE_S)
+        self.running.clear()
+        for conn in self.conns.itervalues():
+            conn.close()
+        self.conns.clear()
+        return cut
+
+
+# The deployers for the current PoolExecutor.  Pool workers inherit this when
+# they are forked, so jobs only need to send an index instead of pickling the
+# deployer (and its stack) for every job.
+_POOL_DEPLOYERS = []
+
+
+def _pool_run(i, action, inventory):
+    d = _POOL_DEPLOYERS[i]
+    multiprocessing.current_process().name = d.__class__.__name__
+    if inventory is not None:
+        d.stack.load_inventory(inventory)
+    return i, run_deployer(d, action), d.results
+
+
+class PoolExecutor(Executor):
+    """
+    Runs the deployers in a pool of pre-forked worker processes which are
+    reused from one deployer to the next.  Anything a worker caches (e.g.
+    provider sessions) survives between deployers.
+
+    The workers' copies of the stack inventory are as old as the pool, so
+    deployers that :attr:`~bang.deployers.deployer.Deployer.reads_inventory`
+    are sent a fresh copy with their job.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(PoolExecutor, self).__init__(*args, **kwargs)
+        self.results = Queue.Queue()
+        self.outstanding = set()
+        self.expired = set()
+        _POOL_DEPLOYERS[:] = self.deployers
+        self.pool = multiprocessing.Pool(
+                min(self.workers, len(self.deployers)) or 1
+                )
+
+    def submit(self, i):
+        d = self.deployers[i]
+        inventory = None
+        if d.reads_inventory:
+            inventory = d.stack.dump_inventory()
+        self.outstanding.add(i)
+        self.pool.apply_async(
+                _pool_run,
+                (i, self.action, inventory),
+                callback=self.results.put,
+                )
+
+    def wait(self, timeout=None):
+        try:
+            finished = [_get_results(self.results, timeout)]
+        except Queue.Empty:
+            return []
+        while not self.results.empty():
+            finished.append(self.results.get())
+        finished = [f for f in finished if f[0] not in self.expired]
+        for i, _, results in finished:
+            self.deployers[i].apply_results(results)
+        self.outstanding.difference_update(i for i, _, _ in finished)
+        return [(i, exitcode) for i, exitcode, _ in finished]
+
+    def expire(self, indices):
+        # there's no telling which worker is running a job, so the job is
+        # abandoned and its worker is lost to the pool
+        for i in indices:
+            log_stuck(self.deployers[i], None)
+            log.warn('Abandoning a pool worker to %s' % self.deployers[i])
+            self.outstanding.discard(i)
+            self.expired.add(i)
+
+    def cancel(self):
+        log.warn('Terminating worker pool')
+        self.pool.terminate()
+        cut = sorted(self.outstanding)
+        self.outstanding.clear()
+        return cut
+
+    def shutdown(self):
+        if self.expired:
+            # don't wait on the abandoned jobs
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        del _POOL_DEPLOYERS[:]
+
+
+class ThreadExecutor(Executor):
+    """
+    Runs the deployers in a pool of threads in the current process.  Most of
+    the deployers' time is spent waiting on blocking HTTP requests, so this
+    avoids the cost of forking without giving up much concurrency.
+
+    Threads can't be stopped, so a deployer that runs out of time keeps
+    running until its current phase returns (e.g. a provider call it is
+    blocked in may still go through).  It is marked as
+    :attr:`~bang.deployers.deployer.Deployer.expired`, so it runs no further
+    phases and its changes to the stack inventory are dropped, and its late
+    result is never reported.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(ThreadExecutor, self).__init__(*args, **kwargs)
+        self.jobs = Queue.Queue()
+        self.results = Queue.Queue()
+        self.outstanding = set()
+        self.cancelled = False
+        self.expired = set()
+        self.threads = []
+        self.current = {}
+        for n in range(min(self.workers, len(self.deployers))):
+            self._add_thread()
+
+    def _add_thread(self):
+        t = threading.Thread(
+                name='DeployerThread-%d' % len(self.threads),
+                target=self._work,
+                )
+        t.daemon = True
+        t.start()
+        self.threads.append(t)
+
+    def _work(self):
+        while True:
+            i = self.jobs.get()
+            if i is None:
+                break
+            if i in self.expired:
+                continue
+            self.current[i] = threading.current_thread().ident
+            self.results.put((i, run_deployer(self.deployers[i], self.action)))
+            if threading.current_thread() not in self.threads:
+                # it was abandoned, and a new thread took its place
+                break
+
+    def submit(self, i):
+        self.outstanding.add(i)
+        self.jobs.put(i)
+
+    def wait(self, timeout=None):
+        try:
+            finished = [_get_results(self.results, timeout)]
+        except Queue.Empty:
+            return []
+        while not self.results.empty():
+            finished.append(self.results.get())
+        # drop the late results of the deployers that ran out of time
+        finished = [f for f in finished if f[0] not in self.expired]
+        self.outstanding.difference_update(i for i, _ in finished)
+        return finished
+
+    def expire(self, indices):
+        # threads can't be killed either.  abandon them, and start new ones
+        # to take their place.
+        frames = sys._current_frames()
+        for i in indices:
+            self.outstanding.discard(i)
+            self.expired.add(i)
+            self.deployers[i].expired = True
+            ident = self.current.get(i)
+            if ident is None:
+                # still queued.  the worker that picks it up will skip it.
+                continue
+            log_stuck(self.deployers[i], frames.get(ident))
+            self.threads = [t for t in self.threads if t.ident != ident]
+            self._add_thread()
+
+    def cancel(self):
+        # threads can't be killed.  drop the queued jobs, and abandon the
+        # in-flight ones - the worker threads are daemons, so they won't keep
+        # bang alive once the main thread is done.
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except Queue.Empty:
+                break
+        self.cancelled = True
+        cut = sorted(self.outstanding)
+        self.outstanding.clear()
+        return cut
+
+    def shutdown(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        if self.cancelled:
+            return
+        for t in self.threads:
+            t.join()
+
+
+class InlineExecutor(Executor):
+    """
+    Runs the deployers one at a time in the current process, in the order in
+    which they were submitted.  This is meant for debugging (e.g. with
+    :mod:`pdb`).
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(InlineExecutor, self).__init__(*args, **kwargs)
+        self.queued = []
+
+    def submit(self, i):
+        self.queued.append(i)
+
+    def wait(self, timeout=None):
+        # the deployers run here, so there's nothing to time out
+        i = self.queued.pop(0)
+        return [(i, run_deployer(self.deployers[i], self.action))]
+
+    def cancel(self):
+        cut = self.queued
+        self.queued = []
+        return cut
+
+    def expire(self, indices):
+        pass
+
+
+EXECUTORS = {
+        'process': ProcessExecutor,
+        'pool': PoolExecutor,
+        'thread': ThreadExecutor,
+        'inline': InlineExecutor,
+        }
+
+
+def get_executor(name, deployers, action, workers=None):
+    """
+    Returns a new :class:`Executor` of the kind registered in
+    :data:`EXECUTORS` under :attr:`name`.
+
+    """
+    executor = EXECUTORS.get(name)
+    if not executor:
+        raise BangError(
+                "Unknown executor, %s.  Choose one of: %s"
+                % (name, ', '.join(sorted(EXECUTORS)))
+                )
+    return executor(deployers, action, workers)
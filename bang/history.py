@@ -0,0 +1,164 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+How long deployers took in past deploys, and what that predicts for the next
+one.
+
+Durations are kept in a small JSON file (``~/.bang/durations.json`` by
+default), keyed by deployer class, provider, region and instance type.  Each
+duration is also recorded under the less specific keys (e.g. just the deployer
+class and provider) so there is still an estimate for a new region or
+instance type.  Deployers that have never run fall back to
+:attr:`~bang.deployers.deployer.Deployer.expected_duration_s`.
+
+The :class:`~bang.scheduler.Scheduler` uses the estimates to start the
+deployers on the *critical path* (the longest chain of dependent deployers)
+first.
+
+"""
+import errno
+import json
+import os
+
+from .util import log
+
+
+#: Where durations are kept unless the ``history_file`` attribute of the
+#: ``scheduler`` config stanza says otherwise.
+DEFAULT_HISTORY_FILE = '~/.bang/durations.json'
+
+# weight of the newest duration in the moving average
+_ALPHA = 0.3
+
+
+def history_keys(deployer):
+    """
+    Returns the keys under which durations for :attr:`deployer` are recorded,
+    from most to least specific.
+
+    """
+    parts = [
+            deployer.__class__.__name__,
+            getattr(deployer, 'provider', None) or '',
+            getattr(deployer, 'region_name', None) or '',
+            getattr(deployer, 'instance_type', None) or '',
+            ]
+    return ['/'.join(parts[:n]) for n in range(len(parts), 0, -1)]
+
+
+class DurationHistory(object):
+    """Moving averages of past deployer durations, in seconds."""
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.durations = {}
+        try:
+            with open(self.path) as f:
+                self.durations = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            log.warn('Ignoring corrupt duration history, %s' % self.path)
+
+    def estimate(self, deployer):
+        """Returns the expected duration of :attr:`deployer`, in seconds."""
+        for key in history_keys(deployer):
+            entry = self.durations.get(key)
+            if entry:
+                return entry['mean']
+        return deployer.expected_duration_s
+
+    def record(self, deployer, seconds):
+        """Adds a duration for :attr:`deployer`.  Call :meth:`save` after."""
+        for key in history_keys(deployer):
+            entry = self.durations.get(key)
+            if entry:
+                entry['mean'] += _ALPHA * (seconds - entry['mean'])
+                entry['count'] += 1
+            else:
+                self.durations[key] = {'mean': seconds, 'count': 1}
+
+    def save(self):
+        """Writes the durations back to the history file."""
+        dirname = os.path.dirname(self.path)
+        try:
+            os.makedirs(dirname, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # write then rename so a concurrent bang never reads half a file
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.durations, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+def critical_path(estimates, deps):
+    """
+    Finds the longest chain of dependent deployers.
+
+    Returns a ``(remaining, path)`` tuple.  ``remaining[i]`` is the expected
+    time from the start of deployer ``i`` until the end of the longest chain
+    of deployers that depend on it, i.e. how urgently it should be started.
+    ``path`` is the :class:`list` of indices of the deployers on the critical
+    path, in order.
+
+    :param list estimates:  The expected duration of each deployer.
+
+    :param list deps:  The dependencies between the deployers as described in
+        :func:`~bang.deployers.get_deployer_graph`.
+
+    """
+    dependents = [[] for _ in deps]
+    for i, d in enumerate(deps):
+        for j in d:
+            dependents[j].append(i)
+
+    remaining = [None] * len(deps)
+    following = [None] * len(deps)
+
+    def visit(i):
+        # an explicit stack instead of recursion, in case of long chains
+        todo = [i]
+        while todo:
+            n = todo[-1]
+            waiting = [j for j in dependents[n] if remaining[j] is None]
+            if waiting:
+                todo.extend(waiting)
+                continue
+            todo.pop()
+            if remaining[n] is not None:
+                continue
+            after = None
+            for j in dependents[n]:
+                if after is None or remaining[j] > remaining[after]:
+                    after = j
+            following[n] = after
+            remaining[n] = estimates[n] + (
+                    remaining[after] if after is not None else 0
+                    )
+
+    for i in range(len(deps)):
+        visit(i)
+
+    path = []
+    if remaining:
+        n = max(range(len(deps)), key=lambda i: remaining[i])
+        while n is not None:
+            path.append(n)
+            n = following[n]
+    return remaining, path
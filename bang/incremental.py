@@ -0,0 +1,183 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Incremental deploys.
+
+After every successful deploy, bang saves the prepared config stanza of each
+resource in the stack, along with everything its deployers added to the stack
+inventory.  An incremental deploy (``bang --incremental``) compares the
+current config against that state, and only runs the deployers for resources
+that are new or changed, plus any resources that depend on them (e.g. the load
+balancer in front of a changed server class).  The inventory for everything
+else is restored from the saved state.
+
+The inventory is taken from the deploy :mod:`~bang.journal`, so incremental
+deploys need journaling to be enabled.
+
+"""
+import errno
+import hashlib
+import json
+import os
+
+from . import resources as R, attributes as A
+from .util import log
+
+
+#: Where deploy state is kept unless the ``state_dir`` attribute of the
+#: ``scheduler`` config stanza says otherwise.
+DEFAULT_STATE_DIR = '~/.bang/state'
+
+
+def _resource_key(res_type, name):
+    return '%s/%s' % (res_type, name)
+
+
+def _iter_resources(config):
+    for keys in R.STAGES:
+        for res_type in keys:
+            for res_config in config.get(res_type) or []:
+                yield res_type, res_config
+
+
+def resource_fingerprints(config):
+    """
+    Returns a :class:`dict` that maps each resource in :attr:`config`, as a
+    ``(res_type, name)`` tuple, to a hex digest of its config stanza.
+
+    Take the fingerprints *before* deploying:  the deployers add inventory
+    variables to the stanzas as they go.
+
+    """
+    return dict(
+            (
+                (res_type, res_config.get(A.NAME)),
+                hashlib.sha1(
+                    json.dumps(res_config, sort_keys=True, default=str)
+                    ).hexdigest(),
+                )
+            for res_type, res_config in _iter_resources(config)
+            )
+
+
+class DeployState(object):
+    """The resource configs and inventory from the last successful deploy."""
+    def __init__(self, path):
+        self.path = path
+        self.resources = {}
+        self.inventory = {}
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+            self.resources = raw['resources']
+            self.inventory = raw['inventory']
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except (ValueError, KeyError):
+            log.warn('Ignoring corrupt deploy state, %s' % path)
+
+    @classmethod
+    def for_stack(cls, config, state_dir=DEFAULT_STATE_DIR):
+        """
+        Returns the :class:`DeployState` for the stack described by
+        :attr:`config`.
+
+        """
+        state_dir = os.path.expanduser(state_dir)
+        fname = '%s-%s.json' % (config[A.NAME], config[A.VERSION])
+        return cls(os.path.join(state_dir, fname))
+
+    def exists(self):
+        return bool(self.resources)
+
+    def changed_resources(self, fingerprints):
+        """
+        Returns the :class:`set` of ``(res_type, name)`` tuples for the
+        resources that are new, or whose config differs from the last
+        successful deploy.
+
+        :param dict fingerprints:  The current resource fingerprints, as
+            returned by :func:`resource_fingerprints`.
+
+        """
+        return set(
+                res for res, fp in fingerprints.iteritems()
+                if self.resources.get(_resource_key(*res)) != fp
+                )
+
+    def restore_inventory(self, stack, skip):
+        """
+        Replays the saved inventory into :attr:`stack` for every resource in
+        the stack config except those in :attr:`skip`.
+
+        """
+        for res_type, res_config in _iter_resources(stack.config):
+            name = res_config.get(A.NAME)
+            if (res_type, name) in skip:
+                continue
+            effects = self.inventory.get(_resource_key(res_type, name), [])
+            for method, args in effects:
+                getattr(stack, method)(*args)
+
+    def save(self, fingerprints, entries, deployed):
+        """
+        Records the state after a successful deploy.
+
+        :param dict fingerprints:  The resource fingerprints of the config
+            that was deployed, as returned by :func:`resource_fingerprints`.
+
+        :param dict entries:  The deploy journal entries, as returned by
+            :meth:`bang.journal.Journal.load`.
+
+        :param set deployed:  The ``(res_type, name)`` tuples of the resources
+            that were deployed this time, or ``None`` if all of them were.
+            The saved inventory of the other resources is carried over.
+
+        """
+        effects = {}
+        for deployer_id in sorted(entries):
+            key = deployer_id.rsplit('/', 1)[0]
+            effects.setdefault(key, []).extend(entries[deployer_id]['effects'])
+
+        resources = {}
+        inventory = {}
+        for res, fp in fingerprints.iteritems():
+            key = _resource_key(*res)
+            resources[key] = fp
+            if deployed is not None and res not in deployed:
+                inventory[key] = self.inventory.get(key, [])
+                continue
+            inventory[key] = effects.get(key, [])
+        self.resources = resources
+        self.inventory = inventory
+
+        dirname = os.path.dirname(self.path)
+        try:
+            os.makedirs(dirname, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(
+                    {'resources': resources, 'inventory': inventory},
+                    f,
+                    default=str,
+                    )
+        os.rename(tmp_path, self.path)
@@ -14,6 +14,8 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import copy
+
 from .util import deep_merge_dicts
 import ansible.inventory
 from ansible.inventory.group import Group
@@ -44,6 +46,15 @@ def get_ansible_groups(group_map):
 
 
 class BangsibleInventory(ansible.inventory.Inventory):
+    """
+    An ansible inventory for the hosts in a bang stack.
+
+    :attr:`groups` and :attr:`hostvars` may be shared with other inventories
+    (see :meth:`bang.util.InventoryMap.snapshot`) and are never modified.
+    The vars of each host are copied the first time ansible asks for them,
+    because ansible modifies the vars it is given.
+
+    """
     def __init__(self, groups, hostvars):
         super(BangsibleInventory, self).__init__(None)
         self.groups = get_ansible_groups(groups)
@@ -54,6 +65,7 @@ class BangsibleInventory(ansible.inventory.Inventory):
         # BangsibleInventory, it already has all of the hostvars so we just set
         # the cache to be the hostvars dict.
         self._bang_vars_per_host = hostvars
+        self._bang_vars_copies = {}
 
     def is_file(self):
         return False
@@ -64,5 +76,10 @@ class BangsibleInventory(ansible.inventory.Inventory):
                 vault_password,
                 )
         if hostname not in ['127.0.0.1', 'localhost']:
-            deep_merge_dicts(hvars, self._bang_vars_per_host[hostname])
+            bang_vars = self._bang_vars_copies.get(hostname)
+            if bang_vars is None:
+                bang_vars = self._bang_vars_copies[hostname] = copy.deepcopy(
+                        self._bang_vars_per_host[hostname]
+                        )
+            deep_merge_dicts(hvars, bang_vars)
         return hvars
@@ -0,0 +1,196 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+On-disk journal of deployer progress, used to resume a failed deploy.
+
+As each deployer works through its
+:attr:`~bang.deployers.deployer.Deployer.phases`, it appends a *checkpoint*
+to the journal that records the phase it just finished, the attributes that
+capture its progress so far (e.g. the server ID and IPs), and anything it
+added to the stack inventory.
+
+When a deploy fails, the journal is left behind.  The next deploy of the same
+stack, with the same config, restores the checkpoints: completed deployers
+are not run again at all, and partially completed deployers pick up after
+their last checkpoint.  A successful deploy deletes the journal.
+
+A journal is identified by the stack name and version, plus a fingerprint of
+the stack resource definitions so that a changed config never resumes from
+stale checkpoints.
+
+"""
+import errno
+import hashlib
+import json
+import os
+
+from . import resources as R, attributes as A
+from .util import log
+
+
+#: Where journals are kept unless the ``journal_dir`` attribute of the
+#: ``scheduler`` config stanza says otherwise.
+DEFAULT_JOURNAL_DIR = '~/.bang/journal'
+
+
+def config_fingerprint(config):
+    """
+    Returns a hex digest of the stack resource definitions in :attr:`config`.
+
+    Only the resource stanzas are included, so changing e.g. credentials or
+    logging options does not invalidate a journal.
+
+    """
+    resources = dict(
+            (k, config[k]) for k in R.DYNAMIC_RESOURCE_KEYS if k in config
+            )
+    return hashlib.sha1(
+            json.dumps(resources, sort_keys=True, default=str)
+            ).hexdigest()
+
+
+class Journal(object):
+    """
+    An append-only file of JSON checkpoints, one per line.
+
+    Checkpoints are appended with a single ``write()`` on a file opened with
+    ``O_APPEND``, so concurrent deployer processes never interleave their
+    records.  A :class:`Journal` only holds the path to its file, so it is
+    cheap to pass to deployer processes.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_stack(cls, config, journal_dir=DEFAULT_JOURNAL_DIR):
+        """
+        Returns the :class:`Journal` for the stack described by
+        :attr:`config`.
+
+        :param config:  The stack config.
+        :type config:  :class:`bang.config.Config`
+
+        :param str journal_dir:  The directory in which to keep the journal.
+            Created if it does not exist.
+
+        """
+        journal_dir = os.path.expanduser(journal_dir)
+        try:
+            os.makedirs(journal_dir, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fname = '%s-%s-%s.journal' % (
+                config[A.NAME],
+                config[A.VERSION],
+                config_fingerprint(config)[:12],
+                )
+        return cls(os.path.join(journal_dir, fname))
+
+    def record(self, deployer_id, phase, state, effects, done):
+        """
+        Appends a checkpoint.
+
+        :param str deployer_id:  Identifies the deployer across bang runs.
+            See :attr:`bang.deployers.deployer.Deployer.deployer_id`.
+
+        :param int phase:  The index of the phase that just finished.
+
+        :param dict state:  The deployer attributes that capture its progress.
+
+        :param list effects:  The ``[method_name, args]`` pairs for the
+            stack inventory calls made since the previous checkpoint.
+
+        :param bool done:  ``True`` if this was the deployer's last phase.
+
+        """
+        line = json.dumps({
+                'deployer': deployer_id,
+                'phase': phase,
+                'state': state,
+                'effects': effects,
+                'done': done,
+                }, default=str) + '\n'
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def load(self):
+        """
+        Returns a :class:`dict` of the latest checkpoint for each deployer,
+        keyed by deployer ID.  The ``effects`` of each returned checkpoint are
+        accumulated from all of the deployer's checkpoints.
+
+        A truncated last line (e.g. from a killed process) is ignored.
+
+        """
+        entries = {}
+        try:
+            f = open(self.path)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return entries
+            raise
+        with f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    log.warn('Ignoring corrupt journal record: %r' % line)
+                    continue
+                prev = entries.get(rec['deployer'])
+                if prev:
+                    rec['effects'] = prev['effects'] + rec['effects']
+                entries[rec['deployer']] = rec
+        return entries
+
+    def restore(self, deployers):
+        """
+        Restores the checkpoints in this journal into :attr:`deployers` and
+        attaches the journal to them so they record new checkpoints.
+
+        Returns the :class:`set` of indices of the deployers that already
+        completed.
+
+        """
+        entries = self.load()
+        completed = set()
+        for i, d in enumerate(deployers):
+            d.journal = self
+            entry = entries.get(d.deployer_id)
+            if not entry:
+                continue
+            d.restore(entry)
+            if entry['done']:
+                completed.add(i)
+        if entries:
+            log.info(
+                    'Resuming from %s: %d of %d deployers already complete'
+                    % (self.path, len(completed), len(deployers))
+                    )
+        return completed
+
+    def discard(self):
+        """Deletes the journal file, if it exists."""
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
@@ -0,0 +1,145 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Pipelined deploy and configure.
+
+Normally ``bang`` deploys the whole stack, then configures all of the
+servers.  In pipelined mode (``bang --pipeline``, or the ``pipeline``
+attribute of the ``scheduler`` config stanza), the servers in each server
+class are configured as soon as all of the deployers for that class have
+completed, while the deployers for the rest of the stack (e.g. the load
+balancers) are still running.
+
+Each server class is configured in a process of its own with the playbooks
+in the ``playbooks`` attribute of its server config, or else the stack-wide
+``playbooks``, limited to the servers in that class.  Plays that target hosts
+outside of the stack inventory (e.g. ``localhost``) are skipped, and the
+playbooks for different server classes may run at the same time, so their
+output can be interleaved.
+
+Server classes that had nothing to deploy (e.g. those that were unchanged in
+an incremental deploy) are configured once the deploy has completed.
+
+"""
+import multiprocessing
+import sys
+
+from . import BangError, resources as R
+from .util import log
+
+
+def _configure(stack, hosts, playbooks):
+    try:
+        stack.run_playbooks(hosts, playbooks)
+    except Exception:
+        log.exception('Configuring %s failed.' % ', '.join(hosts))
+        sys.exit(1)
+
+
+class ConfigurePipeline(object):
+    """Configures each server class as soon as its deployers complete."""
+    def __init__(self, stack, deployers, completed=()):
+        """
+        :param stack:  The stack being deployed.
+        :type stack:  :class:`~bang.stack.Stack`
+
+        :param list deployers:  The deployers being run for :attr:`stack`.
+
+        :param completed:  The indices of the deployers in :attr:`deployers`
+            that already completed in an earlier run.
+
+        """
+        self.stack = stack
+        self.classes = {}
+        self.pending = {}
+        for i, d in enumerate(deployers):
+            if d.res_type == R.SERVERS:
+                self.classes[i] = d.name
+                self.pending.setdefault(d.name, set()).add(i)
+
+        #: The hosts that have been handed to a configure process
+        self.configured = set()
+
+        #: Maps each running configure process to its server class
+        self.running = {}
+
+        #: The server classes that failed to configure
+        self.failed = []
+
+        for i in completed:
+            self.deployer_done(i)
+
+    def deployer_done(self, i):
+        """
+        Marks the deployer at index :attr:`i` as completed, and starts
+        configuring its server class if it was the last one in the class.
+
+        """
+        name = self.classes.get(i)
+        if name is None:
+            return
+        pending = self.pending[name]
+        pending.discard(i)
+        if not pending:
+            self._start(name)
+
+    def _start(self, name):
+        self._reap()
+        hosts = [
+                h for h in self.stack.get_class_hosts(name)
+                if h not in self.configured
+                ]
+        if not hosts:
+            return
+        self.configured.update(hosts)
+        log.info('Configuring %s servers...' % name)
+        p = multiprocessing.Process(
+                name='configure %s' % name,
+                target=_configure,
+                args=(self.stack, hosts, self.stack.get_class_playbooks(name)),
+                )
+        p.start()
+        self.running[p] = name
+
+    def _reap(self, block=False):
+        for p, name in self.running.items():
+            if not block and p.is_alive():
+                continue
+            p.join()
+            del self.running[p]
+            if p.exitcode != 0:
+                self.failed.append(name)
+
+    def finish(self, deployed):
+        """
+        Waits for the configure processes to finish.  If :attr:`deployed`,
+        then configures the servers that have not been configured yet.
+
+        Raises :class:`~bang.BangError` if any server class failed to
+        configure.  If the deploy failed, the deploy error is left for the
+        caller to raise.
+
+        """
+        self._reap(block=True)
+        if not deployed:
+            return
+        if self.failed:
+            raise BangError(
+                    'Server configuration failed for: %s'
+                    % ', '.join(sorted(self.failed))
+                    )
+        self.stack.configure(skip=self.configured)
@@ -14,6 +14,8 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import json
+
 from .aws import AWS
 
 PROVIDER_MAP = {
@@ -42,7 +44,9 @@ _PROVIDERS = {}
 def get_provider(name, creds):
     """
     Generates and memoizes a :class:`~bang.providers.provider.Provider` object
-    for the given name.
+    for the given name and credentials.  All of the stacks deployed by one
+    bang process share the provider objects (and thus their sessions and
+    caches) as long as they use the same credentials.
 
     :param str name:  The provider name, as given in the config stanza.  This
         token is used to find the
@@ -54,7 +58,8 @@ def get_provider(name, creds):
     :rtype:  :class:`~bang.providers.provider.Provider`
 
     """
-    p = _PROVIDERS.get(name)
+    key = (name, json.dumps(creds, sort_keys=True, default=str))
+    p = _PROVIDERS.get(key)
     if not p:
         provider = PROVIDER_MAP.get(name)
         if not provider:
@@ -64,5 +69,6 @@ def get_provider(name, creds):
                     "release notes."
             raise Exception("No provider matches %s; check imports" % name)
         p = provider(creds)
-        _PROVIDERS[name] = p
+        p.name = name
+        _PROVIDERS[key] = p
     return p
@@ -20,12 +20,16 @@ from boto.exception import EC2ResponseError
 import time
 
 from .. import BangError, TimeoutError, resources as R, attributes as A
-from ..util import log, poll_with_timeout
-from .bases import Provider, Consul
+from ..util import Backoff, log, poll_with_timeout
+from ..waiter import Waiter
+from .bases import Provider, Consul, throttled
 
 
 DEFAULT_TIMEOUT_S = 120
 
+#: The polling schedule for launching instances.
+WAIT_BACKOFF = Backoff(2, max_s=15)
+
 
 def server_to_dict(server):
     """
@@ -37,6 +41,7 @@ def server_to_dict(server):
     """
     return {
             A.server.ID: server.id,
+            A.server.IMAGE_ID: server.image_id,
             A.server.PUBLIC_IPS: [server.public_dns_name],
             A.server.PRIVATE_IPS: [server.private_dns_name],
             }
@@ -122,14 +127,41 @@ class EC2(Consul):
             self._ec2 = boto.connect_ec2(self.access_key_id, self.secret_key)
         return self._ec2
 
+    def get_waiter(self):
+        """
+        Returns the :class:`~bang.waiter.Waiter` that polls for the instances
+        launched in this consul's region.
+
+        """
+        def describe(instance_ids):
+            self.throttle()
+            # unlike ``instance_ids``, the filter doesn't fail the whole
+            # request if EC2 doesn't know about a new instance yet
+            return dict(
+                    (i.id, i)
+                    for r in self.ec2.get_all_instances(
+                        filters={'instance-id': instance_ids},
+                        )
+                    for i in r.instances
+                    )
+        return self.provider.get_cached(
+                ('ec2 waiter', self.region_name),
+                lambda: Waiter(describe, WAIT_BACKOFF),
+                )
+
     def set_region(self, region_name):
         log.debug("Setting region to %s" % region_name)
-        self._ec2 = boto.ec2.connect_to_region(
-                region_name,
-                aws_access_key_id=self.access_key_id,
-                aws_secret_access_key=self.secret_key,
+        self.region_name = region_name
+        self._ec2 = self.provider.get_cached(
+                ('ec2', region_name),
+                lambda: boto.ec2.connect_to_region(
+                    region_name,
+                    aws_access_key_id=self.access_key_id,
+                    aws_secret_access_key=self.secret_key,
+                    ),
                 )
 
+    @throttled
     def find_servers(self, tags, running=True):
         """
         Returns any servers in the region that have tags that match the
@@ -139,7 +171,8 @@ class EC2(Consul):
             names and the values are the tag values.
 
         :param bool running:  A flag to limit server list to instances that are
-            actually *running*.
+            actually *running*.  Otherwise, instances that are still pending
+            are included too.
 
         :rtype:  :class:`list` of :class:`dict` objects.  Each :class:`dict`
             describes a single server instance.
@@ -148,6 +181,8 @@ class EC2(Consul):
         filters = dict([('tag:%s' % key, val) for key, val in tags.items()])
         if running:
             filters['instance-state-name'] = 'running'
+        else:
+            filters['instance-state-name'] = ['pending', 'running']
 
         res = self.ec2.get_all_instances(filters=filters)
         instances = [server_to_dict(i) for r in res for i in r.instances]
@@ -157,9 +192,32 @@ class EC2(Consul):
     def find_running(self, server_attrs, timeout_s):
         return server_attrs
 
+    def find_all_running(self, servers, timeout_s):
+        """
+        Waits for all of :attr:`servers` to be running, with a single
+        registration on the :class:`~bang.waiter.Waiter`.
+
+        :param list servers:  The :class:`dict` representations of the
+            servers, as returned by :meth:`find_servers`.
+
+        :param float timeout_s:  The number of seconds to wait.
+
+        :rtype:  :class:`list` of :class:`dict`
+
+        """
+        running = self.get_waiter().wait(
+                [s[A.server.ID] for s in servers],
+                timeout_s,
+                lambda i: i.state == 'running',
+                )
+        if not running:
+            raise TimeoutError('Servers not running within allotted time.')
+        return [server_to_dict(i) for i in running]
+
     def create_server(self, basename, disk_image_id, instance_type,
             ssh_key_name, tags=None, availability_zone=None,
-            timeout_s=DEFAULT_TIMEOUT_S, **provider_extras):
+            timeout_s=DEFAULT_TIMEOUT_S, client_token=None,
+            **provider_extras):
         """
         Creates a new server instance.  This call blocks until the server is
         created and available for normal use, or :attr:`timeout_s` has elapsed.
@@ -188,44 +246,110 @@ class EC2(Consul):
             server before failing.  Defaults to ``0`` (i.e. Expect server to be
             active immediately).
 
+        :param str client_token:  An idempotency token for the launch.  A
+            retried launch with the same token returns the instances of the
+            first launch instead of launching new ones.
+
         :rtype:  :class:`dict`
 
+        """
+        return self.create_servers(
+                1,
+                basename,
+                disk_image_id,
+                instance_type,
+                ssh_key_name,
+                tags=tags,
+                availability_zone=availability_zone,
+                timeout_s=timeout_s,
+                client_token=client_token,
+                **provider_extras
+                )[0]
+
+    @throttled
+    def create_servers(self, count, basename, disk_image_id, instance_type,
+            ssh_key_name, tags=None, availability_zone=None,
+            timeout_s=DEFAULT_TIMEOUT_S, client_token=None,
+            **provider_extras):
+        """
+        Launches :attr:`count` identical server instances with a single
+        ``RunInstances`` request, tags them all at once, and waits for all of
+        them to be running.
+
+        Takes the same arguments as :meth:`create_server`.
+
+        :param int count:  The number of instances to launch.  EC2 launches
+            either all of them or none.
+
+        :rtype:  :class:`list` of :class:`dict`
+
         """
         log.info(
-                'Launching server %s... this could take a while...'
-                % basename
+                'Launching %d %s server(s)... this could take a while...'
+                % (count, basename)
                 )
+        if client_token:
+            provider_extras['client_token'] = client_token
         res = self.ec2.run_instances(
                 disk_image_id,
+                min_count=count,
+                max_count=count,
                 instance_type=instance_type,
                 key_name=ssh_key_name,
                 placement=availability_zone,
                 disable_api_termination=True,
                 **provider_extras
                 )
-        instance = res.instances[0]
+        instance_ids = [i.id for i in res.instances]
 
         # we're too fast for EC2... slow down a little bit, twice
         time.sleep(2)
 
         def apply_tags():
+            self.throttle()
             try:
-                for key, val in tags.items():
-                    instance.add_tag(key, val)
+                self.ec2.create_tags(instance_ids, tags or {})
                 return True
             except EC2ResponseError:
                 pass
-        if not poll_with_timeout(timeout_s, apply_tags, 5):
-            raise TimeoutError('Could not tag server %s' % instance.id)
-
-        def find_running_instance():
-            if instance.update() == 'running':
-                return instance
-        running = poll_with_timeout(timeout_s, find_running_instance, 5)
+        if tags and not poll_with_timeout(
+                timeout_s,
+                apply_tags,
+                Backoff(1, max_s=5),
+                ):
+            raise TimeoutError(
+                    'Could not tag servers %s' % ', '.join(instance_ids)
+                    )
+
+        running = self.get_waiter().wait(
+                instance_ids,
+                timeout_s,
+                lambda i: i.state == 'running',
+                )
         if not running:
             raise TimeoutError('Could not launch server within allotted time.')
-        return server_to_dict(running)
+        return [server_to_dict(i) for i in running]
+
+    @throttled
+    def delete_server(self, server_id):
+        """
+        Terminates a server instance.
+
+        bang launches servers with termination protection, so that is turned
+        off first.
+
+        :param str server_id:  The instance ID.
+
+        """
+        log.info('Terminating server, %s' % server_id)
+        self.ec2.modify_instance_attribute(
+                server_id,
+                'disableApiTermination',
+                False,
+                )
+        self.ec2.terminate_instances([server_id])
 
+    @throttled
     def find_secgroup(self, name):
         """
         Find a security group by name.
@@ -238,6 +362,7 @@ class EC2(Consul):
         if res:
             return EC2SecGroup(res[0])
 
+    @throttled
     def create_secgroup(self, name, description):
         """
         Creates a new server security group.
@@ -249,6 +374,7 @@ class EC2(Consul):
         return self.ec2.create_security_group(name, description)
         log.debug("... created group %s" % name)
 
+    @throttled
     def create_secgroup_rule(self, protocol, from_port, to_port,
             source, target):
         """
@@ -277,6 +403,7 @@ class EC2(Consul):
             kwargs['src_group'] = self.find_secgroup(source).ec2sg
         sg.authorize(**kwargs)
 
+    @throttled
     def delete_secgroup_rule(self, rule_def):
         """Deletes the security group rule identified by :attr:`rule_def`"""
         sg = rule_def.pop('target')
@@ -302,12 +429,17 @@ class S3(Consul):
 
     def set_region(self, region_name):
         log.debug("Setting region to %s" % region_name)
-        self._s3 = boto.s3.connect_to_region(
-                region_name,
-                aws_access_key_id=self.access_key_id,
-                aws_secret_access_key=self.secret_key,
+        self.region_name = region_name
+        self._s3 = self.provider.get_cached(
+                ('s3', region_name),
+                lambda: boto.s3.connect_to_region(
+                    region_name,
+                    aws_access_key_id=self.access_key_id,
+                    aws_secret_access_key=self.secret_key,
+                    ),
                 )
 
+    @throttled
     def create_bucket(self, name):
         """
         Creates a new S3 bucket.
@@ -16,19 +16,60 @@
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
 import random
 import string
+from functools import wraps
+
+from ..throttle import throttle
 
 # at least RDS appears to force lowercase even if you pass in mixed case
 _AWS_NAME_CHARS = string.lowercase + string.digits
 
 
+def throttled(f):
+    """
+    Decorator for consul methods that send requests to the provider.  Blocks
+    until the rate limits for the consul's provider and region allow another
+    request.  See :mod:`bang.throttle`.
+
+    """
+    @wraps(f)
+    def new_f(self, *args, **kwargs):
+        self.throttle()
+        return f(self, *args, **kwargs)
+    return new_f
+
+
 class Provider(object):
     """The base class for all providers."""
+
+    #: The name under which this provider was requested from
+    #: :func:`~bang.providers.get_provider`.  Used to look up rate limits.
+    name = None
+
     def __init__(self, creds):
         self.creds = creds
 
         # Minimal attempt to prevent obvious postfix duplication
         self.component_names = []
 
+        self._cache = {}
+
+    def get_cached(self, key, func):
+        """
+        Returns the value cached under :attr:`key`, calling :attr:`func` to
+        produce it on the first request.
+
+        Use this for connections, and for discovery results that don't change
+        during a deploy (e.g. regions and instance types), so that all of the
+        deployers that run in the same process share them - even deployers
+        from different stacks.
+
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = func()
+            return value
+
     def gen_component_name(self, basename, postfix_length=13):
         """
         Creates a resource identifier with a random postfix.  This is an
@@ -78,3 +119,15 @@ class Consul(object):
 
     def __init__(self, provider):
         self.provider = provider
+        self.region_name = None
+
+    def throttle(self):
+        """
+        Blocks until the rate limits for this consul's provider and region
+        allow another request.
+
+        Call this before each request made in a polling loop.  For simple
+        one-shot requests, use the :func:`throttled` decorator instead.
+
+        """
+        throttle(self.provider.name, self.region_name)
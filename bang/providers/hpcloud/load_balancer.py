@@ -1,5 +1,6 @@
 import requests
 import json
+from ...throttle import throttle
 from ...util import log
 
 class HPLoadBalancer():
@@ -19,6 +20,8 @@ class HPLoadBalancer():
         Provide a management URL (from the openstack service catalog)
         and auth token (which can be pinched from novaclient)
         """
+        self.provider = hpcloud
+        self.region_name = None
         self.auth_token = hpcloud.os_auth_token
         self.catalog = filter(lambda c: c['name'] == 'Load Balancer', 
                               hpcloud.os_catalog['access']['serviceCatalog'])
@@ -26,6 +29,7 @@ class HPLoadBalancer():
         self.management_url = None
 
     def set_region(self, region_name):
+        self.region_name = region_name
         region_lb = filter(lambda c: c['region'] == region_name,
                                    self.catalog[0]['endpoints'])
         if not region_lb:
@@ -212,6 +216,7 @@ class HPLoadBalancer():
     def _request(self, method, url, data=None, **kwargs):
         if not self.management_url:
             raise Exception("Call set_region first")
+        throttle(self.provider.name, self.region_name)
         kwargs.setdefault('headers', {})['X-Auth-Token'] = self.auth_token
         kwargs.setdefault('headers', {})['Content-Type'] = 'application/json'
         if data:
@@ -50,6 +50,18 @@ class HPNova(Nova):
     def create_server(self, *args, **kwargs):
         """
         Wraps :meth:`bang.providers.openstack.Nova.create_server` to apply
+        hpcloud specialization.  See :meth:`create_servers`.
+
+        """
+        # Don't create an explicit floating IP; gets one 
+        # automatically
+        if 'floating_ip' not in kwargs:
+            kwargs['floating_ip'] = False
+        return super(HPNova, self).create_server(*args, **kwargs)
+
+    def create_servers(self, *args, **kwargs):
+        """
+        Wraps :meth:`bang.providers.openstack.Nova.create_servers` to apply
         hpcloud specialization, namely pulling IP addresses from the hpcloud's
         non-standard return values.
 
@@ -63,12 +75,20 @@ class HPNova(Nova):
                 tags.get(A.tags.STACK, ''),
                 tags.get(A.tags.ROLE, ''),
                 ])
-        # Don't create an explicit floating IP; gets one 
-        # automatically
         if 'floating_ip' not in kwargs:
             kwargs['floating_ip'] = False
-        s = super(HPNova, self).create_server(*args, **kwargs)
-        return fix_hp_addrs(s)
+        servers = super(HPNova, self).create_servers(*args, **kwargs)
+        return map(fix_hp_addrs, servers)
+
+    def find_all_running(self, *args, **kwargs):
+        """
+        Wraps :meth:`bang.providers.openstack.Nova.find_all_running` to apply
+        hpcloud specialization, namely pulling IP addresses from the hpcloud's
+        non-standard return values.
+
+        """
+        servers = super(HPNova, self).find_all_running(*args, **kwargs)
+        return map(fix_hp_addrs, servers)
 
 
 class HPCloudV12(HPCloud):
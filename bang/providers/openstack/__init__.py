@@ -14,19 +14,27 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import threading
 from functools import wraps
 from novaclient.client import Client as NovaClient
 from swiftclient.client import Connection as SwiftConn
 from reddwarfclient import Dbaas
 
 from ... import BangError, TimeoutError, resources as R, attributes as A
-from ...util import log, poll_with_timeout
-from ..bases import Provider, Consul
+from ...util import Backoff, log, poll_with_timeout
+from ...waiter import Waiter
+from ..bases import Provider, Consul, throttled
 
 
 DEFAULT_TIMEOUT_S = 120
 DEFAULT_STORAGE_SIZE_GB = 20
 
+#: The polling schedule for launching servers.
+WAIT_BACKOFF = Backoff(2, max_s=15)
+
+# metadata key that identifies the servers launched by a single request
+LAUNCH_TAG = 'bang_launch'
+
 
 def server_to_dict(server):
     """
@@ -62,11 +70,28 @@ def server_to_dict(server):
 
     return {
             A.server.ID: server.id,
+            # servers booted from a volume have no image
+            A.server.IMAGE_ID: (server.image or {}).get('id'),
             A.server.PUBLIC_IPS: [a['addr'] for a in pub],
             A.server.PRIVATE_IPS: [a['addr'] for a in priv],
             }
 
 
+def has_floating_ip(server):
+    """
+    Returns ``True`` if a floating IP is already associated with
+    :attr:`server`.
+
+    """
+    if server.addresses.get('public'):
+        return True
+    return any(
+            a.get('OS-EXT-IPS:type') == 'floating'
+            for addresses in server.addresses.itervalues()
+            for a in addresses
+            )
+
+
 def db_to_dict(db):
     """
     Returns the :class:`dict` representation of a database object.
@@ -124,7 +149,46 @@ class Nova(Consul):
         super(Nova, self).__init__(*args, **kwargs)
         self.nova = self.provider.nova_client
 
+    def get_waiter(self, by_id=False):
+        """
+        Returns the :class:`~bang.waiter.Waiter` that polls for the servers
+        launched in this consul's region.  The servers are grouped by the
+        name of the launch request that started them.
+
+        :param bool by_id:  Return the waiter that polls for single servers
+            by id instead.
+
+        """
+        region_name = self.region_name
+        def list_servers():
+            self.throttle()
+            # the client is shared with the consuls for every other region
+            with self.provider.region_lock:
+                self._point_at_region(region_name)
+                return self.nova.servers.list()
+        def describe_ids(ids):
+            return dict((s.id, s) for s in list_servers())
+        def describe(names):
+            launches = dict((name, []) for name in names)
+            for s in list_servers():
+                launch = launches.get(s.metadata.get(LAUNCH_TAG))
+                if launch is not None:
+                    launch.append(s)
+            return launches
+        return self.provider.get_cached(
+                ('nova waiter', self.region_name, by_id),
+                lambda: Waiter(
+                    describe_ids if by_id else describe,
+                    WAIT_BACKOFF,
+                    ),
+                )
+
     def set_region(self, region_name):
+        self.region_name = region_name
+        with self.provider.region_lock:
+            self._point_at_region(region_name)
+
+    def _point_at_region(self, region_name):
         client = self.nova.client
         management_url = client.service_catalog.url_for(
             attr='region',
@@ -133,6 +197,7 @@ class Nova(Consul):
             )
         client.set_management_url(management_url.rstrip('/'))
 
+    @throttled
     def find_ssh_pub_key(self, name):
         """
         Returns ``True`` if an SSH key named :attr:`name` is found.
@@ -144,6 +209,7 @@ class Nova(Consul):
         """
         return bool(self.nova.keypairs.findall(name=name))
 
+    @throttled
     def create_ssh_pub_key(self, name, key):
         """
         Installs the public SSH key under the name :attr:`name`.
@@ -154,6 +220,7 @@ class Nova(Consul):
         """
         self.nova.keypairs.create(name, key)
 
+    @throttled
     def find_servers(self, tags, running=True):
         """
         Returns any servers in the region that have tags that match the
@@ -163,7 +230,8 @@ class Nova(Consul):
             names and the values are the tag values.
 
         :param bool running:  A flag to limit server list to instances that are
-            actually *running*.
+            actually *running*.  Otherwise, instances that are still being
+            built are included too.
 
         :rtype:  :class:`list` of :class:`dict` objects.  Each :class:`dict`
             describes a single server instance.
@@ -176,6 +244,8 @@ class Nova(Consul):
         all_servers = self.nova.servers.list(search_opts=search_opts)
         servers = []
         for s in all_servers:
+            if s.status not in ('ACTIVE', 'BUILD'):
+                continue
             md = s.metadata
             mismatches = [k for k, v in tags.items() if v != md.get(k)]
             if mismatches:
@@ -186,10 +256,32 @@ class Nova(Consul):
     def find_running(self, server_attrs, timeout_s):
         return server_attrs
 
+    def find_all_running(self, servers, timeout_s):
+        """
+        Waits for all of :attr:`servers` to be active, with a single
+        registration on the :class:`~bang.waiter.Waiter` for their ids.
+
+        :param list servers:  The :class:`dict` representations of the
+            servers, as returned by :meth:`find_servers`.
+
+        :param float timeout_s:  The number of seconds to wait.
+
+        :rtype:  :class:`list` of :class:`dict`
+
+        """
+        active = self.get_waiter(by_id=True).wait(
+                [s[A.server.ID] for s in servers],
+                timeout_s,
+                lambda s: s.status == 'ACTIVE',
+                )
+        if not active:
+            raise TimeoutError('Servers not active within allotted time.')
+        return [server_to_dict(s) for s in active]
+
     def create_server(self, basename, disk_image_id, instance_type,
             ssh_key_name, tags=None, availability_zone=None,
             timeout_s=DEFAULT_TIMEOUT_S, floating_ip=True,
-            **kwargs):
+            client_token=None, **kwargs):
         """
         Creates a new server instance.  This call blocks until the server is
         created and available for normal use, or :attr:`timeout_s` has elapsed.
@@ -223,44 +315,120 @@ class Nova(Consul):
             openstack 13.5 this doesn't happen automatically, so only
             don't do it if you know what you're doing)
 
+        :param str client_token:  An idempotency token for the launch.  A
+            retried launch with the same token waits for the servers of the
+            first launch instead of launching new ones.
 
         :rtype:  :class:`dict`
 
         """
-        nova = self.nova
-        name = self.provider.gen_component_name(basename)
-        log.info('Launching server %s... this could take a while...' % name)
-        flavor = nova.flavors.find(name=instance_type)
-        server = nova.servers.create(
-                name,
+        return self.create_servers(
+                1,
+                basename,
                 disk_image_id,
-                flavor,
-                key_name=ssh_key_name,
-                meta=tags,
+                instance_type,
+                ssh_key_name,
+                tags=tags,
                 availability_zone=availability_zone,
+                timeout_s=timeout_s,
+                floating_ip=floating_ip,
+                client_token=client_token,
                 **kwargs
-                )
+                )[0]
 
-        def find_active():
-            s = nova.servers.get(server.id)
-            if s and s.status == 'ACTIVE':
-                return s
+    @throttled
+    def create_servers(self, count, basename, disk_image_id, instance_type,
+            ssh_key_name, tags=None, availability_zone=None,
+            timeout_s=DEFAULT_TIMEOUT_S, floating_ip=True,
+            client_token=None, **kwargs):
+        """
+        Launches :attr:`count` identical server instances with a single
+        request, and waits for all of them to be active.
 
-        instance = poll_with_timeout(timeout_s, find_active, 5)
-        if not instance:
+        Takes the same arguments as :meth:`create_server`.
+
+        :param int count:  The number of instances to launch.  Nova launches
+            either all of them or none.
+
+        :rtype:  :class:`list` of :class:`dict`
+
+        """
+        nova = self.nova
+        if client_token:
+            # nova has no idempotency tokens, so the launch tag stands in for
+            # one
+            name = '%s-%s' % (basename, client_token[:13])
+        else:
+            name = self.provider.gen_component_name(basename)
+
+        if client_token and any(
+                s.metadata.get(LAUNCH_TAG) == name
+                for s in nova.servers.list()
+                ):
+            log.info('Servers %s were already launched' % name)
+        else:
+            log.info(
+                    'Launching %d server(s) as %s... this could take a '
+                    'while...' % (count, name)
+                    )
+            flavor = self.provider.get_cached(
+                    ('flavor', self.region_name, instance_type),
+                    lambda: nova.flavors.find(name=instance_type),
+                    )
+
+            # nova only returns the first server of a multi-server request,
+            # so tag the whole batch to find the rest of them.
+            meta = dict(tags or {})
+            meta[LAUNCH_TAG] = name
+            nova.servers.create(
+                    name,
+                    disk_image_id,
+                    flavor,
+                    key_name=ssh_key_name,
+                    meta=meta,
+                    availability_zone=availability_zone,
+                    min_count=count,
+                    max_count=count,
+                    **kwargs
+                    )
+
+        def is_active(servers):
+            return len(servers) == count and all(
+                    s.status == 'ACTIVE' for s in servers
+                    )
+
+        launched = self.get_waiter().wait([name], timeout_s, is_active)
+        if not launched:
             raise TimeoutError(
-                    'Server %s failed to launch within allotted time.'
-                    % server.id
+                    'Servers %s failed to launch within allotted time.' % name
                     )
 
+        instances = launched[0]
         if floating_ip:
-            log.info('Creating floating ip for %s', name)
-            floating_ip = nova.floating_ips.create()
-            server.add_floating_ip(floating_ip)
-            log.info('Created floating ip %s for %s', floating_ip.ip, name)
+            for server in instances:
+                if has_floating_ip(server):
+                    # allocated by an earlier attempt at this launch
+                    continue
+                self.throttle()
+                log.info('Creating floating ip for %s', server.name)
+                ip = nova.floating_ips.create()
+                server.add_floating_ip(ip)
+                log.info('Created floating ip %s for %s', ip.ip, server.name)
+
+        return [server_to_dict(i) for i in instances]
+
+    @throttled
+    def delete_server(self, server_id):
+        """
+        Deletes a server instance.
+
+        :param str server_id:  The server ID.
 
-        return server_to_dict(instance)
+        """
+        log.info('Deleting server, %s' % server_id)
+        self.nova.servers.delete(server_id)
 
+    @throttled
     def find_secgroup(self, name):
         """
         Find a security group by name.
@@ -273,6 +441,7 @@ class Nova(Consul):
         if groups:
             return NovaSecGroup(groups[0])
 
+    @throttled
     def create_secgroup(self, name, desc):
         """
         Creates a new server security group.
@@ -283,6 +452,7 @@ class Nova(Consul):
         """
         self.nova.security_groups.create(name, desc)
 
+    @throttled
     def create_secgroup_rule(self, protocol, from_port, to_port,
             source, target):
         """
@@ -318,17 +488,20 @@ class Nova(Consul):
             kwargs['cidr'] = 'null'
         nova.security_group_rules.create(**kwargs)
 
+    @throttled
     def delete_secgroup_rule(self, rule_id):
         """Deletes the security group rule identified by :attr:`rule_id`"""
         self.nova.security_group_rules.delete(rule_id)
 
 
 class Swift(Consul):
+    @throttled
     def find_buckets(self, prefix):
         _, buckets = self.provider.swift_client.get_account(prefix=prefix)
         # TODO: standardize the return value across providers
         return buckets
 
+    @throttled
     def create_bucket(self, name, headers=None):
         """
         Creates a bucket named :attr:`name`.
@@ -340,6 +513,7 @@ class Swift(Consul):
 
 
 class RedDwarf(Consul):
+    @throttled
     def find_db_instance(self, name, running=True):
         """
         Searches for a db instance named :attr:`name`.
@@ -363,6 +537,7 @@ class RedDwarf(Consul):
             log.info("Found existing db, %s (%s)" % (found.name, found.id))
             return db_to_dict(found)
 
+    @throttled
     def _create_db(self, instance_name, instance_type,
             storage_size_gb):
         rd = self.provider.reddwarf_client
@@ -381,11 +556,16 @@ class RedDwarf(Consul):
         log.info('Polling for db status...')
 
         def find_active():
+            self.throttle()
             i = self.provider.reddwarf_client.instances.get(db.id)
             if i and i.status == 'running':
                 return i
 
-        instance = poll_with_timeout(timeout_s, find_active, 20)
+        instance = poll_with_timeout(
+                timeout_s,
+                find_active,
+                Backoff(5, max_s=30),
+                )
         if not instance:
             raise TimeoutError(
                     'DB %s failed to launch within allotted time.' % db.id
@@ -461,6 +641,9 @@ class OpenStack(Provider):
 
     def __init__(self, creds):
         super(OpenStack, self).__init__(creds)
+
+        #: Held while pointing the shared nova client at a region.
+        self.region_lock = threading.Lock()
         self._client = None
         self._swift = None
         self._reddwarf = None
@@ -1,14 +1,17 @@
 import rightscale
-import time
 
 from requests import HTTPError
 from .. import TimeoutError, resources as R, attributes as A
-from ..util import log, poll_with_timeout
-from .bases import Provider, Consul
+from ..util import Backoff, log
+from ..waiter import Waiter
+from .bases import Provider, Consul, throttled
 
 # because rs is slower than aws and aws' default is 120
 DEFAULT_TIMEOUT_S = 180
 
+#: The polling schedule for launching instances.
+WAIT_BACKOFF = Backoff(5, max_s=30)
+
 
 def server_to_dict(server):
     """
@@ -89,14 +92,18 @@ class Servers(Consul):
     def __init__(self, *args, **kwargs):
         super(Servers, self).__init__(*args, **kwargs)
         creds = self.provider.creds
-        self.api = rightscale.RightScale(
-                api_endpoint=creds[A.creds.API_ENDPOINT],
-                refresh_token=creds[A.creds.REFRESH_TOKEN],
+        self.api = self.provider.get_cached(
+                'api',
+                lambda: rightscale.RightScale(
+                    api_endpoint=creds[A.creds.API_ENDPOINT],
+                    refresh_token=creds[A.creds.REFRESH_TOKEN],
+                    ),
                 )
         self.region_name = ''
         self._cloud = None
         self.deployment = None
 
+    @throttled
     def create_stack(self, name):
         """
         Creates stack if necessary.
@@ -115,7 +122,10 @@ class Servers(Consul):
                         'RightScale returned %d:\n%s'
                         % (name, e.response.status_code, e.response.content)
                         )
+            deployment = find_exact(self.api.deployments, name=name)
+        self.deployment = deployment
 
+    @throttled
     def find_servers(self, tags, running=True):
         # TODO: make stack and role be explicit args to find_servers instead of
         # {'stack': 'foo', 'role': 'bar'}
@@ -133,6 +143,9 @@ class Servers(Consul):
                 self.api.deployments,
                 name=tags[A.STACK],
                 )
+        if not self.deployment:
+            # the stack hasn't been created yet
+            return []
         filters.append('deployment_href==' + self.deployment.href)
         params = {'filter[]': filters, 'view': 'extended'}
         instances = self.cloud.instances.index(params=params)
@@ -140,20 +153,36 @@ class Servers(Consul):
 
     def find_running(self, server_attrs, timeout_s):
         href = server_attrs[A.server.ID]
-        res_id = href.split('/')[-1]
-
-        def find_running_instance():
-            instance = self.cloud.instances.show(
-                    res_id=res_id,
-                    params={'view': 'extended'},
-                    )
-            if instance.soul['state'] == 'operational':
-                return instance
-
-        running = poll_with_timeout(timeout_s, find_running_instance, 20)
+        running = self.get_waiter().wait([href.split('/')[-1]], timeout_s)
         if not running:
             raise TimeoutError('Server not operational within allotted time.')
-        return server_to_dict(running)
+        return server_to_dict(running[0])
+
+    def get_waiter(self):
+        """
+        Returns the :class:`~bang.waiter.Waiter` that polls for operational
+        instances in this consul's cloud and deployment.  The instances are
+        keyed by their resource id.
+
+        """
+        deployment_href = self.deployment.href
+        def describe(res_ids):
+            self.throttle()
+            # the instances can't be filtered by href, so list all of the
+            # operational ones in the deployment and pick out the ones being
+            # waited on
+            instances = self.cloud.instances.index(params={
+                    'filter[]': [
+                        'state==operational',
+                        'deployment_href==' + deployment_href,
+                        ],
+                    'view': 'extended',
+                    })
+            return dict((i.href.split('/')[-1], i) for i in instances)
+        return self.provider.get_cached(
+                ('waiter', self.region_name, deployment_href),
+                lambda: Waiter(describe, WAIT_BACKOFF),
+                )
 
     def set_region(self, region_name):
         self.region_name = region_name
@@ -161,12 +190,13 @@ class Servers(Consul):
     @property
     def cloud(self):
         if not self._cloud:
-            self._cloud = find_exact(
-                    self.api.clouds,
-                    name=self.region_name,
+            self._cloud = self.provider.get_cached(
+                    ('cloud', self.region_name),
+                    lambda: find_exact(self.api.clouds, name=self.region_name),
                     )
         return self._cloud
 
+    @throttled
     def find_server_defs(self, basename):
         """
         Finds *usable* server definitions by name.
@@ -176,6 +206,8 @@ class Servers(Consul):
         NOTE: This might result in extra server definitions if some servers are
         in various non-operational states (e.g. terminating).
         """
+        if not self.deployment:
+            return []
         filters = ['name==%s' % basename]
         fuzzy = self.deployment.servers.index(params={'filter[]': filters})
         matches = []
@@ -188,6 +220,7 @@ class Servers(Consul):
             self.basename = basename
         return matches
 
+    @throttled
     def define_server(
             self, basename, server_tpl, server_tpl_rev, instance_type,
             ssh_key_name, tags=None, availability_zone=None,
@@ -324,6 +357,7 @@ class Servers(Consul):
 
         return server_href
 
+    @throttled
     def create_server(self, href, timeout_s=DEFAULT_TIMEOUT_S, **provider_extras):
         log.info(
                 'Launching server %s... this could take a while...'
@@ -348,22 +382,11 @@ class Servers(Consul):
         instance_href = response.headers['location']
         res_id = instance_href.split('/')[-1]
 
-        # we're too fast for rs/ec2... slow down a little bit, twice
-        time.sleep(2)
-
         # wait for it to be operational
-        def find_running_instance():
-            instance = self.cloud.instances.show(
-                    res_id=res_id,
-                    params={'view': 'extended'},
-                    )
-            if instance.soul['state'] == 'operational':
-                return instance
-
-        running = poll_with_timeout(timeout_s, find_running_instance, 20)
+        running = self.get_waiter().wait([res_id], timeout_s)
         if not running:
             raise TimeoutError('Could not launch server within allotted time.')
-        return server_to_dict(running)
+        return server_to_dict(running[0])
 
 
 class SecGroups(Consul):
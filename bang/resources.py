@@ -14,6 +14,8 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+from . import attributes as A
+
 QUEUES = 'queues'
 BUCKETS = 'buckets'
 DATABASE_CREDS = 'database_credentials'
@@ -75,3 +77,37 @@ CONVENIENCE_KEYS = [
         ]
 
 DYNAMIC_RESOURCE_KEYS = [k for s in STAGES for k in s] + CONVENIENCE_KEYS
+
+# Finer-grained alternative to STAGES.  Instead of waiting for every resource
+# in the previous stage, each resource only waits for the resources it actually
+# refers to in its own config stanza.
+#
+# Each entry maps a resource type to a tuple of ``(attribute, resource type)``
+# pairs.  The value of the attribute is the name (or list of names) of the
+# resources of the given type upon which the resource depends.  An attribute
+# of ``None`` means the resource depends on *all* resources of the given type.
+#
+# Names that do not match any resource in the stack (e.g. security groups that
+# are managed outside of bang) are ignored.
+DEPENDENCIES = {
+        DATABASES: (
+            (None, DATABASE_SECURITY_GROUPS),
+            ),
+        DATABASE_SECURITY_GROUP_RULES: (
+            (None, DATABASES),
+            ),
+        SERVER_SECURITY_GROUP_RULES: (
+            (None, SERVER_SECURITY_GROUPS),
+            ),
+        SERVERS: (
+            (A.server.SECGROUPS, SERVER_SECURITY_GROUPS),
+            (A.server.SECGROUPS, SERVER_SECURITY_GROUP_RULES),
+            (A.server.SSH_KEY, SSH_KEYS),
+            ),
+        LOAD_BALANCERS: (
+            (A.loadbalancer.SERVER_NAMES, SERVERS),
+            ),
+        DYNAMIC_LB_SEC_GROUPS: (
+            (A.secgroup.LOAD_BALANCER, LOAD_BALANCERS),
+            ),
+        }
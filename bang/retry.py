@@ -0,0 +1,118 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Retrying deployer phases after transient provider errors.
+
+A phase that fails with a *transient* error (e.g. an HTTP 5xx from the
+provider API, provider throttling, or a dropped connection) is run again
+after a short, exponentially growing delay instead of failing the deployer.
+Any other error fails the deployer right away.
+
+Retrying a phase is only safe if running it twice has the same effect as
+running it once.  The phases that launch servers pass an idempotency token to
+the provider (e.g. the EC2 ``ClientToken``) so that a retried launch returns
+the servers from the first attempt instead of launching more of them.
+Deployers list any phases that can't be retried safely in
+:attr:`~bang.deployers.deployer.Deployer.no_retry_phases`.
+
+The policy is set in the ``retries`` attribute of the ``scheduler`` config
+stanza, with optional overrides per phase name.  E.g.:
+
+.. code-block:: yaml
+
+    scheduler:
+      retries:
+        attempts: 3
+        backoff_s: 2
+        create:
+          attempts: 5
+
+"""
+import httplib
+import socket
+
+from . import attributes as A
+
+
+#: The number of times a phase is attempted, unless configured otherwise.
+DEFAULT_ATTEMPTS = 3
+
+#: The delay before the first retry, in seconds, unless configured otherwise.
+#: Each further retry waits twice as long as the one before.
+DEFAULT_BACKOFF_S = 2
+
+# provider error codes that mean "slow down", whatever the HTTP status
+_THROTTLING_CODES = set([
+        'RequestLimitExceeded',
+        'Throttling',
+        'ThrottlingException',
+        'ServiceUnavailable',
+        'InternalError',
+        ])
+
+
+def is_transient(exc):
+    """
+    Returns ``True`` if :attr:`exc` looks like a temporary failure of the
+    provider that is worth retrying.
+
+    Recognizes provider client errors by their attributes rather than their
+    types, so that none of the optional provider libraries need to be
+    installed.
+
+    """
+    if isinstance(exc, (socket.error, httplib.HTTPException)):
+        return True
+    if getattr(exc, 'error_code', None) in _THROTTLING_CODES:
+        # boto
+        return True
+    # boto errors have a ``status``, novaclient errors have a ``code``
+    for attr in ('status', 'code', 'http_status'):
+        status = getattr(exc, attr, None)
+        if isinstance(status, int) and (status >= 500 or status == 429):
+            return True
+    return False
+
+
+class RetryPolicy(object):
+    """How many times to attempt each phase, and how long to wait between."""
+    def __init__(self, config=None):
+        """
+        :param dict config:  The ``retries`` attribute of the ``scheduler``
+            config stanza.
+
+        """
+        self.config = config or {}
+
+    def _get(self, phase, key, default):
+        phase_config = self.config.get(phase)
+        if isinstance(phase_config, dict) and key in phase_config:
+            return phase_config[key]
+        return self.config.get(key, default)
+
+    def attempts(self, phase):
+        """Returns the number of times to attempt :attr:`phase`."""
+        return max(1, self._get(phase, A.scheduler.ATTEMPTS, DEFAULT_ATTEMPTS))
+
+    def delay(self, phase, attempt):
+        """
+        Returns the number of seconds to wait after the failed
+        :attr:`attempt` (counting from ``1``) of :attr:`phase`.
+
+        """
+        backoff_s = self._get(phase, A.scheduler.BACKOFF, DEFAULT_BACKOFF_S)
+        return backoff_s * 2 ** (attempt - 1)
@@ -0,0 +1,332 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Runs deployers concurrently while honouring the dependencies between them.
+"""
+import time
+
+from . import BangError, resources as R, status
+from .executors import get_executor, run_deployer
+from .throttle import ConcurrencyLimits
+from .util import log
+
+
+def _get_stage(res_type):
+    for stage, keys in enumerate(R.STAGES):
+        if res_type in keys:
+            return stage
+    return None
+
+
+class Scheduler(object):
+    """
+    Starts each deployer as soon as all of the deployers it depends upon have
+    completed successfully.
+
+    Deployers that depend (directly or indirectly) on a failed deployer are
+    never started.
+
+    Deployers that
+    :attr:`~bang.deployers.deployer.Deployer.runs_inline` are run right away
+    in the current process instead of being handed to the executor.
+
+    A watchdog stops deployers that run past their wall-clock budget, and
+    counts them as failed.  Each deployer gets
+    :attr:`~bang.deployers.deployer.Deployer.deployer_timeout_s` seconds if it
+    sets it, or else :attr:`deployer_timeout_s`.  Each stage in
+    :data:`bang.resources.STAGES` gets :attr:`stage_timeout_s` from the start
+    of its first deployer;  when that runs out, the stage's running deployers
+    are stopped and the rest of the stage is not started.  Deployers that run
+    inline can't be stopped.
+
+    """
+    def __init__(self, deployers, deps, executor='process', workers=None,
+            limits=None, fail_fast=False, completed=None, priorities=None,
+            on_done=None, deployer_timeout_s=None, stage_timeout_s=None):
+        """
+        :param list deployers:  The
+            :class:`~bang.deployers.deployer.Deployer` objects to run.
+
+        :param list deps:  ``deps[i]`` is the :class:`set` of indices into
+            :attr:`deployers` that must complete successfully before
+            ``deployers[i]`` can start.  See
+            :func:`~bang.deployers.get_deployer_graph`.
+
+        :param str executor:  The name of the
+            :class:`~bang.executors.Executor` that runs the deployers.  See
+            :data:`bang.executors.EXECUTORS`.
+
+        :param int workers:  The number of workers for executors that use a
+            fixed-size pool of workers.
+
+        :param limits:  Caps on the number of deployers that run at once.
+        :type limits:  :class:`~bang.throttle.ConcurrencyLimits`
+
+        :param bool fail_fast:  If ``True``, the first failure cancels all of
+            the other running deployers instead of waiting for them to finish.
+
+        :param set completed:  The indices of deployers that already completed
+            in an earlier run (see :meth:`bang.journal.Journal.restore`).
+            These are not run again.
+
+        :param list priorities:  ``priorities[i]`` is the priority of
+            ``deployers[i]``.  When several deployers are ready to start, the
+            ones with the highest priority start first.  See
+            :func:`bang.history.critical_path`.
+
+        :param callable on_done:  If given, it is called with the index of
+            each deployer that completes successfully, as soon as its
+            additions to the stack inventory have been applied.
+
+        :param float deployer_timeout_s:  The default wall-clock budget for
+            each deployer, in seconds.
+
+        :param float stage_timeout_s:  The wall-clock budget for each stage,
+            in seconds.
+
+        """
+        self.deployers = deployers
+        self.deps = deps
+        self.executor = executor
+        self.workers = workers
+        self.limits = limits or ConcurrencyLimits()
+        self.fail_fast = fail_fast
+        self.completed = set(completed or ())
+        self.priorities = priorities or [0] * len(deployers)
+        self.on_done = on_done
+        self.deployer_timeout_s = deployer_timeout_s
+        self.stage_timeout_s = stage_timeout_s
+        self.stages = [
+                _get_stage(getattr(d, 'res_type', None)) for d in deployers
+                ]
+
+        #: Maps stages to the times at which their first deployers started
+        self.stage_started = {}
+
+        #: The stages that ran out of time
+        self.expired_stages = set()
+
+        #: Maps deployer indices to the times at which they were started
+        self.started = {}
+
+        #: Maps deployer indices to the times at which they finished
+        self.finished = {}
+
+        #: The indices of the deployers that completed successfully,
+        #: including those in :attr:`completed`
+        self.done = set(self.completed)
+
+        #: The indices of the deployers that failed
+        self.failed = []
+
+        #: The indices of the deployers that were cut off by fail-fast
+        self.cut = []
+
+        #: The indices of the deployers that were stopped by the watchdog
+        self.timed_out = []
+
+    def _ready(self, pending, done):
+        ready = [
+                i for i in pending
+                if self.deps[i] <= done
+                and self.stages[i] not in self.expired_stages
+                ]
+        ready.sort(key=lambda i: (-self.priorities[i], i))
+        return ready
+
+    def _start(self, i):
+        self.started[i] = time.time()
+        self.stage_started.setdefault(self.stages[i], self.started[i])
+
+    def _deadline(self, i):
+        """
+        Returns the time by which the deployer at index :attr:`i` must
+        finish, or ``None`` if it has no budget.
+
+        """
+        deadlines = []
+        budget = getattr(self.deployers[i], 'deployer_timeout_s', None) or \
+                self.deployer_timeout_s
+        if budget:
+            deadlines.append(self.started[i] + budget)
+        if self.stage_timeout_s and self.stages[i] is not None:
+            deadlines.append(
+                    self.stage_started[self.stages[i]] + self.stage_timeout_s
+                    )
+        return min(deadlines) if deadlines else None
+
+    def _next_deadline(self, running):
+        deadlines = [self._deadline(i) for i in running]
+        deadlines = [t for t in deadlines if t is not None]
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - time.time())
+
+    def _expired(self, running):
+        """
+        Returns the indices of the deployers in :attr:`running` that are out
+        of time, and marks the stages that are out of time.
+
+        """
+        now = time.time()
+        if self.stage_timeout_s:
+            for stage, start in self.stage_started.iteritems():
+                if stage is not None and now >= start + self.stage_timeout_s:
+                    self.expired_stages.add(stage)
+        return sorted(
+                i for i in running
+                if self._deadline(i) is not None and now >= self._deadline(i)
+                )
+
+    def _publish(self, i, state):
+        publish = getattr(self.deployers[i], 'publish_status', None)
+        if publish:
+            publish(state)
+
+    def _done(self, i):
+        self.done.add(i)
+        self._publish(i, status.DONE)
+        if self.on_done:
+            self.on_done(i)
+
+    def _failed(self, i):
+        self.failed.append(i)
+        self._publish(i, status.FAILED)
+
+    def _collect(self, finished, running):
+        """
+        Records the ``(index, exitcode)`` tuples in :attr:`finished`, as
+        returned by :meth:`~bang.executors.Executor.wait`.
+
+        """
+        for i, exitcode in finished:
+            self.finished[i] = time.time()
+            running.remove(i)
+            self.limits.release(self.deployers[i])
+            if exitcode == 0:
+                self._done(i)
+            else:
+                self._failed(i)
+
+    def run(self, action):
+        """
+        Runs :attr:`action` on every deployer.
+
+        Raises :class:`~bang.BangError` if any of the deployers failed, or
+        were never started.
+
+        :param str action:  Either ``deploy`` or ``inventory``.
+
+        """
+        pending = set(range(len(self.deployers))) - self.completed
+        for i in range(len(self.deployers)):
+            self._publish(i, status.QUEUED if i in pending else status.DONE)
+        executor_name = self.executor
+        if all(self.deployers[i].runs_inline for i in pending):
+            # don't fork or spawn workers that would never get a job
+            executor_name = 'inline'
+        executor = get_executor(
+                executor_name,
+                self.deployers,
+                action,
+                self.workers,
+                )
+        running = set()
+        done = self.done
+        failed = self.failed
+        cut = []
+        try:
+            while pending or running:
+                started = True
+                while started and not (failed and self.fail_fast):
+                    started = False
+                    for i in self._ready(pending, done):
+                        d = self.deployers[i]
+                        if d.runs_inline:
+                            pending.remove(i)
+                            self._start(i)
+                            exitcode = run_deployer(d, action)
+                            self.finished[i] = time.time()
+                            if exitcode == 0:
+                                self._done(i)
+                                # its dependents may be ready now
+                                started = True
+                            else:
+                                self._failed(i)
+                            continue
+                        if not self.limits.acquire(d):
+                            continue
+                        pending.remove(i)
+                        running.add(i)
+                        self._start(i)
+                        executor.submit(i)
+                if not running:
+                    # everything left over is waiting on a failed deployer
+                    break
+                timeout = self._next_deadline(running)
+                self._collect(executor.wait(timeout), running)
+                expired = self._expired(running)
+                if expired:
+                    executor.expire(expired)
+                    for i in expired:
+                        self.finished[i] = time.time()
+                        running.remove(i)
+                        self.limits.release(self.deployers[i])
+                        self._failed(i)
+                        self.timed_out.append(i)
+                if failed and self.fail_fast:
+                    # deployers that finished in the meantime aren't cut off
+                    self._collect(executor.wait(0), running)
+                    cut = self.cut = executor.cancel()
+                    for i in cut:
+                        self._publish(i, status.FAILED)
+                        self.finished[i] = time.time()
+                        running.remove(i)
+                        self.limits.release(self.deployers[i])
+                    break
+        finally:
+            executor.shutdown()
+
+        if failed or pending:
+            # deployers can be left pending without any failures, if their
+            # stage ran out of time before they could start
+            msgs = []
+            if failed:
+                msgs.append("%d deployers failed: %s." % (
+                        len(failed),
+                        ', '.join(
+                            str(self.deployers[i]) for i in sorted(failed)
+                            ),
+                        ))
+            if self.timed_out:
+                msgs.append("Ran out of time: %s." % ', '.join(
+                        str(self.deployers[i]) for i in sorted(self.timed_out)
+                        ))
+            if cut:
+                msgs.append("Cut off by fail-fast: %s." % ', '.join(
+                        str(self.deployers[i]) for i in sorted(cut)
+                        ))
+            if pending:
+                msgs.append("%d deployers were not started: %s." % (
+                        len(pending),
+                        ', '.join(
+                            str(self.deployers[i]) for i in sorted(pending)
+                            ),
+                        ))
+            msg = '  '.join(msgs)
+            log.error(msg)
+            raise BangError(msg)
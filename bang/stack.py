@@ -14,7 +14,6 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
-import copy
 import functools
 import json
 import multiprocessing
@@ -28,12 +27,56 @@ import ansible.utils  # noqa
 
 from ansible import callbacks
 from ansible.playbook import PlayBook
-from .deployers import get_stage_deployers
+from .deployers import (
+        get_stage_deployers,
+        get_deployer_graph,
+        add_dependents,
+        assign_existing,
+        )
+from .history import DurationHistory, DEFAULT_HISTORY_FILE, critical_path
+from .incremental import (
+        DeployState,
+        DEFAULT_STATE_DIR,
+        resource_fingerprints,
+        )
 from .inventory import BangsibleInventory
-from .util import log, SharedNamespace, SharedMap
+from .journal import Journal, DEFAULT_JOURNAL_DIR
+from .pipeline import ConfigurePipeline
+from .retry import RetryPolicy
+from .scheduler import Scheduler
+from .status import StatusFile, DEFAULT_STATUS_DIR, format_status
+from .throttle import ConcurrencyLimits, configure_rate_limits
+from .trace import span, complete, is_tracing
+from .util import SharedNamespace, InventoryMap, log
 from . import BangError, resources as R, attributes as A
 
 
+def get_scheduler(sched_cfg, deployers, deps, completed=None,
+        priorities=None, on_done=None):
+    """
+    Returns a :class:`~bang.scheduler.Scheduler` for :attr:`deployers`, set
+    up according to the ``scheduler`` config stanza, :attr:`sched_cfg`.
+
+    """
+    max_parallel = sched_cfg.get(A.scheduler.MAX_PARALLEL)
+    return Scheduler(
+            deployers,
+            deps,
+            executor=sched_cfg.get(A.scheduler.EXECUTOR, 'process'),
+            workers=sched_cfg.get(A.scheduler.WORKERS, max_parallel),
+            limits=ConcurrencyLimits(
+                max_parallel,
+                sched_cfg.get(A.scheduler.PROVIDER_LIMITS),
+                ),
+            fail_fast=sched_cfg.get(A.scheduler.FAIL_FAST, False),
+            completed=completed,
+            priorities=priorities,
+            on_done=on_done,
+            deployer_timeout_s=sched_cfg.get(A.scheduler.DEPLOYER_TIMEOUT),
+            stage_timeout_s=sched_cfg.get(A.scheduler.STAGE_TIMEOUT),
+            )
+
+
 def require_inventory(f):
     @functools.wraps(f)
     def wrapper(self, *args, **kwargs):
@@ -43,33 +86,58 @@ def require_inventory(f):
     return wrapper
 
 
+class StackRun(object):
+    """
+    The deployers for one run of a :class:`Stack`, along with everything
+    needed to record the outcome once they have finished.
+
+    """
+    def __init__(self, action):
+        self.action = action
+        self.deployers = []
+        self.deps = []
+        self.completed = set()
+        self.priorities = None
+        self.journal = None
+        self.state = None
+        self.fingerprints = None
+        self.only = None
+        self.history = None
+
+
 class Stack(object):
     """
     Deploys infrastructure/platform resources, then configures any deployed
     servers using ansible playbooks.
 
     """
-    def __init__(self, config):
+    def __init__(self, config, manager=None):
         """
         :param config:  A mapping object with configuration keys and values.
             May be arbitrarily nested.
         :type config:  :class:`bang.config.Config`
 
+        :param manager:  The :class:`multiprocessing.Manager` that holds the
+            shared namespaces (see :meth:`get_namespace`).  Stacks that are
+            deployed together (see :func:`deploy_stacks`) can share one.  By
+            default, a new one is started the first time it is needed.
+
         """
         self.name = config[A.NAME]
         self.version = config[A.VERSION]
         self.config = config
-        self.manager = multiprocessing.Manager()
+        self._manager = manager
         self.shared_namespaces = {}
 
-        self.groups_and_vars = SharedMap(self.manager)
-        self.lb_sec_groups = SharedMap(self.manager)
+        self.groups_and_vars = InventoryMap()
+        self.lb_sec_groups = InventoryMap()
         self.have_inventory = False
 
         """
         Deployers stash inventory data for any newly-created servers in this
-        mapping object.  Note: uses SharedMap because this must be
-        multiprocess-safe.
+        mapping object.  Deployers in child processes update their own copy,
+        and the executor replays their updates here when they finish (see
+        :meth:`~bang.deployers.deployer.Deployer.apply_results`).
 
         """
 
@@ -86,6 +154,100 @@ class Stack(object):
                 [get_stage_deployers(keys, self) for keys in R.STAGES]
                 )
 
+    def get_deployer_graph(self, only=None):
+        """
+        Returns the deployers and the dependencies between them as described
+        in :func:`~bang.deployers.get_deployer_graph`.
+
+        If :attr:`only` is given, only the resources in that :class:`set` of
+        ``(res_type, name)`` tuples are included.
+
+        The ``mode`` in the ``scheduler`` config stanza selects between
+        dependencies derived from the resource configs (``graph``, the
+        default) and strict stage-by-stage ordering (``stages``).
+
+        """
+        mode = self.config.get(A.SCHEDULER, {}).get(
+                A.scheduler.MODE,
+                A.scheduler.MODE_GRAPH,
+                )
+        if mode not in (A.scheduler.MODE_GRAPH, A.scheduler.MODE_STAGES):
+            raise BangError("Unknown scheduler mode, %s" % mode)
+        return get_deployer_graph(
+                self,
+                staged=(mode == A.scheduler.MODE_STAGES),
+                only=only,
+                )
+
+    def get_journal(self):
+        """
+        Returns the :class:`~bang.journal.Journal` for deploys of this stack,
+        or ``None`` if journaling is disabled.
+
+        """
+        journal_dir = self.config.get(A.SCHEDULER, {}).get(
+                A.scheduler.JOURNAL_DIR,
+                DEFAULT_JOURNAL_DIR,
+                )
+        if not journal_dir:
+            return None
+        return Journal.for_stack(self.config, journal_dir)
+
+    def get_deploy_state(self):
+        """
+        Returns the :class:`~bang.incremental.DeployState` from the last
+        successful deploy of this stack, or ``None`` if it is disabled.
+
+        """
+        state_dir = self.config.get(A.SCHEDULER, {}).get(
+                A.scheduler.STATE_DIR,
+                DEFAULT_STATE_DIR,
+                )
+        if not state_dir:
+            return None
+        return DeployState.for_stack(self.config, state_dir)
+
+    def get_status_file(self):
+        """
+        Returns the :class:`~bang.status.StatusFile` for deploys of this
+        stack, or ``None`` if it is disabled.
+
+        """
+        status_dir = self.config.get(A.SCHEDULER, {}).get(
+                A.scheduler.STATUS_DIR,
+                DEFAULT_STATUS_DIR,
+                )
+        if not status_dir:
+            return None
+        return StatusFile.for_stack(self.config, status_dir)
+
+    def get_history(self):
+        """
+        Returns the :class:`~bang.history.DurationHistory` of past deployer
+        durations, or ``None`` if it is disabled.
+
+        """
+        history_file = self.config.get(A.SCHEDULER, {}).get(
+                A.scheduler.HISTORY_FILE,
+                DEFAULT_HISTORY_FILE,
+                )
+        if not history_file:
+            return None
+        return DurationHistory(history_file)
+
+    @property
+    def manager(self):
+        """
+        The :class:`multiprocessing.Manager` for state shared with deployer
+        processes.  Its server process is only started on first use, so runs
+        that never coordinate across processes (e.g. ``bang --list``) don't
+        pay for it.
+
+        """
+        if not self._manager:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
     def get_namespace(self, key):
         """
         Returns a :class:`~bang.util.SharedNamespace` for the given
@@ -185,8 +347,33 @@ class Stack(object):
         for gname in group_names:
             self.groups_and_vars.append(gname, host)
 
+    def dump_inventory(self):
+        """
+        Returns a copy of the stack inventory gathered so far, for
+        :meth:`load_inventory`.
+
+        """
+        return self.groups_and_vars.dump(), self.lb_sec_groups.dump()
+
+    def load_inventory(self, inventory):
+        """
+        Replaces the stack inventory with one returned by
+        :meth:`dump_inventory`.  Used to bring the stack in a long-lived
+        worker process up to date.
+
+        """
+        groups_and_vars, lb_sec_groups = inventory
+        self.groups_and_vars.load(groups_and_vars)
+        self.lb_sec_groups.load(lb_sec_groups)
+
     def describe(self):
-        """Iterates through the deployers but doesn't run anything"""
+        """
+        Iterates through the deployers but doesn't run anything.
+
+        Also prints the expected duration of the deploy (assuming no limits on
+        concurrency), and the chain of deployers that determines it.
+
+        """
         for stage, corunners in self.get_deployers():
             print self.name, "STAGE ", stage
             for d in corunners:
@@ -194,44 +381,265 @@ class Stack(object):
                         [p[1].__name__ for p in d.phases]
                         )
 
-    def _run(self, action):
-        for stage, corunners in self.get_deployers():
-            children = []
-            errors = 0
-            for d in corunners:
-                p = multiprocessing.Process(
-                        name=d.__class__.__name__,
-                        target=d.run,
-                        args=(action, ),
-                        )
-                children.append(p)
-                p.start()
-            for child in children:
-                child.join()
-                if child.exitcode != 0:
-                    errors += 1
-            if errors:
-                msg = "Stage %d had %d errors." % (stage, errors)
-                log.error(msg)
-                raise BangError(msg)
+        deployers, deps = self.get_deployer_graph()
+        history = self.get_history() or DurationHistory(os.devnull)
+        estimates = [history.estimate(d) for d in deployers]
+        remaining, path = critical_path(estimates, deps)
+        if not path:
+            return
+        print self.name, "ETA  %dm%02ds" % divmod(int(remaining[path[0]]), 60)
+        print self.name, "CRITICAL PATH"
+        for i in path:
+            print "%s %ds" % (deployers[i], estimates[i])
+
+    def _get_changed_resources(self, journal, state, fingerprints):
+        """
+        Returns the :class:`set` of resources to deploy incrementally, after
+        restoring the inventory of all of the others from :attr:`state`.
+
+        Returns ``None`` if everything needs to be deployed.
+
+        """
+        if not (journal and state):
+            raise BangError(
+                    'Incremental deploys need both the deploy journal and '
+                    'the deploy state.  Check the journal_dir and state_dir '
+                    'scheduler options.'
+                    )
+        if not state.exists():
+            log.info(
+                    'No previous deploy of %s %s, deploying everything.'
+                    % (self.name, self.version)
+                    )
+            return None
+        changed = add_dependents(
+                self.config,
+                state.changed_resources(fingerprints),
+                )
+        log.info(
+                '%d resources changed since the last deploy: %s'
+                % (
+                    len(changed),
+                    ', '.join('%s/%s' % r for r in sorted(changed)),
+                    )
+                )
+        state.restore_inventory(self, changed)
+        return changed
 
-    def deploy(self):
+    def _prepare_run(self, action, incremental=False):
         """
-        Iterates through the deployers returned by ``self.get_deployers()``.
+        Creates the deployers for :attr:`action`, and restores any progress
+        from an earlier, failed deploy.
+
+        Returns a :class:`StackRun`.
 
-        Deployers in the same stage are run concurrently.  The runner only
-        proceeds to the next stage once all of the deployers in the same
-        stage have completed successfully.
+        """
+        run = StackRun(action)
+        sched_cfg = self.config.get(A.SCHEDULER, {})
+        if action == 'deploy':
+            run.journal = self.get_journal()
+            run.state = self.get_deploy_state()
+        if run.state:
+            run.fingerprints = resource_fingerprints(self.config)
+        if incremental:
+            run.only = self._get_changed_resources(
+                    run.journal,
+                    run.state,
+                    run.fingerprints,
+                    )
+
+        run.deployers, run.deps = self.get_deployer_graph(run.only)
+        retry_policy = RetryPolicy(sched_cfg.get(A.scheduler.RETRIES))
+        for d in run.deployers:
+            d.retry_policy = retry_policy
+
+        if action == 'deploy':
+            status = self.get_status_file()
+            if status:
+                status.reset()
+                for d in run.deployers:
+                    d.status = status
+
+        if run.journal:
+            if not sched_cfg.get(A.scheduler.RESUME, True):
+                run.journal.discard()
+            run.completed = run.journal.restore(run.deployers)
+        assign_existing(run.deployers)
+
+        run.history = self.get_history()
+        if run.history:
+            run.priorities, _ = critical_path(
+                    [run.history.estimate(d) for d in run.deployers],
+                    run.deps,
+                    )
+        return run
+
+    def _finish_run(self, run, scheduler, offset=0):
+        """
+        Records the outcome of a :class:`StackRun` whose deployers were run by
+        :attr:`scheduler`, starting at index :attr:`offset`.
 
-        Any failures in a stage cause the run to terminate before proceeding to
-        the next stage.
+        Returns ``True`` if all of the deployers completed successfully.
+
+        """
+        indices = range(offset, offset + len(run.deployers))
+        ok = all(i in scheduler.done for i in indices)
+        self._trace_stages(run.deployers, scheduler, offset)
+        if run.history and run.action == 'deploy':
+            self._record_durations(
+                    run.deployers,
+                    scheduler,
+                    offset,
+                    run.history,
+                    )
+        if not run.journal:
+            return ok
+        if not ok:
+            log.info(
+                    'Kept deploy journal, %s.  Rerun to resume.'
+                    % run.journal.path
+                    )
+            return ok
+        if run.state:
+            run.state.save(run.fingerprints, run.journal.load(), run.only)
+        run.journal.discard()
+        return ok
+
+    def _run(self, action, incremental=False, pipeline=False):
+        sched_cfg = self.config.get(A.SCHEDULER, {})
+
+        # the rate limiters must exist before any deployer processes are
+        # forked so they can all share them.
+        configure_rate_limits(sched_cfg.get(A.scheduler.PROVIDER_LIMITS))
+
+        run = self._prepare_run(action, incremental)
+        configurer = on_done = None
+        if pipeline:
+            configurer = ConfigurePipeline(self, run.deployers, run.completed)
+            on_done = configurer.deployer_done
+        scheduler = get_scheduler(
+                sched_cfg,
+                run.deployers,
+                run.deps,
+                run.completed,
+                run.priorities,
+                on_done,
+                )
+        with span(action, 'stack', stack=self.name):
+            try:
+                scheduler.run(action)
+            finally:
+                ok = self._finish_run(run, scheduler)
+                if configurer:
+                    if ok:
+                        self.have_inventory = True
+                    configurer.finish(ok)
+
+    def _record_durations(self, deployers, scheduler, offset, history):
+        """
+        Adds the durations of the deployers that completed successfully to
+        :attr:`history`.
+
+        """
+        for n, d in enumerate(deployers):
+            i = n + offset
+            if i in scheduler.done and i in scheduler.started:
+                history.record(d, scheduler.finished[i] - scheduler.started[i])
+        history.save()
+
+    def _trace_stages(self, deployers, scheduler, offset):
+        """
+        Adds a span to the trace for each stage in
+        :data:`bang.resources.STAGES`, from the start of its first deployer to
+        the end of its last one.  Even when the deployers are not run stage by
+        stage, this shows how the resource types overlap.
+
+        """
+        if not is_tracing():
+            return
+        stages = {}
+        for n, d in enumerate(deployers):
+            start = scheduler.started.get(n + offset)
+            end = scheduler.finished.get(n + offset)
+            if start is None or end is None:
+                continue
+            for stage, keys in enumerate(R.STAGES):
+                if d.res_type in keys:
+                    break
+            else:
+                continue
+            first, last = stages.get(stage, (start, end))
+            stages[stage] = (min(first, start), max(last, end))
+        for stage, (start, end) in sorted(stages.iteritems()):
+            complete(
+                    'stage %d' % stage,
+                    'stage',
+                    start,
+                    end,
+                    track='%s stages' % self.name,
+                    res_types=list(R.STAGES[stage]),
+                    )
+
+    def deploy(self, incremental=False):
+        """
+        Runs the deployers returned by ``self.get_deployer_graph()``.
+
+        Deployers run concurrently.  Each deployer starts as soon as all of
+        the deployers it depends upon have completed successfully.  In
+        ``stages`` mode, that means all of the deployers in the previous stage.
+
+        Any failure prevents the deployers that depend on the failed deployer
+        from running, and causes the deploy to raise
+        :class:`~bang.BangError` once the remaining deployers have finished.
+
+        Progress is recorded in a :class:`~bang.journal.Journal` as the
+        deployers run.  If the deploy fails, the next deploy of the same stack
+        config skips the work that was already completed.
+
+        :param bool incremental:  If ``True``, only deploy the resources that
+            changed since the last successful deploy.  See
+            :mod:`bang.incremental`.
+
+        """
+        self._run('deploy', incremental)
+        self.have_inventory = True
+
+    def deploy_and_configure(self, incremental=False):
+        """
+        Deploys the stack like :meth:`deploy`, and configures the servers in
+        each server class as soon as the class is deployed, instead of
+        waiting for the whole stack.  See :mod:`bang.pipeline`.
 
         """
-        self._run('deploy')
+        self._run('deploy', incremental, pipeline=True)
         self.have_inventory = True
 
+    def get_class_hosts(self, name):
+        """
+        Returns the sorted :class:`list` of hosts in the stack inventory that
+        belong to the server class named :attr:`name`.
+
+        """
+        _, hostvars = self.groups_and_vars.snapshot()
+        return sorted(
+                h for h, hvars in hostvars.iteritems()
+                if hvars.get(A.SERVER_CLASS) == name
+                )
+
+    def get_class_playbooks(self, name):
+        """
+        Returns the playbooks that configure the server class named
+        :attr:`name`:  the ``playbooks`` in its server config if there are
+        any, or else the stack-wide ``playbooks``.
+
+        """
+        for server in self.config.get(R.SERVERS, []):
+            if server.get(A.NAME) == name and A.server.PLAYBOOKS in server:
+                return server[A.server.PLAYBOOKS]
+        return self.config.get(A.PLAYBOOKS, [])
+
     @require_inventory
-    def configure(self):
+    def configure(self, skip=()):
         """
         Executes the ansible playbooks that configure the servers in the stack.
 
@@ -251,6 +659,42 @@ class Stack(object):
 
             $HOME/bang-stacks/common_modules/
 
+        Server classes with ``playbooks`` of their own are configured with
+        those instead of the stack-wide ``playbooks``.
+
+        :param skip:  Hosts that are already configured.
+
+        """
+        own = [
+                s[A.NAME] for s in self.config.get(R.SERVERS, [])
+                if A.server.PLAYBOOKS in s
+                ]
+        if not (own or skip):
+            self.run_playbooks()
+            return
+        skip = set(skip)
+        for name in own:
+            hosts = [h for h in self.get_class_hosts(name) if h not in skip]
+            if hosts:
+                self.run_playbooks(hosts, self.get_class_playbooks(name))
+            skip.update(hosts)
+        _, hostvars = self.groups_and_vars.snapshot()
+        hosts = sorted(h for h in hostvars if h not in skip)
+        if hosts:
+            self.run_playbooks(hosts)
+
+    def run_playbooks(self, hosts=None, playbooks=None):
+        """
+        Executes the ansible playbooks against the inventory gathered so far.
+        See :meth:`configure`.
+
+        :param list hosts:  If given, the playbooks only run on these hosts
+            (like ``ansible-playbook --limit``).  The rest of the inventory
+            is still visible to the playbooks.
+
+        :param list playbooks:  The playbooks to run.  Defaults to the
+            stack-wide ``playbooks``.
+
         """
         cfg = self.config
         bang_config_dir = os.path.abspath(
@@ -275,7 +719,9 @@ class Stack(object):
         ansible_cfg = cfg.get(A.ANSIBLE, {})
         ansible_verbosity = ansible_cfg.get(A.ansible.VERBOSITY, 1)
         ansible.utils.VERBOSITY = ansible_verbosity
-        for playbook in cfg.get(A.PLAYBOOKS, []):
+        if playbooks is None:
+            playbooks = cfg.get(A.PLAYBOOKS, [])
+        for playbook in playbooks:
             playbook_path = os.path.join(playbook_dir, playbook)
 
             # gratuitously stolen from main() in ``ansible-playbook``
@@ -304,20 +750,20 @@ class Stack(object):
                     }
             pb_kwargs.update(extra_kwargs)
             pb = PlayBook(**pb_kwargs)
-            inventory = BangsibleInventory(
-                    copy.deepcopy(self.groups_and_vars.lists),
-                    copy.deepcopy(self.groups_and_vars.dicts),
-                    )
+            inventory = BangsibleInventory(*self.groups_and_vars.snapshot())
             inventory.set_playbook_basedir(playbook_dir)
+            if hosts:
+                inventory.subset(':'.join(hosts))
             pb.inventory = inventory
 
-            pb.run()
+            with span(playbook, 'playbook', stack=self.name):
+                pb.run()
 
-            hosts = sorted(pb.stats.processed.keys())
+            processed = sorted(pb.stats.processed.keys())
             playbook_cb.on_stats(pb.stats)
 
             failed = False
-            for h in hosts:
+            for h in processed:
                 hsum = pb.stats.summarize(h)
                 if hsum['failures'] or hsum['unreachable']:
                     failed = True
@@ -352,15 +798,99 @@ class Stack(object):
         http://ansible.cc/docs/api.html#external-inventory-scripts
 
         """
-        inv_lists = copy.deepcopy(self.groups_and_vars.lists)
+        lists, hostvars = self.groups_and_vars.snapshot()
         # sort the host lists to help consumers of the inventory (e.g. ansible
         # playbooks)
-        for l in inv_lists.values():
-            l.sort()
+        inv_lists = dict((k, sorted(v)) for k, v in lists.iteritems())
 
         # new in ansible 1.3: add hostvars directly into ``--list`` output
-        inv_lists['_meta'] = {
-                'hostvars': self.groups_and_vars.dicts.copy()
-                }
+        inv_lists['_meta'] = {'hostvars': hostvars}
 
         print json.dumps(inv_lists)
+
+    def show_status(self):
+        """
+        Prints the latest state of each deployer in the current (or last)
+        deploy of this stack.  See :mod:`bang.status`.
+
+        """
+        status = self.get_status_file()
+        updates = status.load() if status else []
+        if not updates:
+            print 'No deploy status for %s %s' % (self.name, self.version)
+            return
+        for line in format_status(updates):
+            print line
+
+
+def deploy_stacks(stacks, incremental=False):
+    """
+    Deploys several stacks at once.
+
+    The deployers of all of the stacks are run by a single
+    :class:`~bang.scheduler.Scheduler`, so the executor, the worker count and
+    the concurrency limits from the ``scheduler`` config stanza of the
+    *first* stack apply to all of them together.  Provider connections and
+    discovery results are shared between the stacks too, via
+    :func:`bang.providers.get_provider`.
+
+    Each stack keeps its own deploy journal and deploy state, so a failure in
+    one stack does not prevent the others from completing.  Raises
+    :class:`~bang.BangError` naming the stacks that failed, if any.
+
+    :param list stacks:  The :class:`Stack` objects to deploy.
+
+    :param bool incremental:  See :meth:`Stack.deploy`.
+
+    """
+    if not stacks:
+        return
+    sched_cfg = stacks[0].config.get(A.SCHEDULER, {})
+    configure_rate_limits(sched_cfg.get(A.scheduler.PROVIDER_LIMITS))
+
+    runs = []
+    deployers = []
+    deps = []
+    completed = set()
+    priorities = []
+
+    # stacks that share a history file share one history, so that each save
+    # includes the durations of the stacks saved before it
+    histories = {}
+    for stack in stacks:
+        run = stack._prepare_run('deploy', incremental)
+        if run.history:
+            run.history = histories.setdefault(run.history.path, run.history)
+        offset = len(deployers)
+        runs.append((stack, run, offset))
+        deployers.extend(run.deployers)
+        deps.extend(set(j + offset for j in d) for d in run.deps)
+        completed.update(i + offset for i in run.completed)
+        priorities.extend(run.priorities or [0] * len(run.deployers))
+
+    scheduler = get_scheduler(
+            sched_cfg,
+            deployers,
+            deps,
+            completed,
+            priorities,
+            )
+    names = ', '.join(stack.name for stack in stacks)
+    with span('deploy', 'stack', stack=names):
+        try:
+            scheduler.run('deploy')
+        except BangError:
+            # reported per stack below
+            pass
+
+    failed = []
+    for stack, run, offset in runs:
+        if stack._finish_run(run, scheduler, offset):
+            stack.have_inventory = True
+        else:
+            failed.append(stack.name)
+    if failed:
+        raise BangError(
+                "%d of %d stacks failed to deploy: %s"
+                % (len(failed), len(stacks), ', '.join(failed))
+                )
@@ -0,0 +1,171 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Live deploy status.
+
+While a stack is being deployed, every change in the state of each of its
+deployers is appended to a status file as a line of JSON, e.g.::
+
+    {"ts": 1428100000.5, "deployer": "servers/web/0", "resource": "web",
+     "res_type": "servers", "state": "running", "phase": "create"}
+
+The states are:
+
+    queued  - waiting on the deployers it depends on, or on a free worker
+    running - running the phase named in ``phase``
+    polling - waiting on the provider during the phase named in ``phase``
+    done    - completed successfully
+    failed  - failed, ran out of time or was cut off
+
+The file is started afresh with each deploy, and is written as the deploy
+goes, so a dashboard can simply tail it.  ``bang --status`` shows the latest
+state of each deployer.
+
+"""
+import errno
+import json
+import os
+import threading
+import time
+
+from . import attributes as A
+
+
+#: Where status files are kept unless the ``status_dir`` attribute of the
+#: ``scheduler`` config stanza says otherwise.
+DEFAULT_STATUS_DIR = '~/.bang/status'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+POLLING = 'polling'
+DONE = 'done'
+FAILED = 'failed'
+
+# the deployer being run by the current thread, for :func:`polling`
+_current = threading.local()
+
+
+class StatusFile(object):
+    """
+    An append-only file of deployer state changes, one JSON object per line.
+
+    Like a :class:`~bang.journal.Journal`, each line is appended with a single
+    ``write()`` on a file opened with ``O_APPEND``, so concurrent deployer
+    processes never interleave their updates.
+
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_stack(cls, config, status_dir=DEFAULT_STATUS_DIR):
+        """
+        Returns the :class:`StatusFile` for the stack described by
+        :attr:`config`.
+
+        """
+        status_dir = os.path.expanduser(status_dir)
+        fname = '%s-%s.status' % (config[A.NAME], config[A.VERSION])
+        return cls(os.path.join(status_dir, fname))
+
+    def reset(self):
+        """Empties the file for a new deploy."""
+        dirname = os.path.dirname(self.path)
+        try:
+            os.makedirs(dirname, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        os.close(fd)
+
+    def publish(self, deployer, state, phase=None):
+        """Appends a change of :attr:`deployer` to :attr:`state`."""
+        line = json.dumps({
+                'ts': time.time(),
+                'deployer': deployer.deployer_id,
+                'resource': getattr(deployer, 'name', None),
+                'res_type': deployer.res_type,
+                'state': state,
+                'phase': phase,
+                }) + '\n'
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def load(self):
+        """
+        Returns the latest update for each deployer, in the order in which
+        the deployers first showed up.
+
+        """
+        latest = {}
+        order = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        update = json.loads(line)
+                    except ValueError:
+                        # still being written
+                        continue
+                    key = update['deployer']
+                    if key not in latest:
+                        order.append(key)
+                    latest[key] = update
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        return [latest[k] for k in order]
+
+
+def format_status(updates, now=None):
+    """
+    Returns a line of text for each update returned by
+    :meth:`StatusFile.load`, with the time spent in its current state.
+
+    """
+    now = now or time.time()
+    lines = []
+    for u in updates:
+        state = u['state']
+        if u.get('phase') and state in (RUNNING, POLLING):
+            state = '%s %s' % (state, u['phase'])
+        lines.append('%-30s %-30s %5ds' % (
+                u['deployer'],
+                state,
+                now - u['ts'],
+                ))
+    return lines
+
+
+def set_current(deployer):
+    """Marks :attr:`deployer` as the one the current thread is running."""
+    _current.deployer = deployer
+
+
+def polling():
+    """
+    Reports that the deployer run by the current thread, if any, is waiting
+    on its provider.
+
+    """
+    deployer = getattr(_current, 'deployer', None)
+    if deployer:
+        deployer.publish_status(POLLING)
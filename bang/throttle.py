@@ -0,0 +1,170 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Limits on how hard bang leans on the cloud providers.
+
+There are two kinds of limits:
+
+    - *Concurrency* limits cap the number of deployers that the
+      :class:`~bang.scheduler.Scheduler` runs at once, overall and per
+      provider/region.
+    - *Rate* limits cap the number of API requests per second that the
+      consuls in :mod:`bang.providers` send to a provider/region.  These are
+      shared by all of the deployer processes.
+
+Both are configured in the ``scheduler`` config stanza.  E.g.:
+
+.. code-block:: yaml
+
+    scheduler:
+      max_parallel: 50
+      provider_limits:
+        aws:
+          max_parallel: 20
+          requests_per_s: 10
+          regions:
+            us-east-1:
+              requests_per_s: 4
+        rightscale:
+          max_parallel: 10
+
+"""
+import multiprocessing
+import time
+
+from . import attributes as A
+from .util import log
+
+
+class RateLimiter(object):
+    """
+    A multiprocess-safe rate limiter that spaces out requests so they never
+    exceed :attr:`rate` requests per second.
+
+    Must be created before any deployer processes are forked so that they all
+    share the same state.
+
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = multiprocessing.Value('d', 0.0, lock=False)
+        self.lock = multiprocessing.Lock()
+
+    def acquire(self):
+        """Blocks until the caller is allowed to make another request."""
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.value)
+            self.next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# rate limiter registry, keyed by (provider, region).  region is None for the
+# provider-wide limiters.
+_RATE_LIMITERS = {}
+
+
+def configure_rate_limits(provider_limits):
+    """
+    Creates the rate limiters described by the ``provider_limits`` attribute
+    of the ``scheduler`` config stanza, replacing any existing ones.
+
+    """
+    _RATE_LIMITERS.clear()
+    for provider, cfg in (provider_limits or {}).iteritems():
+        rate = cfg.get(A.scheduler.REQUESTS_PER_S)
+        if rate:
+            _RATE_LIMITERS[(provider, None)] = RateLimiter(rate)
+        for region, rcfg in cfg.get(A.scheduler.REGIONS, {}).iteritems():
+            rate = rcfg.get(A.scheduler.REQUESTS_PER_S)
+            if rate:
+                _RATE_LIMITERS[(provider, region)] = RateLimiter(rate)
+
+
+def throttle(provider, region=None):
+    """
+    Blocks until both the provider-wide and the regional rate limits for
+    :attr:`provider` allow another API request.
+
+    Does nothing if there are no matching limits.
+
+    """
+    for key in ((provider, None), (provider, region)):
+        limiter = _RATE_LIMITERS.get(key)
+        if limiter:
+            limiter.acquire()
+        if not region:
+            break
+
+
+class ConcurrencyLimits(object):
+    """
+    Counts running deployers per provider and per provider/region, and
+    decides whether another deployer may start.
+
+    Only the scheduler (i.e. the parent process) uses this.
+
+    """
+    def __init__(self, max_parallel=None, provider_limits=None):
+        """
+        :param int max_parallel:  The maximum number of deployers to run at
+            once.  ``None`` means no limit.
+
+        :param dict provider_limits:  The ``provider_limits`` attribute of the
+            ``scheduler`` config stanza.
+
+        """
+        self.limits = {None: max_parallel}
+        for provider, cfg in (provider_limits or {}).iteritems():
+            self.limits[(provider, None)] = cfg.get(A.scheduler.MAX_PARALLEL)
+            for region, rcfg in cfg.get(A.scheduler.REGIONS, {}).iteritems():
+                self.limits[(provider, region)] = rcfg.get(
+                        A.scheduler.MAX_PARALLEL
+                        )
+        self.running = dict((k, 0) for k in self.limits)
+
+    def _keys(self, deployer):
+        provider = getattr(deployer, 'provider', None)
+        region = getattr(deployer, 'region_name', None)
+        keys = [None]
+        if provider:
+            keys.append((provider, None))
+            if region:
+                keys.append((provider, region))
+        return [k for k in keys if k in self.limits]
+
+    def acquire(self, deployer):
+        """
+        Returns ``True`` and counts :attr:`deployer` as running if that does
+        not exceed any of the limits.  Otherwise returns ``False``.
+
+        """
+        keys = self._keys(deployer)
+        for k in keys:
+            limit = self.limits[k]
+            if limit and self.running[k] >= limit:
+                log.debug('%s throttled by limit on %s' % (deployer, k))
+                return False
+        for k in keys:
+            self.running[k] += 1
+        return True
+
+    def release(self, deployer):
+        """Stops counting :attr:`deployer` as running."""
+        for k in self._keys(deployer):
+            self.running[k] -= 1
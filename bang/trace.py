@@ -0,0 +1,195 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Timing traces in the Chrome trace event format.
+
+Open the file written by ``bang --trace FILE`` in ``chrome://tracing`` (or
+any other viewer that understands the format, e.g. Perfetto) to see where a
+deploy spends its time.  Every deployer, each of its phases, each stage and
+each playbook shows up as a span.
+
+While tracing, events from all of the deployer processes and threads are
+appended to a scratch file next to the trace file.  :func:`stop_tracing`
+assembles them into the final trace.
+
+"""
+import contextlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from .util import log
+
+
+def _now_us():
+    return int(time.time() * 1e6)
+
+
+class Tracer(object):
+    """Collects trace events in a scratch file."""
+    def __init__(self, path):
+        self.path = path
+        self.events_path = path + '.events'
+        self.named_pids = set()
+        self.tracks = {}
+        if os.path.exists(self.events_path):
+            os.remove(self.events_path)
+
+    def emit(self, event):
+        """
+        Appends :attr:`event` to the scratch file.  Each event is written with
+        a single ``write()`` on a file opened with ``O_APPEND``, so events
+        from concurrent processes never interleave.
+
+        """
+        pid = os.getpid()
+        if pid not in self.named_pids:
+            # tell the viewer which deployer this process is running
+            self.named_pids.add(pid)
+            self.emit({
+                    'name': 'process_name',
+                    'ph': 'M',
+                    'args': {'name': multiprocessing.current_process().name},
+                    })
+        event.setdefault('pid', pid)
+        event.setdefault('tid', threading.current_thread().ident)
+        line = json.dumps(event, default=str) + '\n'
+        fd = os.open(
+                self.events_path,
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                0644,
+                )
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def track_id(self, track):
+        """
+        Returns a made-up thread ID for the named :attr:`track`, so that
+        spans which are not tied to any one thread get a row of their own in
+        the trace viewer.
+
+        """
+        tid = self.tracks.get(track)
+        if tid is None:
+            tid = self.tracks[track] = -1 - len(self.tracks)
+            self.emit({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'tid': tid,
+                    'args': {'name': track},
+                    })
+        return tid
+
+    def finish(self):
+        """Writes the final trace file, and removes the scratch file."""
+        events = []
+        if os.path.exists(self.events_path):
+            with open(self.events_path) as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # truncated by a terminated deployer process
+                        continue
+            os.remove(self.events_path)
+        with open(self.path, 'w') as f:
+            json.dump(
+                    {'traceEvents': events, 'displayTimeUnit': 'ms'},
+                    f,
+                    )
+        log.info('Wrote trace to %s' % self.path)
+
+
+# the active tracer.  deployer processes inherit it when they are forked.
+_TRACER = None
+
+
+def start_tracing(path):
+    """Starts collecting trace events for the trace file at :attr:`path`."""
+    global _TRACER
+    _TRACER = Tracer(path)
+
+
+def stop_tracing():
+    """Stops tracing and writes out the trace file."""
+    global _TRACER
+    if _TRACER:
+        tracer, _TRACER = _TRACER, None
+        tracer.finish()
+
+
+def is_tracing():
+    return _TRACER is not None
+
+
+@contextlib.contextmanager
+def span(name, cat, **args):
+    """
+    Context manager that wraps its body in begin/end trace events.  Does
+    nothing unless tracing has been started.
+
+    :param str name:  The name of the span.
+
+    :param str cat:  The category of the span (e.g. ``deployer``,
+        ``phase``).  Trace viewers can filter on these.
+
+    :param args:  Extra details to attach to the span.
+
+    """
+    tracer = _TRACER
+    if not tracer:
+        yield
+        return
+    tracer.emit({'name': name, 'cat': cat, 'ph': 'B', 'ts': _now_us(),
+            'args': args})
+    try:
+        yield
+    finally:
+        tracer.emit({'name': name, 'cat': cat, 'ph': 'E', 'ts': _now_us()})
+
+
+def complete(name, cat, start, end, track=None, **args):
+    """
+    Records a span that has already finished.
+
+    :param float start:  The start time of the span, as from
+        :func:`time.time`.
+
+    :param float end:  The end time of the span.
+
+    :param str track:  If set, the span is shown in a row of its own with
+        this name instead of in the row for the current thread.
+
+    """
+    tracer = _TRACER
+    if not tracer:
+        return
+    event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int(start * 1e6),
+            'dur': int((end - start) * 1e6),
+            'args': args,
+            }
+    if track:
+        event['tid'] = tracer.track_id(track)
+    tracer.emit(event)
@@ -22,17 +22,20 @@ import copy
 import json
 import logging
 import multiprocessing
+import Queue
+import random
 import time
 import re
 import subprocess
 import sys
+import threading
+import zlib
+from cStringIO import StringIO
 from datetime import datetime
-from logging.handlers import BufferingHandler
 
 import boto
-from boto.s3.key import Key
 from logutils.queue import QueueHandler, QueueListener
-from . import attributes as A
+from . import attributes as A, status
 
 
 CONSOLE_LOGGING_FORMAT = '%(asctime)s %(levelname)8s %(processName)s - %(message)s'  # noqa
@@ -91,48 +94,93 @@ class StrictAttrBag(object):
             setattr(self, k, v)
 
 
-class SharedMap(object):
+class InventoryMap(object):
     """
-    A multiprocess-safe :class:`Mapping` object that can be used to return
-    values from child processes.
+    A thread-safe collection of named lists and named :class:`Mapping`
+    objects.
+
+    It lives in a single process, so updates are cheap.  Deployers that run
+    in child processes send their updates back to the parent process when
+    they finish (see :meth:`bang.deployers.deployer.Deployer.apply_results`).
 
     """
-    def __init__(self, manager):
-        self.lists = manager.dict()
-        self.dicts = manager.dict()
-        self.lock = multiprocessing.Lock()
+    def __init__(self):
+        self.lists = {}
+        self.dicts = {}
+        self.lock = threading.Lock()
+
+        # bumped on every update, so :meth:`snapshot` knows when to refresh
+        self.version = 0
+        self._snapshot = None
 
     def append(self, list_name, value):
         """Appends :attr:`value` to the list named :attr:`list_name`."""
         with self.lock:
-            l = self.lists.get(list_name)
-            if l:
-                l.append(value)
-            else:
-                l = [value]
-            self.lists[list_name] = l
+            self.lists.setdefault(list_name, []).append(value)
+            self.version += 1
 
     def merge(self, dict_name, values):
         """
         Performs deep-merge of :attr:`values` onto the :class:`Mapping` object
         named :attr:`dict_name`.
 
-        If :attr:`dict_name` does not yet exist, then a deep copy of
-        :attr:`values` is assigned as the initial mapping object for the given
-        name.
+        If :attr:`dict_name` does not yet exist, then :attr:`values` is
+        assigned as the initial mapping object for the given name.
 
         :param str dict_name:  The name of the dict onto which the values
             should be merged.
 
+        The mapping is replaced rather than modified (see
+        :func:`deep_merged`), so it may share parts with :attr:`values`, and
+        with earlier snapshots, but none of them ever change underneath one
+        another.
+
         """
+        with self.lock:
+            self.dicts[dict_name] = deep_merged(
+                    self.dicts.get(dict_name) or {},
+                    values,
+                    )
+            self.version += 1
+
+    def dump(self):
+        """Returns a copy of the contents, for :meth:`load`."""
+        with self.lock:
+            return copy.deepcopy((self.lists, self.dicts))
 
+    def load(self, contents):
+        """Replaces the contents with those returned by :meth:`dump`."""
         with self.lock:
-            d = self.dicts.get(dict_name)
-            if d:
-                deep_merge_dicts(d, values)
-            else:
-                d = copy.deepcopy(values)
-            self.dicts[dict_name] = d
+            self.lists, self.dicts = contents
+            self.version += 1
+
+    def snapshot(self):
+        """
+        Returns a ``(lists, dicts)`` copy of the contents that is shared by
+        every caller until the contents change again.
+
+        The snapshot is taken once, however many times it is asked for, so
+        callers must treat it as read-only.  Copy whatever needs changing
+        (e.g. :class:`~bang.inventory.BangsibleInventory` copies the vars of
+        each host it hands to ansible).
+
+        Only the lists are copied.  The vars of each host are shared with
+        the inventory, because :meth:`merge` never modifies them in place.
+
+        """
+        with self.lock:
+            if self._snapshot is None or self._snapshot[0] != self.version:
+                self._snapshot = (
+                        self.version,
+                        (
+                            dict(
+                                (k, list(v))
+                                for k, v in self.lists.iteritems()
+                                ),
+                            dict(self.dicts),
+                            ),
+                        )
+            return self._snapshot[1]
 
 
 class SharedNamespace(object):
@@ -186,32 +234,125 @@ class ColoredConsoleFormatter(logging.Formatter):
                 )
 
 
-class S3Handler(BufferingHandler):
+class S3Handler(logging.Handler):
     """
-    Buffers all logging events, then uploads them all at once "atexit" to a
-    single file in S3.
+    Streams logging events to a single gzipped file in S3.
+
+    The formatted events are compressed as they arrive, and each
+    :attr:`part_size` bytes of compressed output are uploaded as a part of an
+    S3 multipart upload by a background thread.  The last part is uploaded,
+    and the upload completed, when the handler is closed "atexit".  At most a
+    couple of parts are held in memory at any time, however long the run.
+
+    The file is stored with ``Content-Encoding: gzip``, so HTTP clients see
+    the plain JSON events.
+
     """
-    def __init__(self, bucket, prefix=''):
-        BufferingHandler.__init__(self, 0)
+    #: The smallest part that S3 accepts, except for the last one.
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, bucket, prefix='', part_size=MIN_PART_SIZE):
+        logging.Handler.__init__(self)
         self.bucket = bucket
         self.prefix = prefix
+        self.part_size = max(part_size, self.MIN_PART_SIZE)
+        self.key_name = '/'.join((prefix, 'bang-%f' % time.time()))
+
+        # gzip format, so the parts add up to a plain .gz file
+        self._compressor = zlib.compressobj(
+                9,
+                zlib.DEFLATED,
+                16 + zlib.MAX_WBITS,
+                )
+        self._chunks = []
+        self._size = 0
+        self._emitted = False
 
-    def shouldFlush(self, record):
-        return False
+        # compressed parts waiting for the uploader.  emit() blocks when it is
+        # full, which bounds the memory used if S3 is slow.
+        self._parts = Queue.Queue(maxsize=2)
+        self._uploader = None
 
-    def flush(self):
-        payload = ''
-        while len(self.buffer) > 0:
-            record = self.buffer.pop(0)
-            if record.levelno >= self.level:
-                payload += self.format(record)
-        if payload:
-            conn = boto.connect_s3()
-            bucket = conn.get_bucket(self.bucket)
-            key = Key(bucket)
-            key.key = '/'.join((self.prefix, 'bang-%f' % time.time()))
-            key.content_type = 'application/json'
-            key.set_contents_from_string(payload)
+    def emit(self, record):
+        try:
+            data = self.format(record)
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            self._emitted = True
+            self._add(self._compressor.compress(data))
+            if self._size >= self.part_size:
+                self._send_part()
+        except Exception:
+            self.handleError(record)
+
+    def _add(self, chunk):
+        if chunk:
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+
+    def _send_part(self):
+        part = ''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        if not self._uploader:
+            self._uploader = threading.Thread(
+                    name='s3 log upload',
+                    target=self._upload,
+                    )
+            self._uploader.daemon = True
+            self._uploader.start()
+        self._parts.put(part)
+
+    def _upload(self):
+        upload = None
+        failed = False
+        part_num = 0
+        while True:
+            part = self._parts.get()
+            if part is None:
+                break
+            if failed:
+                # keep draining, so that emit() never blocks
+                continue
+            try:
+                if not upload:
+                    bucket = boto.connect_s3().get_bucket(self.bucket)
+                    upload = bucket.initiate_multipart_upload(
+                            self.key_name,
+                            headers={
+                                'Content-Type': 'application/json',
+                                'Content-Encoding': 'gzip',
+                                },
+                            )
+                part_num += 1
+                upload.upload_part_from_file(StringIO(part), part_num)
+            except Exception as e:
+                # the log can't log its own failures
+                sys.stderr.write('Log upload to S3 failed: %s\n' % e)
+                failed = True
+                if upload:
+                    try:
+                        upload.cancel_upload()
+                    except Exception:
+                        pass
+        if upload and not failed:
+            upload.complete_upload()
+
+    def close(self):
+        """Uploads the last part, and waits for the upload to complete."""
+        self.acquire()
+        try:
+            if self._compressor:
+                self._add(self._compressor.flush())
+                self._compressor = None
+                if self._emitted:
+                    self._send_part()
+                if self._uploader:
+                    self._parts.put(None)
+                    self._uploader.join()
+        finally:
+            self.release()
+        logging.Handler.close(self)
 
 
 def sanitize_config_loglevel(level):
@@ -240,9 +381,9 @@ def initialize_logging(config):
         s3_handler.setFormatter(json_formatter)
         s3_handler.setLevel(logging.INFO)
 
-        # The parent process is the only one that actually buffers the log
-        # records in memory and writes them out to s3.  The child processes
-        # send all of their log records to the parent's queue.
+        # The parent process is the only one that actually streams the log
+        # records out to s3.  The child processes send all of their log
+        # records to the parent's queue.
         #
         # Using the QueueHandler and QueueListener classes from logutils-0.3.2
         # here since they're the implementations in future versions of stdlib
@@ -253,7 +394,7 @@ def initialize_logging(config):
 
         def cleanup():
             ql.stop()
-            s3_handler.flush()
+            s3_handler.close()
         atexit.register(cleanup)
         ql.start()
 
@@ -289,29 +430,81 @@ def initialize_logging(config):
     log.debug('Logging initialized.')
 
 
+class Backoff(object):
+    """
+    A polling strategy for :func:`poll_with_timeout`: check quickly at
+    first, then wait exponentially longer between checks, up to a cap.
+
+    Each delay is shortened by a random fraction of up to :attr:`jitter` so
+    that deployers that started together don't keep calling the provider API
+    in lockstep.
+
+    """
+    def __init__(self, initial_s=1, factor=2, max_s=60, jitter=0.25):
+        """
+        :param float initial_s:  The delay before the second check.
+
+        :param float factor:  How much longer each delay is than the one
+            before.  ``1`` polls at a fixed interval.
+
+        :param float max_s:  The longest delay between checks.
+
+        :param float jitter:  The largest fraction by which to shorten each
+            delay at random.
+
+        """
+        self.initial_s = initial_s
+        self.factor = factor
+        self.max_s = max_s
+        self.jitter = jitter
+
+    def delays(self):
+        """Yields the successive delays between checks, in seconds."""
+        # seeded here rather than in __init__, so that deployers forked from
+        # the same parent don't share a sequence
+        rng = random.Random()
+        delay = min(self.initial_s, self.max_s)
+        while True:
+            yield delay * (1 - self.jitter * rng.random())
+            delay = min(delay * self.factor, self.max_s)
+
+
 def poll_with_timeout(timeout_s, break_func, wake_every_s=60):
     """
-    Calls :attr:`break_func` every :attr:`wake_every_s` seconds for a total
-    duration of :attr:`timeout_s` seconds, or until :attr:`break_func` returns
-    something other than ``None``.
+    Calls :attr:`break_func` repeatedly for a total duration of
+    :attr:`timeout_s` seconds, or until :attr:`break_func` returns something
+    other than ``None``.
 
     If :attr:`break_func` returns anything other than ``None``, that value is
     returned immediately.
 
     Otherwise, continues polling until the timeout is reached, then returns
-    ``None``.
+    ``None``.  The last sleep is cut short so that :attr:`break_func` gets a
+    final call right at the deadline.
+
+    :param wake_every_s:  Either the number of seconds to sleep between
+        calls, or a :class:`Backoff` strategy.
 
     """
-    time_slept = 0
-    if wake_every_s > 60:
-        msg = '... sleeping for %0.2f minutes' % (wake_every_s / 60.0)
+    if isinstance(wake_every_s, Backoff):
+        backoff = wake_every_s
     else:
-        msg = '... sleeping for %d seconds' % wake_every_s
+        backoff = Backoff(wake_every_s, factor=1, max_s=wake_every_s, jitter=0)
+    delays = backoff.delays()
+    start = time.time()
+    time_slept = 0
     res = break_func()
-    while res is None and time_slept < timeout_s:
-        log.debug(msg)
-        time.sleep(wake_every_s)
-        time_slept += wake_every_s
+    if res is None and timeout_s > 0:
+        status.polling()
+    while res is None:
+        # time spent in break_func counts too
+        remaining = timeout_s - max(time_slept, time.time() - start)
+        if remaining <= 0:
+            break
+        delay = min(next(delays), remaining)
+        log.debug('... sleeping for %0.1f seconds' % delay)
+        time.sleep(delay)
+        time_slept += delay
         res = break_func()
     return res
 
@@ -400,6 +593,8 @@ def deep_merge_dicts(base, incoming):
     into :attr:`base`.  No attempt is made to preserve the original state of
     the objects passed in as arguments.
 
+    To leave the arguments untouched, use :func:`deep_merged` instead.
+
     :param dict base:  The target container for the merged values.  This will
         be modified *in-place*.
     :type base:  Any :class:`dict`-like object
@@ -411,14 +606,54 @@ def deep_merge_dicts(base, incoming):
     :rtype:  None
 
     """
-    for ki, vi in incoming.iteritems():
-        if (ki in base
-                and isinstance(vi, collections.MutableMapping)
-                and isinstance(base[ki], collections.MutableMapping)
-                ):
-            deep_merge_dicts(base[ki], vi)
-        else:
-            base[ki] = vi
+    # iterative, so that deeply nested vars can't hit the recursion limit
+    pending = [(base, incoming)]
+    while pending:
+        b, inc = pending.pop()
+        for ki, vi in inc.iteritems():
+            if (ki in b
+                    and isinstance(vi, collections.MutableMapping)
+                    and isinstance(b[ki], collections.MutableMapping)
+                    ):
+                pending.append((b[ki], vi))
+            else:
+                b[ki] = vi
+
+
+def deep_merged(base, incoming):
+    """
+    Returns the deep-merge of key-values from :attr:`incoming` onto
+    :attr:`base`, without modifying either of them.
+
+    Only the dicts along the merged paths are new.  Every other value,
+    including whole nested dicts, is shared with :attr:`base` or
+    :attr:`incoming` rather than copied, so the result must be treated as
+    read-only - merge again to change it.
+
+    :param dict base:  The mapping to merge onto.
+    :type base:  Any :class:`dict`-like object
+
+    :param dict incoming:  The mapping whose values win.
+    :type incoming:  Any :class:`dict`-like object
+
+    :rtype:  :class:`dict`
+
+    """
+    result = dict(base)
+    pending = [(result, incoming)]
+    while pending:
+        target, inc = pending.pop()
+        for ki, vi in inc.iteritems():
+            vb = target.get(ki)
+            if (isinstance(vi, collections.MutableMapping)
+                    and isinstance(vb, collections.MutableMapping)
+                    ):
+                # copy just this level, the rest is shared
+                merged = target[ki] = dict(vb)
+                pending.append((merged, vi))
+            else:
+                target[ki] = vi
+    return result
 
 
 def fork_exec(cmd_list, input_data=None):
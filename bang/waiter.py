@@ -0,0 +1,174 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Batched waiting on launching resources.
+
+Instead of each deployer polling the provider for its own servers, the
+deployers register the resources they are waiting on with the
+:class:`Waiter` for their provider and region.  A single polling thread
+describes all of the pending resources with one request per round, and wakes
+each deployer as soon as its resources are ready.
+
+Each registration keeps its own backoff schedule (see
+:class:`~bang.util.Backoff`).  A round is due as soon as any registration is
+due, and it checks every pending resource, so registrations that start at
+about the same time share their requests.
+
+There is one waiter per process, so the deployers that share it are those run
+by the ``thread`` executor, or by the ``inline`` executor.  Deployers in
+separate processes each poll on their own.
+
+"""
+import os
+import threading
+import time
+
+from . import status
+from .retry import is_transient
+from .util import Backoff, log
+
+
+class _Registration(object):
+    def __init__(self, keys, is_ready, delays):
+        self.keys = list(keys)
+        self.is_ready = is_ready
+        self.delays = delays
+        self.due = time.time() + next(delays)
+        self.found = {}
+        self.error = None
+        self.done = threading.Event()
+
+    def pending(self):
+        return [k for k in self.keys if k not in self.found]
+
+
+class Waiter(object):
+    """
+    Polls for many resources with a single, batched request per round.
+
+    Get the waiter for a provider and region with
+    :meth:`~bang.providers.bases.Provider.get_cached`, so that all of the
+    deployers in the process share it.
+
+    """
+    def __init__(self, describe, backoff=None):
+        """
+        :param describe:  Called with a list of resource keys, returns a
+            :class:`dict` that maps each key that the provider knows about
+            to its current description.
+        :type describe:  :class:`callable`
+
+        :param backoff:  The polling schedule for each registration.
+        :type backoff:  :class:`~bang.util.Backoff`
+
+        """
+        self.describe = describe
+        self.backoff = backoff or Backoff(2, max_s=15)
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.cond = threading.Condition()
+        self.registrations = []
+        self.thread = None
+
+    def wait(self, keys, timeout_s, is_ready=lambda desc: True):
+        """
+        Blocks until every one of :attr:`keys` is described as ready, or
+        until :attr:`timeout_s` has elapsed.
+
+        :param list keys:  The keys of the resources to wait on.
+
+        :param float timeout_s:  The number of seconds to wait.
+
+        :param is_ready:  Called with the description of a resource, returns
+            ``True`` once it is ready.
+        :type is_ready:  :class:`callable`
+
+        :returns:  The descriptions of the ready resources, in the order of
+            :attr:`keys`, or ``None`` if they were not all ready in time.
+
+        """
+        if self.pid != os.getpid():
+            # the polling thread didn't survive the fork
+            self._reset()
+        reg = _Registration(keys, is_ready, self.backoff.delays())
+        with self.cond:
+            self.registrations.append(reg)
+            if not self.thread:
+                self.thread = threading.Thread(
+                        name='waiter',
+                        target=self._run,
+                        )
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify()
+        status.polling()
+        reg.done.wait(timeout_s)
+        with self.cond:
+            if reg in self.registrations:
+                # timed out, let the polling thread move on
+                self.registrations.remove(reg)
+                self.cond.notify()
+        if reg.error:
+            raise reg.error
+        if reg.done.is_set():
+            return [reg.found[k] for k in reg.keys]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.registrations:
+                    self.thread = None
+                    return
+                wait_s = min(r.due for r in self.registrations) - time.time()
+                if wait_s > 0:
+                    self.cond.wait(wait_s)
+                    continue
+                regs = list(self.registrations)
+            self._poll(regs)
+
+    def _poll(self, regs):
+        keys = sorted(set(k for r in regs for k in r.pending()))
+        try:
+            found = self.describe(keys)
+        except Exception as e:
+            if not is_transient(e):
+                self._finish(regs, error=e)
+                return
+            log.warn('Polling for %d resources failed: %s' % (len(keys), e))
+            found = {}
+        now = time.time()
+        done = []
+        for r in regs:
+            for k in r.pending():
+                desc = found.get(k)
+                if desc is not None and r.is_ready(desc):
+                    r.found[k] = desc
+            if not r.pending():
+                done.append(r)
+            elif r.due <= now:
+                r.due = now + next(r.delays)
+        self._finish(done)
+
+    def _finish(self, regs, error=None):
+        with self.cond:
+            for r in regs:
+                r.error = error
+                if r in self.registrations:
+                    self.registrations.remove(r)
+                r.done.set()
@@ -0,0 +1,107 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+from mock import Mock, patch
+from bang import attributes as A
+from bang.providers.aws import EC2
+from bang.util import Backoff
+
+
+def fake_instance(n, state='running'):
+    return Mock(
+            id='i-%d' % n,
+            state=state,
+            public_dns_name='pub-%d' % n,
+            private_dns_name='priv-%d' % n,
+            )
+
+
+class TestEC2(unittest.TestCase):
+    def setUp(self):
+        provider = Mock(name='aws')
+        provider.name = 'aws'
+        provider.creds = {
+                A.creds.ACCESS_KEY_ID: 'id',
+                A.creds.SECRET_ACCESS_KEY: 'secret',
+                }
+        provider.get_cached.side_effect = lambda key, func: func()
+        self.ec2 = EC2(provider)
+        self.conn = self.ec2._ec2 = Mock()
+
+    @patch('bang.providers.aws.WAIT_BACKOFF', Backoff(0.01))
+    @patch('bang.providers.aws.time.sleep')
+    def test_create_servers(self, sleep):
+        pending = [fake_instance(n, 'pending') for n in range(3)]
+        self.conn.run_instances.return_value = Mock(instances=pending)
+        self.conn.get_all_instances.side_effect = [
+                [Mock(instances=pending)],
+                [Mock(instances=[fake_instance(n) for n in range(3)])],
+                ]
+        tags = {'stack': 'foo', 'role': 'web'}
+        servers = self.ec2.create_servers(
+                3, 'foo-web', 'ami-1', 'm1.small', 'key', tags=tags,
+                )
+
+        self.assertEqual(['i-0', 'i-1', 'i-2'], [s['id'] for s in servers])
+        self.assertEqual(['pub-2'], servers[2][A.server.PUBLIC_IPS])
+        # one launch request and one tag request for the whole batch
+        _, kwargs = self.conn.run_instances.call_args
+        self.assertEqual(3, kwargs['min_count'])
+        self.assertEqual(3, kwargs['max_count'])
+        self.conn.create_tags.assert_called_once_with(
+                ['i-0', 'i-1', 'i-2'],
+                tags,
+                )
+        self.assertEqual(2, self.conn.get_all_instances.call_count)
+
+    @patch('bang.providers.aws.WAIT_BACKOFF', Backoff(0.01))
+    @patch('bang.providers.aws.time.sleep')
+    def test_create_server(self, sleep):
+        self.conn.run_instances.return_value = Mock(
+                instances=[fake_instance(0)]
+                )
+        self.conn.get_all_instances.return_value = [
+                Mock(instances=[fake_instance(0)]),
+                ]
+        server = self.ec2.create_server(
+                'foo-web', 'ami-1', 'm1.small', 'key', client_token='abc',
+                )
+        self.assertEqual('i-0', server['id'])
+        self.assertFalse(self.conn.create_tags.called)
+        _, kwargs = self.conn.run_instances.call_args
+        self.assertEqual('abc', kwargs['client_token'])
+
+    @patch('bang.providers.aws.WAIT_BACKOFF', Backoff(0.01))
+    def test_find_all_running(self):
+        starting = [fake_instance(0), fake_instance(1, 'pending')]
+        running = [fake_instance(0), fake_instance(1)]
+        self.conn.get_all_instances.return_value = [Mock(instances=starting)]
+        found = self.ec2.find_servers({'stack': 'foo'}, running=False)
+        _, kwargs = self.conn.get_all_instances.call_args
+        self.assertEqual(
+                ['pending', 'running'],
+                kwargs['filters']['instance-state-name'],
+                )
+
+        self.conn.get_all_instances.side_effect = [
+                [Mock(instances=starting)],
+                [Mock(instances=running)],
+                ]
+        servers = self.ec2.find_all_running(found, 10)
+        self.assertEqual(['i-0', 'i-1'], [s['id'] for s in servers])
+        self.assertEqual(3, self.conn.get_all_instances.call_count)
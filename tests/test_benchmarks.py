@@ -0,0 +1,101 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Micro-benchmarks.  Run them with ``./test --benchmarks``.
+"""
+import copy
+import sys
+import timeit
+
+from nose.plugins.attrib import attr
+import bang.util as U
+
+
+def hostvars(n):
+    """Returns the hostvars of a typical app server."""
+    return {
+            'server_class': 'web',
+            'stack': 'foo',
+            'role': 'web',
+            'app': {
+                'version': '1.%d' % n,
+                'workers': 8,
+                'env': dict(('VAR_%d' % i, 'value %d' % i) for i in range(40)),
+                'features': dict(('flag_%d' % i, i % 2) for i in range(20)),
+                },
+            'nginx': {
+                'vhosts': [
+                    {'name': 'site%d' % i, 'port': 8000 + i}
+                    for i in range(10)
+                    ],
+                'tuning': {'worker_connections': 1024, 'keepalive': 65},
+                },
+            'users': dict(
+                ('user%d' % i, {'uid': 1000 + i, 'groups': ['a', 'b']})
+                for i in range(30)
+                ),
+            }
+
+
+def report(name, seconds, number):
+    sys.stderr.write('\n%-40s %8.1f us' % (name, seconds / number * 1e6))
+
+
+@attr('bench')
+def test_merge_hostvars():
+    base = hostvars(0)
+    incoming = {
+            'app': {'version': '2.0', 'env': {'VAR_1': 'changed'}},
+            'public_ip': '10.0.0.1',
+            }
+    number = 2000
+
+    def copy_then_merge():
+        merged = copy.deepcopy(base)
+        U.deep_merge_dicts(merged, copy.deepcopy(incoming))
+        return merged
+
+    report(
+            'deepcopy + deep_merge_dicts',
+            timeit.timeit(copy_then_merge, number=number),
+            number,
+            )
+    report(
+            'deep_merged',
+            timeit.timeit(lambda: U.deep_merged(base, incoming), number=number),
+            number,
+            )
+
+
+@attr('bench')
+def test_inventory_snapshot():
+    inv = U.InventoryMap()
+    for n in range(200):
+        host = 'web%d.example.com' % n
+        inv.append('web', host)
+        inv.merge(host, hostvars(n))
+    number = 50
+
+    def merge_and_snapshot():
+        inv.merge('web0.example.com', {'app': {'version': '2.0'}})
+        inv.snapshot()
+
+    report(
+            'InventoryMap merge + snapshot (200 hosts)',
+            timeit.timeit(merge_and_snapshot, number=number),
+            number,
+            )
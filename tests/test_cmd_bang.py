@@ -0,0 +1,31 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+from mock import patch
+from bang.cmd_bang import run_bang
+
+
+class TestMultiStack(unittest.TestCase):
+    def test_single_stack_flags(self):
+        # these must never fall through to a deploy
+        for flag in ('--list', '--status', '--pipeline', '--dump-config=json'):
+            with patch('bang.cmd_bang.run_stacks') as run_stacks, \
+                    patch('sys.stderr'):
+                with self.assertRaises(SystemExit):
+                    run_bang(['--multi-stack', flag, 'a.yml', 'b.yml'])
+            self.assertFalse(run_stacks.called)
@@ -0,0 +1,454 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import socket
+import unittest
+
+from mock import Mock, patch
+from bang import BangError, deployers as D, resources as R, attributes as A
+from bang.deployers import cloud
+
+
+class FakeStack(object):
+    def __init__(self, config):
+        self.config = config
+
+
+class FakeDeployer(str):
+    pass
+
+
+def fake_get_deployers(res_config, res_type, stack, creds):
+    count = res_config.get('instance_count', 1)
+    return [
+            FakeDeployer('%s:%s' % (res_type, res_config['name']))
+            for _ in range(count)
+            ]
+
+
+class TestDeployerGraph(unittest.TestCase):
+    config = {
+            'deployer_credentials': {},
+            R.SERVER_SECURITY_GROUPS: [
+                {'name': 'foo-web', 'provider': 'aws'},
+                {'name': 'foo-db', 'provider': 'aws'},
+                ],
+            R.SERVER_SECURITY_GROUP_RULES: [
+                {'name': 'foo-web', 'provider': 'aws'},
+                {'name': 'foo-db', 'provider': 'aws'},
+                ],
+            R.SSH_KEYS: [
+                {'name': 'deploy-key', 'provider': 'aws'},
+                ],
+            R.DATABASES: [
+                {'name': 'slowdb', 'provider': 'aws'},
+                ],
+            R.SERVERS: [
+                {
+                    'name': 'web',
+                    'provider': 'aws',
+                    'instance_count': 2,
+                    'security_groups': ['foo-web', 'some-external-group'],
+                    'ssh_key_name': 'deploy-key',
+                    },
+                ],
+            R.LOAD_BALANCERS: [
+                {'name': 'lb', 'provider': 'aws', 'balance_server_name': 'web'},
+                ],
+            R.DYNAMIC_LB_SEC_GROUPS: [
+                {'name': 'foo-lb-secgroup', 'provider': 'aws',
+                    'load_balancer': 'lb'},
+                ],
+            }
+
+    def _graph(self, staged=False):
+        with patch('bang.deployers.cloud.get_deployers', fake_get_deployers):
+            ds, deps = D.get_deployer_graph(FakeStack(self.config), staged)
+        return ds, [set(ds[i] for i in d) for d in deps]
+
+    def test_graph(self):
+        ds, deps = self._graph()
+        deps = dict(zip(ds, deps))
+        self.assertEqual(set(), deps['databases:slowdb'])
+        self.assertEqual(
+                set(['server_security_groups:foo-web',
+                    'server_security_groups:foo-db']),
+                deps['server_security_group_rules:foo-db'],
+                )
+        self.assertEqual(
+                set(['server_security_groups:foo-web',
+                    'server_security_group_rules:foo-web',
+                    'ssh_pub_keys:deploy-key']),
+                deps['servers:web'],
+                )
+        self.assertEqual(set(['servers:web']), deps['load_balancers:lb'])
+        self.assertEqual(
+                set(['load_balancers:lb']),
+                deps['_load_balancer_sec_groups:foo-lb-secgroup'],
+                )
+
+    def test_staged(self):
+        ds, deps = self._graph(staged=True)
+        self.assertEqual(10, len(ds))
+        lb = ds.index('load_balancers:lb')
+        self.assertEqual(
+                set(['databases:slowdb', 'servers:web']),
+                deps[lb],
+                )
+
+    def test_deployer_ids(self):
+        ds, _ = self._graph()
+        ids = [d.deployer_id for d in ds]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue('servers/web/0' in ids)
+        self.assertTrue('servers/web/1' in ids)
+
+    def test_cycle(self):
+        self.assertRaises(BangError, D._check_for_cycles, [set([1]), set([0])])
+
+
+class FakeInventoryStack(object):
+    name = 'foo'
+
+    def __init__(self):
+        self.hosts = []
+
+    def get_namespace(self, key):
+        return None
+
+    def add_host(self, host, group_names=None, host_vars=None):
+        self.hosts.append(host)
+
+
+def fake_server(n):
+    return {'id': 'i-%d' % n, A.server.PUBLIC_IPS: ['pub-%d' % n]}
+
+
+def all_running(servers, timeout_s):
+    return servers
+
+
+class TestFleetServerDeployer(unittest.TestCase):
+    config = {
+            'name': 'web',
+            'provider': 'aws',
+            'region_name': 'us-east-1',
+            'instance_count': 3,
+            'tags': {'stack': 'foo', 'role': 'web'},
+            'groups': ['web'],
+            'hostvars': {},
+            'disk_image_id': 'ami-1',
+            'instance_type': 'm1.small',
+            'ssh_key_name': 'key',
+            'availability_zone': None,
+            'launch_timeout_s': 10,
+            'security_groups': ['foo-web'],
+            'post_launch_delay_s': 0,
+            }
+
+    def test_get_deployers(self):
+        provider = Mock()
+        consul = provider.get_consul.return_value
+        with patch('bang.deployers.cloud.get_provider', return_value=provider):
+            ds = cloud.get_deployers(
+                    self.config,
+                    R.SERVERS,
+                    FakeInventoryStack(),
+                    {'aws': {}},
+                    )
+            self.assertEqual(1, len(ds))
+            self.assertTrue(isinstance(ds[0], cloud.FleetServerDeployer))
+
+            # a single server is a fleet of one
+            ds = cloud.get_deployers(
+                    dict(self.config, instance_count=1),
+                    R.SERVERS,
+                    FakeInventoryStack(),
+                    {'aws': {}},
+                    )
+            self.assertEqual(1, len(ds))
+            self.assertTrue(isinstance(ds[0], cloud.FleetServerDeployer))
+
+            # consuls that can't launch in batches get a deployer per server
+            del consul.create_servers
+            ds = cloud.get_deployers(
+                    self.config,
+                    R.SERVERS,
+                    FakeInventoryStack(),
+                    {'aws': {}},
+                    )
+            self.assertEqual(3, len(ds))
+
+    def test_launch_shortfall(self):
+        stack = FakeInventoryStack()
+        consul = Mock()
+        consul.find_servers.return_value = [fake_server(0)]
+        consul.find_all_running.side_effect = all_running
+        consul.create_servers.return_value = [fake_server(1), fake_server(2)]
+        d = cloud.FleetServerDeployer(stack, self.config, consul)
+        d.run('deploy')
+
+        args, _ = consul.create_servers.call_args
+        self.assertEqual((2, 'foo-web'), args[:2])
+        self.assertEqual(['pub-0', 'pub-1', 'pub-2'], stack.hosts)
+
+    @patch('bang.deployers.deployer.time.sleep')
+    def test_retried_launch_reuses_token(self, sleep):
+        stack = FakeInventoryStack()
+        consul = Mock()
+        consul.find_servers.return_value = []
+        consul.create_servers.side_effect = [
+                socket.error('connection reset'),
+                [fake_server(n) for n in range(3)],
+                ]
+        d = cloud.FleetServerDeployer(stack, self.config, consul)
+        d.run('deploy')
+
+        tokens = [
+                kw['client_token']
+                for _, kw in consul.create_servers.call_args_list
+                ]
+        self.assertEqual(2, len(tokens))
+        self.assertEqual(tokens[0], tokens[1])
+        self.assertEqual(3, len(stack.hosts))
+
+    def test_nothing_to_launch(self):
+        stack = FakeInventoryStack()
+        consul = Mock()
+        consul.find_servers.return_value = [fake_server(n) for n in range(4)]
+        consul.find_all_running.side_effect = all_running
+        d = cloud.FleetServerDeployer(stack, self.config, consul)
+        with patch('bang.deployers.cloud.log') as log:
+            d.run('deploy')
+        self.assertFalse(consul.create_servers.called)
+        self.assertEqual(3, len(stack.hosts))
+        self.assertTrue('surplus web servers: i-3' in log.warn.call_args[0][0])
+
+    def test_wait_for_found(self):
+        # servers that are still starting up are waited on together, and
+        # only make it into the inventory once they are running
+        stack = FakeInventoryStack()
+        consul = Mock()
+        starting = [
+                {'id': 'i-%d' % n, A.server.PUBLIC_IPS: []}
+                for n in range(3)
+                ]
+        consul.find_servers.return_value = starting
+        consul.find_all_running.return_value = [
+                fake_server(n) for n in range(3)
+                ]
+        d = cloud.FleetServerDeployer(stack, self.config, consul)
+        d.run('deploy')
+
+        _, kwargs = consul.find_servers.call_args
+        self.assertFalse(kwargs['running'])
+        consul.find_all_running.assert_called_once_with(starting, 10)
+        self.assertFalse(consul.create_servers.called)
+        self.assertEqual(['pub-0', 'pub-1', 'pub-2'], stack.hosts)
+
+
+class FakeRollingStack(FakeInventoryStack):
+    def __init__(self):
+        super(FakeRollingStack, self).__init__()
+        self.configured = []
+        self.config = {
+                A.DEPLOYER_CREDS: {'hpcloud': {}},
+                R.LOAD_BALANCERS: [{
+                    'name': 'lb',
+                    'provider': 'hpcloud',
+                    'region_name': 'az-1',
+                    'balance_server_name': 'web',
+                    'backend_port': 80,
+                    }],
+                }
+
+    def get_class_playbooks(self, name):
+        return ['%s.yml' % name]
+
+    def run_playbooks(self, hosts=None, playbooks=None):
+        self.configured.append((sorted(hosts), playbooks))
+
+
+class TestRollingServerDeployer(unittest.TestCase):
+    config = dict(
+            TestFleetServerDeployer.config,
+            instance_count=4,
+            disk_image_id='ami-2',
+            rolling={'batch_size': 2, 'max_in_flight': 2},
+            )
+
+    def _server(self, n, image):
+        return dict(fake_server(n), disk_image_id=image)
+
+    def test_get_deployers(self):
+        provider = Mock()
+        with patch('bang.deployers.cloud.get_provider', return_value=provider):
+            ds = cloud.get_deployers(
+                    self.config,
+                    R.SERVERS,
+                    FakeInventoryStack(),
+                    {'aws': {}},
+                    )
+        self.assertEqual(1, len(ds))
+        self.assertTrue(isinstance(ds[0], cloud.RollingServerDeployer))
+
+    def test_replace(self):
+        stack = FakeRollingStack()
+        consul = Mock()
+        consul.find_servers.return_value = [
+                self._server(0, 'ami-2'),
+                self._server(1, 'ami-1'),
+                self._server(2, 'ami-1'),
+                self._server(3, 'ami-1'),
+                ]
+        launched = iter(range(10, 20))
+        consul.create_servers.side_effect = lambda count, *a, **kw: [
+                self._server(next(launched), 'ami-2') for _ in range(count)
+                ]
+        lb_consul = Mock()
+        lb_consul.find_lb_by_name.return_value = {'id': 'lb-1'}
+        lb_consul.lb_details.return_value = {'nodes': [
+                {'id': n, 'address': 'pub-%d' % n, 'port': 80}
+                for n in range(4)
+                ]}
+        provider = Mock()
+        provider.get_consul.return_value = lb_consul
+
+        d = cloud.RollingServerDeployer(stack, self.config, consul)
+        with patch('bang.deployers.cloud.get_provider', return_value=provider):
+            d.run('deploy')
+
+        # the outdated servers go in batches of 2, and each new batch is
+        # configured and balanced before its old servers are deleted
+        self.assertEqual(
+                [2, 1],
+                [c[0][0] for c in consul.create_servers.call_args_list],
+                )
+        self.assertEqual(
+                (['pub-10', 'pub-11'], ['web.yml']),
+                stack.configured[0],
+                )
+        _, _, hosts, port = lb_consul.match_lb_nodes.call_args_list[0][0]
+        self.assertEqual(set(['pub-0', 'pub-3', 'pub-10', 'pub-11']), hosts)
+        self.assertEqual(80, port)
+        self.assertEqual(
+                ['i-1', 'i-2', 'i-3'],
+                sorted(c[0][0] for c in consul.delete_server.call_args_list),
+                )
+        self.assertEqual(
+                ['pub-0', 'pub-10', 'pub-11', 'pub-12'],
+                sorted(stack.hosts),
+                )
+
+    def test_up_to_date(self):
+        stack = FakeRollingStack()
+        consul = Mock()
+        consul.find_servers.return_value = [
+                self._server(n, 'ami-2') for n in range(4)
+                ]
+        d = cloud.RollingServerDeployer(stack, self.config, consul)
+        d.run('deploy')
+        self.assertFalse(consul.create_servers.called)
+        self.assertFalse(consul.delete_server.called)
+        self.assertEqual(4, len(stack.hosts))
+
+
+class TestAssignExisting(unittest.TestCase):
+    def test_hand_out(self):
+        consul = Mock()
+        consul.find_servers.return_value = [fake_server(n) for n in range(2)]
+        config = dict(TestFleetServerDeployer.config, instance_count=3)
+        ds = [
+                cloud.ServerDeployer(FakeInventoryStack(), config, consul)
+                for _ in range(3)
+                ]
+        for n, d in enumerate(ds):
+            d.deployer_id = 'servers/web/%d' % n
+
+        # restored from the journal
+        ds[1].server_attrs = fake_server(1)
+        ds[1].resume_at = 2
+
+        D.assign_existing(ds)
+        self.assertEqual(1, consul.find_servers.call_count)
+        self.assertEqual(fake_server(0), ds[0].assigned_server_attrs)
+        self.assertEqual(None, ds[1].assigned_server_attrs)
+        self.assertEqual(None, ds[2].assigned_server_attrs)
+
+        ds[0].find_existing()
+        self.assertEqual(fake_server(0), ds[0].server_attrs)
+        ds[2].find_existing()
+        self.assertEqual(None, ds[2].server_attrs)
+
+
+@patch('bang.deployers.deployer.time.sleep')
+class TestNoRetry(unittest.TestCase):
+    def test_phase_names(self, sleep):
+        for name in dir(cloud):
+            cls = getattr(cloud, name)
+            if not isinstance(cls, type) or not issubclass(cls, D.Deployer):
+                continue
+            for phase in cls.no_retry_phases:
+                self.assertTrue(
+                        callable(getattr(cls, phase, None)),
+                        '%s.%s' % (name, phase),
+                        )
+
+    def test_create_db(self, sleep):
+        consul = Mock()
+        consul.find_db_instance.return_value = None
+        consul.create_db.side_effect = socket.error('connection reset')
+        config = {
+                'name': 'db',
+                'provider': 'aws',
+                'instance_type': 'db.m1.small',
+                'admin_username': 'admin',
+                'admin_password': 'secret',
+                'db_name': 'foo',
+                'storage_size': 5,
+                'launch_timeout_s': 10,
+                'groups': ['db'],
+                }
+        d = cloud.DatabaseDeployer(FakeInventoryStack(), config, consul)
+        with self.assertRaises(socket.error):
+            d.deploy()
+        self.assertEqual(1, consul.create_db.call_count)
+        self.assertFalse(sleep.called)
+
+    def test_lb_secgroup_rules(self, sleep):
+        # a retried find_existing doesn't add the LB rules twice
+        stack = Mock()
+        stack.lb_sec_groups.dicts = {
+                'lb': {'hosts': ['10.0.0.1'], 'port': '443'},
+                }
+        consul = Mock()
+        consul.find_secgroup.side_effect = [
+                socket.error('connection reset'),
+                Mock(rules={}),
+                ]
+        config = {
+                'name': 'foo-lb-secgroup',
+                'provider': 'hpcloud',
+                'region_name': 'az-1',
+                'load_balancer': 'lb',
+                'rules': [],
+                }
+        d = cloud.LoadBalancerSecurityGroupsDeployer(stack, config, consul)
+        d.deploy()
+        consul.create_secgroup_rule.assert_called_once_with(
+                'tcp', '443', '443', '10.0.0.1/32', 'foo-lb-secgroup',
+                )
+        self.assertEqual([], config['rules'])
@@ -0,0 +1,99 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+from bang.history import DurationHistory, critical_path
+from bang.scheduler import Scheduler
+
+
+class FakeDeployer(object):
+    expected_duration_s = 10
+    runs_inline = False
+
+    def __init__(self, name, log=None, provider='aws', region_name=None,
+            instance_type=None):
+        self.name = name
+        self.log = log
+        self.provider = provider
+        self.region_name = region_name
+        self.instance_type = instance_type
+
+    def __str__(self):
+        return self.name
+
+    def run(self, action):
+        self.log.append(self.name)
+
+
+class OtherDeployer(FakeDeployer):
+    pass
+
+
+class TestDurationHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'bang', 'durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_estimates(self):
+        h = DurationHistory(self.path)
+        small = FakeDeployer('a', region_name='us-east-1', instance_type='s')
+        self.assertEqual(10, h.estimate(small))
+        h.record(small, 100)
+        h.record(small, 200)
+        self.assertEqual(130, h.estimate(small))
+        h.save()
+
+        h = DurationHistory(self.path)
+        self.assertEqual(130, h.estimate(small))
+        # a new instance type falls back to the same region
+        big = FakeDeployer('b', region_name='us-east-1', instance_type='xl')
+        self.assertEqual(130, h.estimate(big))
+        # ... and then to the deployer class
+        self.assertEqual(130, h.estimate(FakeDeployer('c', provider='hp')))
+        self.assertEqual(10, h.estimate(OtherDeployer('d')))
+
+
+class TestCriticalPath(unittest.TestCase):
+    def test_critical_path(self):
+        #   0 (5) -> 1 (1) -> 2 (1)
+        #   3 (2) -> 4 (10)
+        #   5 (1)
+        estimates = [5, 1, 1, 2, 10, 1]
+        deps = [set(), set([0]), set([1]), set(), set([3]), set()]
+        remaining, path = critical_path(estimates, deps)
+        self.assertEqual([7, 2, 1, 12, 10, 1], remaining)
+        self.assertEqual([3, 4], path)
+
+    def test_empty(self):
+        self.assertEqual(([], []), critical_path([], []))
+
+    def test_longest_first(self):
+        ran = []
+        deployers = [FakeDeployer(n, ran) for n in 'abc']
+        Scheduler(
+                deployers,
+                [set(), set(), set()],
+                'inline',
+                priorities=[1, 30, 2],
+                ).run('deploy')
+        self.assertEqual(['b', 'c', 'a'], ran)
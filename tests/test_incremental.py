@@ -0,0 +1,123 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import copy
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+from bang import resources as R, attributes as A
+from bang.deployers import add_dependents, default
+from bang.stack import Stack
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {
+                A.NAME: 'foo',
+                A.VERSION: '1.0',
+                A.DEPLOYER_CREDS: {},
+                A.SCHEDULER: {
+                    A.scheduler.EXECUTOR: 'inline',
+                    A.scheduler.JOURNAL_DIR: self.tmpdir + '/journal',
+                    A.scheduler.STATE_DIR: self.tmpdir + '/state',
+                    A.scheduler.STATUS_DIR: self.tmpdir + '/status',
+                    A.scheduler.HISTORY_FILE: '',
+                    },
+                R.SERVERS: [
+                    {
+                        A.NAME: 'db',
+                        'hostname': 'db.example.com',
+                        'groups': ['db'],
+                        'hostvars': {'port': 5432},
+                        },
+                    {
+                        A.NAME: 'web',
+                        'hostname': 'web.example.com',
+                        'groups': ['web'],
+                        'hostvars': {'port': 80},
+                        },
+                    ],
+                }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _deploy(self, config, incremental=False):
+        ran = []
+        real = default.ServerDeployer.add_to_inventory
+
+        def add_to_inventory(d):
+            ran.append(d.name)
+            real(d)
+
+        stack = Stack(copy.deepcopy(config))
+        with patch.object(
+                default.ServerDeployer,
+                'add_to_inventory',
+                add_to_inventory,
+                ):
+            stack.deploy(incremental=incremental)
+        return stack, sorted(ran)
+
+    def test_incremental(self):
+        # without any earlier state, everything is deployed
+        _, ran = self._deploy(self.config, incremental=True)
+        self.assertEqual(['db', 'web'], ran)
+
+        self.config[R.SERVERS][1]['hostvars']['port'] = 8080
+        stack, ran = self._deploy(self.config, incremental=True)
+        self.assertEqual(['web'], ran)
+
+        # unchanged resources get their inventory from the last deploy
+        hostvars = stack.groups_and_vars.dicts
+        self.assertEqual(5432, hostvars['db.example.com']['port'])
+        self.assertEqual(8080, hostvars['web.example.com']['port'])
+        self.assertEqual(
+                ['db.example.com'],
+                stack.groups_and_vars.lists['db'],
+                )
+
+        _, ran = self._deploy(self.config, incremental=True)
+        self.assertEqual([], ran)
+
+        _, ran = self._deploy(self.config)
+        self.assertEqual(['db', 'web'], ran)
+
+    def test_add_dependents(self):
+        config = {
+                R.SERVER_SECURITY_GROUPS: [{A.NAME: 'web-sg'}],
+                R.SERVERS: [
+                    {A.NAME: 'web', 'security_groups': ['web-sg']},
+                    {A.NAME: 'worker', 'security_groups': ['other-sg']},
+                    ],
+                R.LOAD_BALANCERS: [
+                    {A.NAME: 'lb', 'balance_server_name': 'web'},
+                    ],
+                }
+        self.assertEqual(
+                set([
+                    (R.SERVER_SECURITY_GROUPS, 'web-sg'),
+                    (R.SERVERS, 'web'),
+                    (R.LOAD_BALANCERS, 'lb'),
+                    ]),
+                add_dependents(
+                    config,
+                    set([(R.SERVER_SECURITY_GROUPS, 'web-sg')]),
+                    ),
+                )
@@ -0,0 +1,41 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import nose.tools as T
+
+from bang.inventory import BangsibleInventory
+
+
+def test_shared_hostvars_are_not_modified():
+    groups = {'web': ['web1', 'web2']}
+    hostvars = {
+            'web1': {'roles': {'apache': {'port': 80}}},
+            'web2': {'roles': {'apache': {'port': 8080}}},
+            }
+    first = BangsibleInventory(groups, hostvars)
+    second = BangsibleInventory(groups, hostvars)
+
+    hvars = first.get_variables('web1')
+    T.eq_(80, hvars['roles']['apache']['port'])
+    hvars['roles']['apache']['port'] = 443
+
+    # the same inventory keeps its copy, other inventories are unaffected
+    T.eq_(443, first.get_variables('web1')['roles']['apache']['port'])
+    T.eq_(80, second.get_variables('web1')['roles']['apache']['port'])
+    T.eq_(80, hostvars['web1']['roles']['apache']['port'])
+
+    # only the hosts ansible asked about were copied
+    T.eq_(['web1'], first._bang_vars_copies.keys())
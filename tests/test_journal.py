@@ -0,0 +1,138 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+from bang import BangError, resources as R
+from bang.deployers.deployer import Deployer
+from bang.journal import Journal, config_fingerprint
+from bang.scheduler import Scheduler
+
+
+class FakeStack(object):
+    def __init__(self):
+        self.hosts = []
+
+    def add_host(self, host, group_names=None, host_vars=None):
+        self.hosts.append(host)
+
+
+class FakeServerDeployer(Deployer):
+    journal_attrs = ('server_attrs',)
+
+    def __init__(self, stack, name, fail_create=False):
+        super(FakeServerDeployer, self).__init__(stack, {'name': name})
+        self.deployer_id = 'servers/%s/0' % name
+        self.fail_create = fail_create
+        self.server_attrs = None
+        self.calls = []
+        self.phases = [
+                (True, self.find_existing),
+                (lambda: not self.server_attrs, self.create),
+                (True, self.add_to_inventory),
+                ]
+
+    def find_existing(self):
+        self.calls.append('find_existing')
+
+    def create(self):
+        self.calls.append('create')
+        if self.fail_create:
+            raise BangError('create failed')
+        self.server_attrs = {'id': 'i-%s' % self.name, 'ip': '10.0.0.1'}
+
+    def add_to_inventory(self):
+        self.calls.append('add_to_inventory')
+        self.add_host(self.server_attrs['ip'], ['web'], {})
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.journal = Journal(os.path.join(self.tmpdir, 'test.journal'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _deployers(self, **kwargs):
+        stack = FakeStack()
+        ds = [
+                FakeServerDeployer(stack, 'a', **kwargs),
+                FakeServerDeployer(stack, 'b'),
+                ]
+        return stack, ds
+
+    def test_resume_completed(self):
+        _, ds = self._deployers()
+        self.journal.restore(ds)
+        ds[0].run('deploy')
+
+        stack, ds = self._deployers()
+        completed = self.journal.restore(ds)
+        self.assertEqual(set([0]), completed)
+        self.assertEqual({'id': 'i-a', 'ip': '10.0.0.1'}, ds[0].server_attrs)
+        # the restored inventory is replayed into the new stack
+        self.assertEqual(['10.0.0.1'], stack.hosts)
+
+        Scheduler(ds, [set(), set()], 'inline', completed=completed).run(
+                'deploy'
+                )
+        self.assertEqual([], ds[0].calls)
+        self.assertEqual(
+                ['find_existing', 'create', 'add_to_inventory'],
+                ds[1].calls,
+                )
+
+    def test_resume_partial(self):
+        _, ds = self._deployers(fail_create=True)
+        self.journal.restore(ds)
+        self.assertRaises(BangError, ds[0].run, 'deploy')
+
+        _, ds = self._deployers()
+        self.assertEqual(set(), self.journal.restore(ds))
+        ds[0].run('deploy')
+        # find_existing is not repeated
+        self.assertEqual(['create', 'add_to_inventory'], ds[0].calls)
+
+    def test_uncheckpointable_deployer(self):
+        stack, ds = self._deployers(fail_create=True)
+        ds[0].journal_attrs = None
+        self.journal.restore(ds)
+        self.assertRaises(BangError, ds[0].run, 'deploy')
+        self.assertEqual({}, self.journal.load())
+
+    def test_discard(self):
+        _, ds = self._deployers()
+        self.journal.restore(ds)
+        ds[0].run('deploy')
+        self.assertTrue(os.path.exists(self.journal.path))
+        self.journal.discard()
+        self.journal.discard()
+        self.assertEqual({}, self.journal.load())
+
+    def test_fingerprint(self):
+        config = {
+                'name': 'foo',
+                R.SERVERS: [{'name': 'web', 'instance_count': 2}],
+                }
+        fp = config_fingerprint(config)
+        config['deployer_credentials'] = {'aws': {'secret': 'x'}}
+        self.assertEqual(fp, config_fingerprint(config))
+        config[R.SERVERS][0]['instance_count'] = 3
+        self.assertNotEqual(fp, config_fingerprint(config))
@@ -0,0 +1,134 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+from mock import patch
+from bang import BangError, resources as R, attributes as A
+from bang.deployers import default
+from bang.stack import Stack
+
+
+class InlineProcess(object):
+    """Stands in for :class:`multiprocessing.Process`, runs on start()."""
+    def __init__(self, name, target, args):
+        self.target = target
+        self.args = args
+        self.exitcode = None
+
+    def start(self):
+        try:
+            self.target(*self.args)
+            self.exitcode = 0
+        except SystemExit as e:
+            self.exitcode = e.code
+
+    def is_alive(self):
+        return False
+
+    def join(self):
+        pass
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+
+    def _stack(self, servers):
+        config = {
+                A.NAME: 'foo',
+                A.VERSION: '1.0',
+                A.DEPLOYER_CREDS: {},
+                A.PLAYBOOKS: ['site.yml'],
+                A.SCHEDULER: {
+                    A.scheduler.EXECUTOR: 'inline',
+                    A.scheduler.JOURNAL_DIR: '',
+                    A.scheduler.STATUS_DIR: '',
+                    A.scheduler.HISTORY_FILE: '',
+                    },
+                R.SERVERS: [],
+                }
+        for name, playbooks in servers:
+            server = {
+                    A.NAME: name,
+                    'hostname': '%s.example.com' % name,
+                    'groups': [name],
+                    'hostvars': {A.SERVER_CLASS: name},
+                    }
+            if playbooks:
+                server[A.server.PLAYBOOKS] = playbooks
+            config[R.SERVERS].append(server)
+        return Stack(config)
+
+    def _deploy_and_configure(self, stack, fail=()):
+        events = self.events
+        real = default.ServerDeployer.add_to_inventory
+
+        def add_to_inventory(d):
+            events.append(('deploy', d.name))
+            real(d)
+
+        def run_playbooks(stack, hosts=None, playbooks=None):
+            events.append(('configure', hosts, playbooks))
+            if set(hosts or ()) & set(fail):
+                raise BangError('Server configuration failed!')
+
+        with patch.object(
+                default.ServerDeployer,
+                'add_to_inventory',
+                add_to_inventory,
+                ), patch.object(
+                Stack,
+                'run_playbooks',
+                run_playbooks,
+                ), patch(
+                'bang.pipeline.multiprocessing.Process',
+                InlineProcess,
+                ):
+            stack.deploy_and_configure()
+
+    def test_configure_each_class_when_deployed(self):
+        stack = self._stack([('web', None), ('db', ['db.yml'])])
+        self._deploy_and_configure(stack)
+        self.assertEqual(
+                [
+                    ('deploy', 'web'),
+                    ('configure', ['web.example.com'], ['site.yml']),
+                    ('deploy', 'db'),
+                    ('configure', ['db.example.com'], ['db.yml']),
+                    ],
+                self.events,
+                )
+        self.assertTrue(stack.have_inventory)
+
+    def test_configure_failure(self):
+        stack = self._stack([('web', None), ('db', None)])
+        with self.assertRaisesRegexp(BangError, 'failed for: web'):
+            self._deploy_and_configure(stack, fail=['web.example.com'])
+
+        # the rest of the stack was still deployed
+        self.assertTrue(('deploy', 'db') in self.events)
+
+    def test_configure_leftover_hosts(self):
+        # hosts that no server deployer added (e.g. restored by an
+        # incremental deploy) are configured at the end
+        stack = self._stack([('web', None)])
+        stack.add_host('old.example.com', ['old'], {})
+        self._deploy_and_configure(stack)
+        self.assertEqual(
+                ('configure', ['old.example.com'], None),
+                self.events[-1],
+                )
@@ -0,0 +1,105 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import socket
+import unittest
+
+from mock import patch
+from bang import BangError
+from bang.deployers.deployer import Deployer
+from bang.retry import RetryPolicy, is_transient
+
+
+class ProviderError(Exception):
+    def __init__(self, status, error_code=None):
+        super(ProviderError, self).__init__(status)
+        self.status = status
+        self.error_code = error_code
+
+
+class FlakyDeployer(Deployer):
+    def __init__(self, errors):
+        super(FlakyDeployer, self).__init__(None, {'name': 'flaky'})
+        self.errors = list(errors)
+        self.attempts = 0
+        self.phases = [(True, self.create)]
+
+    def create(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+class TestIsTransient(unittest.TestCase):
+    def test_transient(self):
+        self.assertTrue(is_transient(socket.error('connection reset')))
+        self.assertTrue(is_transient(ProviderError(503)))
+        self.assertTrue(is_transient(ProviderError(429)))
+        self.assertTrue(
+                is_transient(ProviderError(400, 'RequestLimitExceeded'))
+                )
+
+    def test_permanent(self):
+        self.assertFalse(is_transient(ProviderError(400, 'InvalidAMIID')))
+        self.assertFalse(is_transient(BangError('bad config')))
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_defaults(self):
+        policy = RetryPolicy()
+        self.assertEqual(3, policy.attempts('create'))
+        self.assertEqual([2, 4], [policy.delay('create', n) for n in (1, 2)])
+
+    def test_per_phase(self):
+        policy = RetryPolicy({
+                'attempts': 2,
+                'backoff_s': 1,
+                'create': {'attempts': 5},
+                })
+        self.assertEqual(5, policy.attempts('create'))
+        self.assertEqual(2, policy.attempts('find_existing'))
+        self.assertEqual(4, policy.delay('create', 3))
+        self.assertEqual(1, RetryPolicy({'attempts': 0}).attempts('create'))
+
+
+@patch('bang.deployers.deployer.time.sleep')
+class TestRetryPhase(unittest.TestCase):
+    def test_retry_transient(self, sleep):
+        d = FlakyDeployer([ProviderError(500), socket.error()])
+        d.deploy()
+        self.assertEqual(3, d.attempts)
+        self.assertEqual([2, 4], [c[0][0] for c in sleep.call_args_list])
+
+    def test_give_up(self, sleep):
+        d = FlakyDeployer([ProviderError(500)] * 2)
+        d.retry_policy = RetryPolicy({'attempts': 2})
+        with self.assertRaises(ProviderError):
+            d.deploy()
+        self.assertEqual(2, d.attempts)
+
+    def test_no_retry_permanent(self, sleep):
+        d = FlakyDeployer([ProviderError(400)])
+        with self.assertRaises(ProviderError):
+            d.deploy()
+        self.assertEqual(1, d.attempts)
+        self.assertFalse(sleep.called)
+
+    def test_no_retry_phases(self, sleep):
+        d = FlakyDeployer([ProviderError(500)])
+        d.no_retry_phases = ('create',)
+        with self.assertRaises(ProviderError):
+            d.deploy()
+        self.assertEqual(1, d.attempts)
@@ -1,6 +1,8 @@
 import os.path
 import yaml
+from mock import Mock, patch
 import bang.providers.rs as RS
+from bang import attributes as A
 from nose.plugins.attrib import attr
 
 
@@ -34,3 +36,40 @@ def test_normalize_input_values():
             )
     for gozinta, gozoutta in values:
         assert gozoutta == RS.normalize_input_value(gozinta)
+
+
+def _servers_consul(deployment_href):
+    cache = {}
+    def get_cached(key, func):
+        if key not in cache:
+            cache[key] = func()
+        return cache[key]
+    provider = Mock()
+    provider.creds = {
+            A.creds.API_ENDPOINT: 'https://rs.example.com',
+            A.creds.REFRESH_TOKEN: 'token',
+            }
+    provider.get_cached.side_effect = get_cached
+    with patch('bang.providers.rs.rightscale'):
+        consul = RS.Servers(provider)
+    consul.deployment = Mock(href=deployment_href)
+    consul._cloud = Mock()
+    return consul
+
+
+@patch.object(RS.Servers, 'throttle')
+def test_waiter_scoped_by_deployment(throttle):
+    consul = _servers_consul('/api/deployments/1')
+    consul.cloud.instances.index.return_value = [
+            Mock(href='/api/clouds/1/instances/abc'),
+            ]
+    found = consul.get_waiter().describe(['abc'])
+    assert ['abc'] == found.keys()
+    _, kwargs = consul.cloud.instances.index.call_args
+    filters = kwargs['params']['filter[]']
+    assert 'deployment_href==/api/deployments/1' in filters
+
+    # each deployment gets a waiter of its own
+    other = _servers_consul('/api/deployments/2')
+    other.provider = consul.provider
+    assert other.get_waiter() is not consul.get_waiter()
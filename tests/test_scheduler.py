@@ -0,0 +1,329 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+from mock import Mock, patch
+from bang import BangError
+from bang.deployers.deployer import Deployer
+from bang.executors import EXECUTORS
+from bang.scheduler import Scheduler
+
+
+class FakeDeployer(object):
+    reads_inventory = False
+    runs_inline = False
+
+    def __init__(self, name, log, fail=False):
+        self.name = name
+        self.log = log
+        self.fail = fail
+        self.results = []
+
+    def __str__(self):
+        return self.name
+
+    def run(self, action):
+        if self.fail:
+            raise BangError('%s failed' % self.name)
+        self.log.append(self.name)
+
+    def apply_results(self, results):
+        pass
+
+
+class ReportingDeployer(FakeDeployer):
+    """Reports to the parent process via its results."""
+    def run(self, action):
+        self.results.append(self.name)
+
+    def apply_results(self, results):
+        self.log.extend(results)
+
+
+class TestScheduler(unittest.TestCase):
+    def _run(self, executor, fail=()):
+        ran = []
+        deployers = [FakeDeployer(n, ran, n in fail) for n in 'abcd']
+        deps = [set(), set([0]), set([1]), set()]
+        Scheduler(deployers, deps, executor=executor).run('deploy')
+        return ran
+
+    def test_dependency_order(self):
+        for executor in ('inline', 'thread'):
+            ran = self._run(executor)
+            self.assertEqual(set('abcd'), set(ran))
+            self.assertTrue(ran.index('a') < ran.index('b') < ran.index('c'))
+
+    def test_failure_blocks_dependents(self):
+        for executor in ('inline', 'thread'):
+            try:
+                self._run(executor, fail='b')
+            except BangError as e:
+                self.assertTrue('b.' in str(e))
+                self.assertTrue('1 deployers were not started' in str(e))
+            else:
+                self.fail('Expected BangError')
+
+    def test_unknown_executor(self):
+        self.assertRaises(BangError, self._run, 'carrier-pigeon')
+
+    def test_process_executors(self):
+        # children can't report back through a plain list, so just check that
+        # successes and failures are reported correctly
+        for executor in ('process', 'pool'):
+            self._run(executor)
+            self.assertRaises(BangError, self._run, executor, 'd')
+
+    def test_results(self):
+        for executor in ('process', 'pool'):
+            ran = []
+            deployers = [ReportingDeployer(n, ran) for n in 'abc']
+            deps = [set(), set([0]), set()]
+            Scheduler(deployers, deps, executor=executor).run('deploy')
+            self.assertEqual(['a', 'b', 'c'], sorted(ran))
+
+    def test_runs_inline(self):
+        ran = []
+        deployers = [FakeDeployer(n, ran) for n in 'abc']
+        for d in deployers[1:]:
+            d.runs_inline = True
+        deps = [set(), set([0]), set([1])]
+        Scheduler(deployers, deps, executor='process').run('deploy')
+        # only the inline deployers ran in this process
+        self.assertEqual(['b', 'c'], ran)
+
+        ran[:] = []
+        deployers[2].fail = True
+        self.assertRaises(
+                BangError,
+                Scheduler(deployers[1:], [set(), set([0])]).run,
+                'deploy',
+                )
+        self.assertEqual(['b'], ran)
+
+    def test_executor_names(self):
+        self.assertEqual(
+                set(['process', 'pool', 'thread', 'inline']),
+                set(EXECUTORS),
+                )
+
+
+class SlowDeployer(FakeDeployer):
+    def run(self, action):
+        time.sleep(30)
+
+
+class NappingDeployer(FakeDeployer):
+    def run(self, action):
+        time.sleep(0.5)
+        super(NappingDeployer, self).run(action)
+
+
+class HungDeployer(Deployer):
+    """Hangs in its first phase, then adds a host in the second."""
+    def __init__(self, stack):
+        super(HungDeployer, self).__init__(stack, {'name': 'hung'})
+        self.phases = [(True, self.hang), (True, self.add)]
+
+    def hang(self):
+        time.sleep(0.5)
+
+    def add(self):
+        self.add_host('hung.example.com', ['hung'], {})
+
+
+class TestFailFast(unittest.TestCase):
+    def test_fail_fast(self):
+        for executor in ('process', 'thread'):
+            deployers = [
+                    SlowDeployer('slow', []),
+                    FakeDeployer('broken', [], fail=True),
+                    FakeDeployer('later', []),
+                    ]
+            deps = [set(), set(), set([0])]
+            start = time.time()
+            try:
+                Scheduler(
+                        deployers,
+                        deps,
+                        executor=executor,
+                        fail_fast=True,
+                        ).run('deploy')
+            except BangError as e:
+                self.assertTrue('Cut off by fail-fast: slow.' in str(e))
+                self.assertTrue('1 deployers were not started' in str(e))
+            else:
+                self.fail('Expected BangError')
+            self.assertTrue(time.time() - start < 10)
+
+
+class RacingExecutor(object):
+    """
+    Reports the deployer at index 1 as failed, while the one at index 0
+    finishes just before fail-fast cancels the rest.
+    """
+    def __init__(self, deployers, action, workers=None):
+        self.results = [[(1, 1)], [(0, 0)]]
+
+    def submit(self, i):
+        pass
+
+    def wait(self, timeout=None):
+        return self.results.pop(0) if self.results else []
+
+    def cancel(self):
+        return [2]
+
+    def shutdown(self):
+        pass
+
+
+class TestFailFastRace(unittest.TestCase):
+    def test_finished_before_cancel(self):
+        ran = []
+        deployers = [
+                FakeDeployer('quick', ran),
+                FakeDeployer('broken', ran),
+                FakeDeployer('slow', ran),
+                ]
+        scheduler = Scheduler(
+                deployers,
+                [set(), set(), set()],
+                executor='racing',
+                fail_fast=True,
+                )
+        with patch.dict(EXECUTORS, racing=RacingExecutor):
+            with self.assertRaisesRegexp(BangError, 'fail-fast: slow.'):
+                scheduler.run('deploy')
+        self.assertEqual(set([0]), scheduler.done)
+        self.assertEqual([1], scheduler.failed)
+
+
+class TestWatchdog(unittest.TestCase):
+    def _run(self, executor, deployers, deps, **kwargs):
+        start = time.time()
+        try:
+            Scheduler(deployers, deps, executor=executor, **kwargs).run(
+                    'deploy'
+                    )
+        except BangError as e:
+            self.assertTrue(time.time() - start < 10)
+            return str(e)
+        self.fail('Expected BangError')
+
+    def test_deployer_timeout(self):
+        for executor in ('process', 'pool', 'thread'):
+            ran = []
+            deployers = [
+                    SlowDeployer('slow', ran),
+                    FakeDeployer('fast', ran),
+                    FakeDeployer('later', ran),
+                    ]
+            deployers[0].current_phase = 'create'
+            deps = [set(), set(), set([0])]
+            msg = self._run(
+                    executor,
+                    deployers,
+                    deps,
+                    deployer_timeout_s=0.5,
+                    )
+            self.assertTrue('Ran out of time: slow.' in msg)
+            self.assertTrue('1 deployers were not started' in msg)
+
+    def test_deadline_already_passed(self):
+        # the watchdog asks for a zero wait once a deadline has gone by
+        for executor in ('process', 'pool', 'thread'):
+            e = EXECUTORS[executor]([SlowDeployer('stuck', [])], 'deploy')
+            e.submit(0)
+            start = time.time()
+            self.assertEqual([], e.wait(0))
+            self.assertTrue(time.time() - start < 1)
+            with patch('bang.executors.log'):
+                e.expire([0])
+            e.shutdown()
+
+    def test_expired_thread_stops(self):
+        stack = Mock()
+        e = EXECUTORS['thread']([HungDeployer(stack)], 'deploy')
+        e.submit(0)
+        time.sleep(0.1)
+        with patch('bang.executors.log'):
+            e.expire([0])
+
+        # the abandoned thread runs no further phases, and its late result
+        # isn't reported
+        self.assertEqual([], e.wait(1))
+        self.assertFalse(stack.add_host.called)
+        e.shutdown()
+
+    def test_per_deployer_timeout(self):
+        deployers = [SlowDeployer('slow', []), SlowDeployer('patient', [])]
+        deployers[0].deployer_timeout_s = 0.5
+        deployers[1].deployer_timeout_s = 1
+        msg = self._run('thread', deployers, [set(), set()])
+        self.assertTrue('Ran out of time: slow, patient.' in msg)
+
+    def test_stage_timeout(self):
+        deployers = [
+                SlowDeployer('slow', []),
+                FakeDeployer('quick', []),
+                FakeDeployer('next stage', []),
+                ]
+        deployers[0].res_type = deployers[1].res_type = 'servers'
+        deployers[2].res_type = 'load_balancers'
+        msg = self._run(
+                'process',
+                deployers,
+                [set(), set([0]), set()],
+                stage_timeout_s=0.5,
+                )
+        self.assertTrue('Ran out of time: slow.' in msg)
+        self.assertTrue('1 deployers were not started' in msg)
+
+    def test_stage_timeout_not_started(self):
+        # the servers stage runs out of time while one of its deployers is
+        # still waiting on another stage, though nothing failed
+        for executor in ('thread', 'process'):
+            ran = []
+            deployers = [
+                    FakeDeployer('quick', ran),
+                    NappingDeployer('sg', ran),
+                    NappingDeployer('rules', ran),
+                    FakeDeployer('web', ran),
+                    ]
+            deployers[0].res_type = deployers[3].res_type = 'servers'
+            deployers[1].res_type = 'server_security_groups'
+            deployers[2].res_type = 'server_security_group_rules'
+            msg = self._run(
+                    executor,
+                    deployers,
+                    [set(), set(), set([1]), set([2])],
+                    stage_timeout_s=0.8,
+                    )
+            self.assertTrue('1 deployers were not started: web.' in msg)
+            self.assertFalse('failed' in msg)
+            self.assertFalse('web' in ran)
+
+    def test_logs_stack(self):
+        deployers = [SlowDeployer('slow', [])]
+        deployers[0].current_phase = 'create'
+        with patch('bang.executors.log') as log:
+            self._run('thread', deployers, [set()], deployer_timeout_s=0.5)
+        msg = log.error.call_args_list[0][0][0]
+        self.assertTrue(msg.startswith('slow ran out of time in phase create'))
+        self.assertTrue('time.sleep(30)' in msg)
@@ -0,0 +1,216 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+from bang import BangError, resources as R, attributes as A
+from bang.config import Config
+from bang.deployers import default
+from bang.providers import get_provider
+from bang.stack import Stack, deploy_stacks
+
+
+class TestDeployStacks(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.manager = multiprocessing.Manager()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        self.manager.shutdown()
+
+    def _stack(self, name, servers, executor='inline'):
+        config = {
+                A.NAME: name,
+                A.VERSION: '1.0',
+                A.DEPLOYER_CREDS: {},
+                A.SCHEDULER: {
+                    A.scheduler.EXECUTOR: executor,
+                    A.scheduler.JOURNAL_DIR: self.tmpdir + '/journal',
+                    A.scheduler.STATE_DIR: self.tmpdir + '/state',
+                    A.scheduler.STATUS_DIR: self.tmpdir + '/status',
+                    A.scheduler.HISTORY_FILE: '',
+                    },
+                R.SERVERS: [
+                    {
+                        A.NAME: s,
+                        'hostname': '%s.%s.example.com' % (s, name),
+                        'groups': [s],
+                        'hostvars': {},
+                        }
+                    for s in servers
+                    ],
+                }
+        return Stack(config, self.manager)
+
+    def _deploy(self, stacks, fail=()):
+        real = default.ServerDeployer.add_to_inventory
+
+        def add_to_inventory(d):
+            if d.name in fail:
+                raise Exception('boom')
+            real(d)
+
+        with patch.object(
+                default.ServerDeployer,
+                'add_to_inventory',
+                add_to_inventory,
+                ):
+            deploy_stacks(stacks)
+
+    def test_deploy_stacks(self):
+        foo = self._stack('foo', ['web', 'db'])
+        bar = self._stack('bar', ['web'])
+        self._deploy([foo, bar])
+
+        self.assertEqual(
+                ['web.foo.example.com'],
+                foo.groups_and_vars.lists['web'],
+                )
+        self.assertEqual(
+                ['web.bar.example.com'],
+                bar.groups_and_vars.lists['web'],
+                )
+        self.assertTrue(foo.have_inventory)
+        self.assertTrue(bar.get_deploy_state().exists())
+
+    def test_child_process_results(self):
+        # inventory added in the deployer processes ends up in the parent
+        for executor in ('process', 'pool'):
+            foo = self._stack('foo', ['web', 'db'], executor)
+            with patch.object(default.ServerDeployer, 'runs_inline', False):
+                self._deploy([foo])
+            self.assertEqual(
+                    ['db.foo.example.com'],
+                    foo.groups_and_vars.lists['db'],
+                    )
+            self.assertTrue('web.foo.example.com' in foo.groups_and_vars.dicts)
+
+    def test_status(self):
+        foo = self._stack('foo', ['web'])
+        self._deploy([foo])
+        updates = []
+        with open(foo.get_status_file().path) as f:
+            for line in f:
+                u = json.loads(line)
+                updates.append((u['deployer'], u['state'], u['phase']))
+        self.assertEqual(
+                [
+                    ('servers/web/0', 'queued', None),
+                    ('servers/web/0', 'running', 'add_to_inventory'),
+                    ('servers/web/0', 'done', 'add_to_inventory'),
+                    ],
+                updates,
+                )
+
+    def test_shared_history(self):
+        history_file = self.tmpdir + '/durations.json'
+        stacks = [self._stack(name, ['web']) for name in ('foo', 'bar')]
+        for stack in stacks:
+            stack.config[A.SCHEDULER][A.scheduler.HISTORY_FILE] = history_file
+        self._deploy(stacks)
+
+        # neither stack's durations overwrote the other's
+        with open(history_file) as f:
+            durations = json.load(f)
+        self.assertEqual(2, durations['ServerDeployer']['count'])
+
+    def test_failed_stack(self):
+        foo = self._stack('foo', ['web'])
+        bar = self._stack('bar', ['broken'])
+        with self.assertRaisesRegexp(BangError, '1 of 2 stacks.*: bar'):
+            self._deploy([foo, bar], fail=['broken'])
+
+        # the stack that succeeded is done with its journal
+        self.assertTrue(foo.get_deploy_state().exists())
+        self.assertFalse(os.path.exists(foo.get_journal().path))
+        self.assertFalse(bar.get_deploy_state().exists())
+        self.assertFalse(bar.have_inventory)
+
+
+class FakePlayBook(object):
+    #: The hosts that each playbook processes, by playbook filename.
+    processed = {}
+
+    def __init__(self, playbook, stats, **kwargs):
+        self.playbook = playbook
+        self.stats = stats
+
+    def run(self):
+        for h in self.processed[os.path.basename(self.playbook)]:
+            self.stats.processed[h] = 1
+
+
+class TestRunPlaybooks(unittest.TestCase):
+    @patch('bang.stack.BangsibleInventory')
+    @patch('bang.stack.PlayBook', FakePlayBook)
+    def test_host_filter_kept(self, inventory):
+        stack = Stack(Config({
+                A.NAME: 'foo',
+                A.VERSION: '1.0',
+                A.DEPLOYER_CREDS: {},
+                A.SCHEDULER: {A.scheduler.HISTORY_FILE: ''},
+                }))
+        FakePlayBook.processed = {'web.yml': ['web1'], 'db.yml': ['db1']}
+        stack.run_playbooks(playbooks=['web.yml', 'db.yml'])
+        self.assertFalse(inventory.return_value.subset.called)
+
+        # an explicit host filter applies to every playbook
+        inventory.reset_mock()
+        stack.run_playbooks(['web1', 'db1'], ['web.yml', 'db.yml'])
+        self.assertEqual(
+                [(('web1:db1',), {})] * 2,
+                inventory.return_value.subset.call_args_list,
+                )
+
+
+class TestLazyManager(unittest.TestCase):
+    def test_no_manager_for_static_inventory(self):
+        stack = Stack({
+                A.NAME: 'foo',
+                A.VERSION: '1.0',
+                A.DEPLOYER_CREDS: {},
+                A.SCHEDULER: {A.scheduler.HISTORY_FILE: ''},
+                R.SERVERS: [{
+                    A.NAME: 'web',
+                    'hostname': 'web.example.com',
+                    'groups': ['web'],
+                    'hostvars': {},
+                    }],
+                })
+        stack.gather_inventory()
+        self.assertEqual(
+                ['web.example.com'],
+                stack.groups_and_vars.lists['web'],
+                )
+        self.assertEqual(None, stack._manager)
+
+
+class TestSharedProviders(unittest.TestCase):
+    def test_get_provider(self):
+        creds = {'access_key_id': 'a', 'secret_access_key': 'b'}
+        p = get_provider('aws', creds)
+        self.assertIs(p, get_provider('aws', dict(creds)))
+        self.assertIsNot(
+                p,
+                get_provider('aws', dict(creds, access_key_id='c')),
+                )
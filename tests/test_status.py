@@ -0,0 +1,77 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+from bang import status
+from bang.deployers.deployer import Deployer
+from bang.util import poll_with_timeout
+
+
+class TestStatusFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.status = status.StatusFile(
+                os.path.join(self.tmpdir, 'status', 'foo-1.0.status')
+                )
+        self.status.reset()
+        self.web = Deployer(None, {'name': 'web'})
+        self.web.deployer_id = 'servers/web/0'
+        self.web.res_type = 'servers'
+        self.web.status = self.status
+        self.db = Deployer(None, {'name': 'db'})
+        self.db.deployer_id = 'databases/db/0'
+        self.db.res_type = 'databases'
+        self.db.status = self.status
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_latest_state(self):
+        self.web.publish_status(status.QUEUED)
+        self.db.publish_status(status.QUEUED)
+        self.web.current_phase = 'create'
+        self.web.publish_status(status.RUNNING)
+        updates = self.status.load()
+        self.assertEqual(
+                [('servers/web/0', 'running'), ('databases/db/0', 'queued')],
+                [(u['deployer'], u['state']) for u in updates],
+                )
+
+        lines = status.format_status(updates, updates[0]['ts'] + 42)
+        self.assertTrue(lines[0].startswith('servers/web/0'))
+        self.assertTrue('running create' in lines[0])
+        self.assertTrue(lines[0].endswith(' 42s'))
+
+        # a new deploy starts afresh
+        self.status.reset()
+        self.assertEqual([], self.status.load())
+
+    def test_polling(self):
+        self.web.current_phase = 'wait_for_running'
+        status.set_current(self.web)
+        try:
+            poll_with_timeout(1, lambda: None, 0.01)
+        finally:
+            status.set_current(None)
+        poll_with_timeout(1, lambda: None, 0.01)
+        self.assertEqual(
+                [('polling', 'wait_for_running')],
+                [(u['state'], u['phase']) for u in self.status.load()],
+                )
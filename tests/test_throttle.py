@@ -0,0 +1,81 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import time
+import unittest
+
+import bang.throttle as TH
+
+
+class FakeDeployer(object):
+    def __init__(self, provider=None, region_name=None):
+        if provider:
+            self.provider = provider
+        if region_name:
+            self.region_name = region_name
+
+
+class TestConcurrencyLimits(unittest.TestCase):
+    def test_global(self):
+        limits = TH.ConcurrencyLimits(2)
+        a, b, c = FakeDeployer(), FakeDeployer('aws'), FakeDeployer()
+        self.assertTrue(limits.acquire(a))
+        self.assertTrue(limits.acquire(b))
+        self.assertFalse(limits.acquire(c))
+        limits.release(a)
+        self.assertTrue(limits.acquire(c))
+
+    def test_provider_and_region(self):
+        limits = TH.ConcurrencyLimits(None, {
+            'aws': {
+                'max_parallel': 3,
+                'regions': {'us-east-1': {'max_parallel': 1}},
+                },
+            })
+        east = [FakeDeployer('aws', 'us-east-1') for _ in range(2)]
+        west = [FakeDeployer('aws', 'us-west-2') for _ in range(3)]
+        static = FakeDeployer()
+        self.assertTrue(limits.acquire(east[0]))
+        self.assertFalse(limits.acquire(east[1]))
+        self.assertTrue(limits.acquire(west[0]))
+        self.assertTrue(limits.acquire(west[1]))
+        self.assertFalse(limits.acquire(west[2]))
+        self.assertTrue(limits.acquire(static))
+        limits.release(east[0])
+        self.assertTrue(limits.acquire(east[1]))
+
+
+class TestRateLimits(unittest.TestCase):
+    def tearDown(self):
+        TH.configure_rate_limits(None)
+
+    def test_throttle(self):
+        TH.configure_rate_limits({
+            'aws': {
+                'requests_per_s': 1000,
+                'regions': {'us-east-1': {'requests_per_s': 20}},
+                },
+            })
+        start = time.time()
+        for _ in range(5):
+            TH.throttle('aws', 'us-east-1')
+        # 5 requests at 20/s need at least 4 intervals of 0.05 s
+        self.assertTrue(time.time() - start >= 0.19)
+
+        start = time.time()
+        for _ in range(5):
+            TH.throttle('rightscale', 'us-east-1')
+        self.assertTrue(time.time() - start < 0.05)
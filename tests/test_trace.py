@@ -0,0 +1,101 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from bang import trace
+from bang.deployers.deployer import Deployer
+from bang.scheduler import Scheduler
+
+
+class FakeDeployer(Deployer):
+    res_type = 'servers'
+
+    def __init__(self, name):
+        super(FakeDeployer, self).__init__(None, {'name': name})
+        self.phases = [
+                (True, self.find_existing),
+                (False, self.create),
+                ]
+
+    def find_existing(self):
+        pass
+
+    def create(self):
+        pass
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'trace.json')
+
+    def tearDown(self):
+        trace.stop_tracing()
+        shutil.rmtree(self.tmpdir)
+
+    def _events(self):
+        with open(self.path) as f:
+            return json.load(f)['traceEvents']
+
+    def test_not_tracing(self):
+        with trace.span('foo', 'bar'):
+            pass
+        trace.complete('foo', 'bar', 0, 1)
+        trace.stop_tracing()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_deployer_spans(self):
+        trace.start_tracing(self.path)
+        deployers = [FakeDeployer('web'), FakeDeployer('db')]
+        for executor in ('thread', 'process'):
+            Scheduler(deployers, [set(), set([0])], executor).run('deploy')
+        trace.stop_tracing()
+
+        events = self._events()
+        self.assertFalse(os.path.exists(self.path + '.events'))
+        spans = [e for e in events if e['ph'] in 'BE']
+        phases = [e for e in spans if e['cat'] == 'phase']
+        # the skipped create phase is not traced
+        self.assertEqual(
+                set(['find_existing']),
+                set(e['name'] for e in phases),
+                )
+        self.assertEqual(8, len(phases))
+        begins = [e for e in spans if e['cat'] == 'deployer' and e['ph'] == 'B']
+        self.assertEqual(4, len(begins))
+        self.assertEqual('servers', begins[0]['args']['res_type'])
+        self.assertEqual('web', begins[0]['args']['resource'])
+        # every process is named
+        pids = set(e['pid'] for e in spans)
+        named = set(e['pid'] for e in events if e['name'] == 'process_name')
+        self.assertTrue(pids <= named)
+
+    def test_complete_track(self):
+        trace.start_tracing(self.path)
+        trace.complete('stage 0', 'stage', 1.0, 2.5, track='stages')
+        trace.complete('stage 1', 'stage', 2.0, 3.0, track='stages')
+        trace.stop_tracing()
+        events = self._events()
+        stages = [e for e in events if e.get('cat') == 'stage']
+        self.assertEqual([1500000, 1000000], [e['dur'] for e in stages])
+        self.assertEqual(1, len(set(e['tid'] for e in stages)))
+        names = [e for e in events if e['name'] == 'thread_name']
+        self.assertEqual('stages', names[0]['args']['name'])
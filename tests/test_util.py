@@ -14,6 +14,13 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import collections
+import hashlib
+import logging
+import sys
+import zlib
+
+from mock import patch
 import bang.util as U
 import nose.tools as T
 
@@ -86,3 +93,161 @@ def test_deep_merge_dicts():
             }
     U.deep_merge_dicts(a, b)
     T.eq_(exp, a)
+
+
+def test_inventory_snapshot():
+    inv = U.InventoryMap()
+    inv.append('web', 'web1')
+    inv.merge('web1', {'a': {'b': 1}})
+    lists, dicts = inv.snapshot()
+    T.eq_({'web': ['web1']}, lists)
+    T.eq_({'web1': {'a': {'b': 1}}}, dicts)
+
+    # shared until the inventory changes
+    T.assert_is(dicts, inv.snapshot()[1])
+    inv.append('web', 'web2')
+    lists2, dicts2 = inv.snapshot()
+    T.eq_(['web1', 'web2'], lists2['web'])
+    T.eq_(['web1'], lists['web'])
+
+    # the snapshot is a copy
+    inv.merge('web1', {'a': {'b': 2}})
+    T.eq_(1, dicts2['web1']['a']['b'])
+
+
+def test_backoff_delays():
+    delays = U.Backoff(1, max_s=5, jitter=0).delays()
+    T.eq_([1, 2, 4, 5, 5], [next(delays) for _ in range(5)])
+
+    # jitter only ever shortens a delay
+    delays = U.Backoff(4, factor=1, jitter=0.5).delays()
+    for _ in range(20):
+        T.assert_true(2 <= next(delays) <= 4)
+
+
+def test_poll_with_timeout():
+    slept = []
+    results = iter([None, None, 'done'])
+    with patch('bang.util.time.sleep', slept.append):
+        T.eq_('done', U.poll_with_timeout(
+                60,
+                lambda: next(results),
+                U.Backoff(1, jitter=0),
+                ))
+    T.eq_([1, 2], slept)
+
+    # the last sleep is cut short at the deadline
+    slept = []
+    with patch('bang.util.time.sleep', slept.append):
+        T.eq_(None, U.poll_with_timeout(10, lambda: None, 4))
+    T.eq_([4, 4, 2], slept)
+
+
+def test_deep_merged():
+    base = {'a': 1, 'd': {'d1': 'one', 'd2': {'x': 1}}, 'e': {'e1': 'one'}}
+    incoming = {'b': {'b1': 'two'}, 'd': {'d1': 'uno'}}
+    merged = U.deep_merged(base, incoming)
+    T.eq_(
+            {
+                'a': 1,
+                'b': {'b1': 'two'},
+                'd': {'d1': 'uno', 'd2': {'x': 1}},
+                'e': {'e1': 'one'},
+                },
+            merged,
+            )
+
+    # the inputs are untouched...
+    T.eq_('one', base['d']['d1'])
+    T.eq_({'b': {'b1': 'two'}, 'd': {'d1': 'uno'}}, incoming)
+
+    # ... and the unchanged subtrees are shared
+    T.assert_is(base['e'], merged['e'])
+    T.assert_is(base['d']['d2'], merged['d']['d2'])
+    T.assert_is(incoming['b'], merged['b'])
+
+
+class ReadOnlyMap(collections.Mapping):
+    def __init__(self, d):
+        self.d = d
+
+    def __getitem__(self, k):
+        return self.d[k]
+
+    def __iter__(self):
+        return iter(self.d)
+
+    def __len__(self):
+        return len(self.d)
+
+
+def test_deep_merged_read_only():
+    # like deep_merge_dicts, only mutable mappings are merged, anything else
+    # replaces the value it lands on
+    ro = ReadOnlyMap({'x': 1})
+    merged = U.deep_merged({'a': {'y': 2}}, {'a': ro})
+    T.assert_is(ro, merged['a'])
+    merged = U.deep_merged({'a': ro}, {'a': {'y': 2}})
+    T.eq_({'y': 2}, merged['a'])
+
+    b = {'a': {'y': 2}}
+    U.deep_merge_dicts(b, {'a': ro})
+    T.assert_is(ro, b['a'])
+
+
+def test_deep_merge_deeply_nested():
+    depth = sys.getrecursionlimit() * 2
+    a = b = {}
+    for _ in range(depth):
+        a['n'] = {}
+        a = a['n']
+    a['leaf'] = 1
+    merged = U.deep_merged(b, b)
+    U.deep_merge_dicts(b, merged)
+    for _ in range(depth):
+        merged = merged['n']
+    T.eq_({'leaf': 1}, merged)
+
+
+def test_s3_handler():
+    parts = []
+
+    def upload_part_from_file(fp, part_num):
+        parts.append((part_num, fp.read()))
+
+    with patch('bang.util.boto.connect_s3') as connect_s3:
+        bucket = connect_s3.return_value.get_bucket.return_value
+        upload = bucket.initiate_multipart_upload.return_value
+        upload.upload_part_from_file.side_effect = upload_part_from_file
+
+        handler = U.S3Handler('logs', 'bang')
+        handler.part_size = 100
+        handler.setFormatter(logging.Formatter('%(message)s\n'))
+        # enough hard-to-compress events for zlib to emit several parts
+        lines = [
+                'event %d %s' % (n, hashlib.md5(str(n)).hexdigest())
+                for n in range(2000)
+                ]
+        logger = logging.getLogger('test_s3_handler')
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            for line in lines:
+                logger.warn(line)
+        finally:
+            logger.removeHandler(handler)
+        handler.close()
+
+    # one upload, in several parts that add up to a single gzip file
+    T.eq_(1, bucket.initiate_multipart_upload.call_count)
+    key_name, = bucket.initiate_multipart_upload.call_args[0]
+    T.assert_true(key_name.startswith('bang/bang-'))
+    T.assert_true(len(parts) > 1)
+    T.eq_(range(1, len(parts) + 1), [n for n, _ in parts])
+    gz = ''.join(data for _, data in parts)
+    T.eq_(lines, zlib.decompress(gz, 16 + zlib.MAX_WBITS).splitlines())
+    T.assert_true(upload.complete_upload.called)
+
+    # closing again at shutdown is harmless
+    handler.close()
+    T.eq_(1, upload.complete_upload.call_count)
@@ -0,0 +1,96 @@
+# Copyright 2015 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import socket
+import threading
+import unittest
+
+from bang import BangError
+from bang.util import Backoff
+from bang.waiter import Waiter
+
+
+class FakeProvider(object):
+    """Resources become ready after a given number of describe calls."""
+    def __init__(self, ready_after, errors=()):
+        self.ready_after = ready_after
+        self.errors = list(errors)
+        self.calls = []
+
+    def describe(self, keys):
+        self.calls.append(keys)
+        if self.errors:
+            raise self.errors.pop(0)
+        return dict(
+                (k, len(self.calls) >= self.ready_after[k])
+                for k in keys
+                if k in self.ready_after
+                )
+
+
+class TestWaiter(unittest.TestCase):
+    def setUp(self):
+        self.waiters = []
+
+    def tearDown(self):
+        for w in self.waiters:
+            thread = w.thread
+            if thread:
+                thread.join()
+
+    def _waiter(self, provider):
+        w = Waiter(provider.describe, Backoff(0.05, factor=1, jitter=0))
+        self.waiters.append(w)
+        return w
+
+    def test_batched(self):
+        provider = FakeProvider({'a': 2, 'b': 2, 'c': 3})
+        waiter = self._waiter(provider)
+        results = {}
+
+        def wait(keys):
+            results[keys] = waiter.wait(list(keys), 5, bool)
+
+        threads = [
+                threading.Thread(target=wait, args=(keys,))
+                for keys in (('a',), ('b', 'c'))
+                ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([True], results[('a',)])
+        self.assertEqual([True, True], results[('b', 'c')])
+
+        # one request per round for all of the pending resources
+        self.assertEqual(['a', 'b', 'c'], provider.calls[0])
+        self.assertEqual(['c'], provider.calls[-1])
+        self.assertEqual(3, len(provider.calls))
+
+    def test_timeout(self):
+        waiter = self._waiter(FakeProvider({'a': 100}))
+        self.assertEqual(None, waiter.wait(['a'], 0.2, bool))
+        self.assertEqual([], waiter.registrations)
+
+    def test_errors(self):
+        # transient errors are polled through
+        provider = FakeProvider({'a': 1}, [socket.error('reset')])
+        self.assertEqual([True], self._waiter(provider).wait(['a'], 5, bool))
+
+        provider = FakeProvider({'a': 1}, [BangError('denied')])
+        with self.assertRaisesRegexp(BangError, 'denied'):
+            self._waiter(provider).wait(['a'], 5, bool)